@@ -0,0 +1,197 @@
+#!/usr/env python3
+"""
+基准测试用例
+-----------
+- 每个用例接收规模参数 scale，返回 (操作次数, 被计时的无参函数)
+- 被计时函数若返回整数，则以其作为实际的操作次数（比如作业实际处理的索引数）
+- 被计时函数之外的准备工作不计入耗时
+"""
+from typing import Callable, Dict, Tuple
+
+from src.fetcher import IndexFetcher
+from src.flag import JobStepFlag
+from src.job import Handlers, IndexJob
+from src.monitor import IndexFetcherMonitor
+from src.span import WorkSpan
+
+from .density import PATTERNS, busy_wait, noop_handler
+
+_case_type = Callable[[int], Tuple[int, Callable[[], None]]]
+
+CASES: Dict[str, _case_type] = {}
+
+
+def case(name: str):
+    def decorator(func: _case_type):
+        CASES[name] = func
+        return func
+
+    return decorator
+
+
+def _index_job_run(pattern: str):
+    def prepare(scale: int):
+        size = 20000 * scale
+        valid = PATTERNS[pattern](size)
+        job = IndexJob(0, size - 1, 1)
+        job.handlers.add(noop_handler(valid))
+        handled = []
+        job.emitter.on("IndexJob.handling", lambda sender: handled.append(None))
+
+        def run():
+            job.run()
+            return len(handled)
+
+        return size, run
+
+    return prepare
+
+
+def _index_job_probe_run(pattern: str, batch_size: int = 100):
+    def prepare(scale: int):
+        size = 20000 * scale
+        valid = PATTERNS[pattern](size)
+        job = IndexJob(0, size - 1, 1)
+        job.handlers.add(lambda indexes: [valid[i] for i in indexes], kind="probe", batch_size=batch_size)
+        handled = []
+        job.emitter.on("IndexJob.handling", lambda sender: handled.append(None))
+
+        def run():
+            job.run()
+            return len(handled)
+
+        return size, run
+
+    return prepare
+
+
+# 模拟真实请求的开销：每次调用处理器（无论探测多少个索引）都有固定开销，探测时每个索引另有少量开销
+_CALL_COST = 100e-6
+_INDEX_COST = 2e-6
+
+
+def _index_job_costly_run(pattern: str, probe: bool):
+    def prepare(scale: int):
+        size = 2000 * scale
+        valid = PATTERNS[pattern](size)
+        job = IndexJob(0, size - 1, 1)
+        if probe:
+            def handler(indexes):
+                busy_wait(_CALL_COST + _INDEX_COST * len(indexes))
+                return [valid[i] for i in indexes]
+
+            job.handlers.add(handler, kind="probe", batch_size=100)
+        else:
+            check = noop_handler(valid)
+
+            def handler(i):
+                busy_wait(_CALL_COST + _INDEX_COST)
+                check(i)
+
+            job.handlers.add(handler)
+        handled = []
+        job.emitter.on("IndexJob.handling", lambda sender: handled.append(None))
+
+        def run():
+            job.run()
+            return len(handled)
+
+        return size, run
+
+    return prepare
+
+
+for _pattern in PATTERNS:
+    case(f"IndexJob.run[{_pattern}]")(_index_job_run(_pattern))
+    case(f"IndexJob.run[{_pattern}, probe]")(_index_job_probe_run(_pattern))
+    case(f"IndexJob.run[{_pattern}, 100us/call]")(_index_job_costly_run(_pattern, False))
+    case(f"IndexJob.run[{_pattern}, probe, 100us/call]")(_index_job_costly_run(_pattern, True))
+
+
+@case("Flag.set/unset")
+def flag_set_unset(scale: int):
+    n = 20000 * scale
+    flag = JobStepFlag(JobStepFlag.running)
+
+    def run():
+        for _ in range(n):
+            flag.set(JobStepFlag.stepping)
+            flag.unset(JobStepFlag.stepping)
+            flag.set(JobStepFlag.leaping)
+            flag.unset(JobStepFlag.leaping)
+
+    return n * 4, run
+
+
+@case("WorkSpan._update_worked_span")
+def work_span_update(scale: int):
+    n = 100000 * scale
+    span = WorkSpan(0, n - 1, 1)
+
+    def run():
+        for i in range(n):
+            span._update_worked_span(i)
+
+    return n, run
+
+
+@case("Handlers dispatch[4 handlers]")
+def handlers_dispatch(scale: int):
+    n = 50000 * scale
+    job = IndexJob(0, n - 1, 1)
+    job.handlers.add(lambda i: None)
+    job.handlers.add(lambda i, sender: None)
+    job.handlers.add(lambda i: None)
+    job.handlers.add(lambda i, sender: None)
+
+    def run():
+        for i in range(n):
+            job._handle(i)
+
+    return n * 4, run
+
+
+@case("Handlers copy")
+def handlers_copy(scale: int):
+    n = 10000 * scale
+    handlers = Handlers()
+    for _ in range(4):
+        handlers.add(lambda i: None)
+
+    def run():
+        for _ in range(n):
+            Handlers(handlers)
+
+    return n, run
+
+
+@case("IndexFetcher.job_iter[10^6 indexes, 64 weights]")
+def fetcher_job_iter(scale: int):
+    fetcher = IndexFetcher(0, 10 ** 6 - 1, 1, thread_weights=[1] * 64)
+
+    def run():
+        for _ in range(scale):
+            list(fetcher.job_iter())
+
+    return scale * 64, run
+
+
+@case("IndexFetcherMonitor._tick[4096 jobs]")
+def monitor_tick(scale: int):
+    fetcher = IndexFetcher(0, 4096 * 1000 - 1, 1, thread_weights=[1] * 4096)
+    # 直接按区间构造作业，避免准备阶段受 job_iter 本身开销的影响
+    fetcher._jobs.extend(fetcher._job_factory(k * 1000, k * 1000 + 999) for k in range(4096))
+    for job in fetcher._jobs:
+        job._flag -= JobStepFlag.pending
+        job._flag += JobStepFlag.running
+    monitor = IndexFetcherMonitor(fetcher)
+    # 第一次 tick 会注册所有作业，不计入耗时
+    monitor._tick()
+    n = 10 * scale
+
+    def run():
+        for _ in range(n):
+            monitor._tick()
+            monitor.processed, monitor.average_speed, monitor.remaining_time
+
+    return n, run
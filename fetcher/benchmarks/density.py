@@ -0,0 +1,49 @@
+#!/usr/env python3
+import random
+import time
+from typing import Callable, Dict
+
+from src.exceptions import ExplicitlySkipHandlingError
+
+
+def uniform(size: int, density: float, seed: int = 0) -> bytearray:
+    """每个索引以 density 的概率有效"""
+    rnd = random.Random(seed)
+    return bytearray(rnd.random() < density for _ in range(size))
+
+
+def clustered(size: int, density: float, cluster_size: int = 1000, seed: int = 0) -> bytearray:
+    """有效索引成簇出现，簇内密度较高、簇间几乎为空，整体密度约为 density"""
+    rnd = random.Random(seed)
+    result = bytearray(size)
+    cluster_count = max(1, int(size * density / cluster_size))
+    for _ in range(cluster_count):
+        begin = rnd.randrange(0, max(1, size - cluster_size))
+        for i in range(begin, min(size, begin + cluster_size)):
+            result[i] = rnd.random() < 0.9
+    return result
+
+
+PATTERNS: Dict[str, Callable[[int], bytearray]] = {
+    "dense": lambda size: bytearray(b"\x01" * size),
+    "uniform-50%": lambda size: uniform(size, 0.5),
+    "uniform-5%": lambda size: uniform(size, 0.05),
+    "clustered-5%": lambda size: clustered(size, 0.05),
+}
+
+
+def busy_wait(seconds: float):
+    """忙等待，模拟一次请求的固定开销，比 sleep 更稳定"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def noop_handler(valid: bytearray, begin: int = 0) -> Callable[[int], None]:
+    """按照密度表判断索引是否有效的空处理器"""
+
+    def handler(i):
+        if not valid[i - begin]:
+            raise ExplicitlySkipHandlingError(i)
+
+    return handler
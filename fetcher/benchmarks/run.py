@@ -0,0 +1,104 @@
+#!/usr/env python3
+"""
+运行基准测试并将结果保存为 JSON
+------------------------------
+在 fetcher 目录下执行：
+
+    python -m benchmarks.run -o bench.json
+    python -m benchmarks.run -o new.json --compare bench.json
+"""
+import argparse
+import fnmatch
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from .cases import CASES
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(name: str, scale: int = 1, repeat: int = 3) -> Dict[str, float]:
+    """多次运行同一用例，取最快的一次作为结果"""
+    best = None
+    operations = 0
+    for _ in range(repeat):
+        operations, func = CASES[name](scale)
+        gc.collect()
+        begin = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - begin
+        if isinstance(result, int):
+            operations = result
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "operations": operations,
+        "seconds": best,
+        "opsPerSecond": operations / best if best else float("inf"),
+        "nsPerOp": best / operations * 1e9 if operations else 0,
+    }
+
+
+def run(pattern: str = "*", scale: int = 1, repeat: int = 3) -> dict:
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": datetime.now().isoformat(),
+            "scale": scale,
+            "repeat": repeat,
+        },
+        "results": {
+            name: run_case(name, scale, repeat) for name in CASES if fnmatch.fnmatch(name, pattern)
+        }
+    }
+
+
+def compare(current: dict, baseline: dict) -> str:
+    lines = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            lines.append(f"{name:<50} {result['nsPerOp']:>12.1f} ns/op  (new)")
+            continue
+        ratio = result["nsPerOp"] / base["nsPerOp"] if base["nsPerOp"] else float("inf")
+        lines.append(f"{name:<50} {result['nsPerOp']:>12.1f} ns/op  x{ratio:.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fetcher microbenchmarks.")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("-k", "--pattern", default="*", help="only run cases whose name matches this glob")
+    parser.add_argument("-s", "--scale", type=int, default=1, help="workload multiplier")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per case, the fastest one is kept")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    args = parser.parse_args(argv)
+
+    result = run(args.pattern, args.scale, args.repeat)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fp:
+            print(compare(result, json.load(fp)))
+    else:
+        for name, case_result in result["results"].items():
+            print(f"{name:<50} {case_result['nsPerOp']:>12.1f} ns/op")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+#!/usr/env python3
@@ -0,0 +1,229 @@
+#!/usr/env python3
+"""
+NeteaseCloudMusicApi 的本地替身
+------------------------------
+只实现 /user/detail 接口，用于在无法访问真实上游时进行端到端压测：
+
+    python -m loadtest.mock_api --port 3000 --density 0:1000000:0.3 --latency lognormal:20:0.5
+"""
+import argparse
+import json
+import math
+import random
+import struct
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class DensityMap(object):
+    """
+    有种子的 UID 密度表
+    ------------------
+    - segments 为若干 (begin, end, density) 区间，区间外的 UID 均无效
+    - 同一种子下，每个 UID 是否有效是确定的，因此可以计算出区间内的真实有效用户数用于核对
+    """
+    segments: List[Tuple[int, int, float]] = field(default_factory=lambda: [(0, 10 ** 6, 0.3)])
+    seed: int = 0
+
+    def density(self, uid: int) -> float:
+        for begin, end, density in self.segments:
+            if begin <= uid <= end:
+                return density
+        return 0.0
+
+    def valid(self, uid: int) -> bool:
+        density = self.density(uid)
+        if density <= 0:
+            return False
+        digest = zlib.crc32(struct.pack("<qq", self.seed, uid))
+        return digest / 0xFFFFFFFF < density
+
+    def count_valid(self, begin: int, end: int) -> int:
+        return sum(1 for uid in range(begin, end + 1) if self.valid(uid))
+
+    @classmethod
+    def parse(cls, text: str, seed: int = 0) -> "DensityMap":
+        """从形如 "0:1000:0.5,1000:5000:0.01" 的文本解析"""
+        segments = []
+        for part in text.split(","):
+            begin, end, density = part.split(":")
+            segments.append((int(begin), int(end), float(density)))
+        return cls(segments, seed)
+
+
+@dataclass
+class LatencyDistribution(object):
+    """响应延迟分布（单位：毫秒），kind 可为 fixed、uniform 或 lognormal"""
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    def sample(self, rnd: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return rnd.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            # a 为中位数，b 为对数标准差
+            return rnd.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        raise ValueError(f"Unknown latency distribution: {self.kind!r}")
+
+    @classmethod
+    def parse(cls, text: str) -> "LatencyDistribution":
+        """从形如 "fixed:5"、"uniform:1:10"、"lognormal:20:0.5" 的文本解析"""
+        kind, *params = text.split(":")
+        params = [float(p) for p in params] + [0.0, 0.0]
+        return cls(kind, params[0], params[1])
+
+
+@dataclass
+class MockApiConfig(object):
+    density_map: DensityMap = field(default_factory=DensityMap)
+    latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    # 经由指定代理（proxy 参数）的请求被限流的比例，替代 throttle_rate，用于模拟被上游按 IP 限流的代理
+    proxy_throttle_rates: Dict[str, float] = field(default_factory=dict)
+    payload_size: int = 1024
+    seed: int = 0
+
+
+class MockApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: MockApiConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.request_count = 0
+        # 各代理（proxy 参数，没有时为空字符串）收到的请求数
+        self.proxy_counts: Dict[str, int] = {}
+        self._random = random.Random(config.seed)
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        super().__init__((host, port), _MockApiRequestHandler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/user/detail"
+
+    def start(self):
+        self._thread = Thread(name="mock-api-thread", target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def decide(self, uid: Optional[int], proxy: str = "") -> Tuple[int, dict, float]:
+        """决定一次请求的响应，返回 (HTTP 状态码, 响应体, 延迟秒数)"""
+        config = self.config
+        throttle_rate = config.proxy_throttle_rates.get(proxy, config.throttle_rate)
+        with self._lock:
+            self.request_count += 1
+            self.proxy_counts[proxy] = self.proxy_counts.get(proxy, 0) + 1
+            latency = config.latency.sample(self._random) / 1000
+            roll = self._random.random()
+
+        if uid is None:
+            return 400, {"code": 400, "msg": "uid is required"}, latency
+        if roll < config.error_rate:
+            return 502, {"code": 502, "msg": "upstream error"}, latency
+        if roll < config.error_rate + throttle_rate:
+            # 上游限流时 NeteaseCloudMusicApi 返回的业务码
+            return 503, {"code": -460, "msg": "Cheating"}, latency
+        if not config.density_map.valid(uid):
+            return 404, {"code": 404, "msg": "user not found"}, latency
+        return 200, {
+            "code": 200,
+            "level": uid % 10,
+            "userPoint": {"userId": uid, "balance": 0},
+            "profile": {"userId": uid, "nickname": f"user-{uid}", "signature": "x" * config.payload_size},
+        }, latency
+
+
+class _MockApiRequestHandler(BaseHTTPRequestHandler):
+    # 支持长连接，与真实的 NeteaseCloudMusicApi 保持一致
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，关闭 Nagle 算法以免与延迟确认叠加产生额外的延迟
+    disable_nagle_algorithm = True
+    server: MockApiServer
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/user/detail":
+            self._reply(404, {"code": 404, "msg": "not found"})
+            return
+        query = parse_qs(url.query)
+        try:
+            uid = int(query["uid"][0])
+        except (KeyError, ValueError):
+            uid = None
+        status, body, latency = self.server.decide(uid, query.get("proxy", [""])[0])
+        if latency > 0:
+            time.sleep(latency)
+        self._reply(status, body)
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--density", default="0:1000000:0.3",
+                        help="UID density map, e.g. 0:1000:0.5,1000:5000:0.01")
+    parser.add_argument("--latency", default="fixed:0",
+                        help="fixed:MS, uniform:MIN_MS:MAX_MS or lognormal:MEDIAN_MS:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with HTTP 502")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered as throttled")
+    parser.add_argument("--proxy-throttle-rate", action="append", default=[], metavar="PROXY=RATE",
+                        help="share of requests via PROXY answered as throttled, can be repeated")
+    parser.add_argument("--payload-size", type=int, default=1024, help="approximate size of a valid user payload")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_arguments(args) -> MockApiConfig:
+    return MockApiConfig(
+        density_map=DensityMap.parse(args.density, args.seed),
+        latency=LatencyDistribution.parse(args.latency),
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        proxy_throttle_rates={proxy: float(rate) for proxy, rate in
+                              (item.rsplit("=", 1) for item in args.proxy_throttle_rate)},
+        payload_size=args.payload_size,
+        seed=args.seed,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the NeteaseCloudMusicApi /user/detail.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = MockApiServer(config_from_arguments(args), args.host, args.port)
+    print(f"Serving on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/env python3
+"""
+端到端压测
+---------
+启动本地的 NeteaseCloudMusicApi 替身，通过真实的 IndexFetcher 与抓取流水线扫描给定区间，并报告吞吐量、延迟和探测效率：
+
+    python -m loadtest.run --begin 0 --end 20000 --weights 1 1 1 1 --latency lognormal:5:0.5
+    python -m loadtest.run --storage mongo --mongo-uri mongodb://127.0.0.1:27017 -o report.json
+"""
+import argparse
+import json
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from src.fetcher import IndexFetcher
+from src.retry import RetryQueue
+from src.scraper import UserInfoScraper
+
+from .mock_api import MockApiConfig, MockApiServer, add_config_arguments, config_from_arguments
+
+
+class MemoryStorage(object):
+    """存储的替身，可模拟每次写入的耗时"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.documents: Dict[int, Dict[str, Any]] = {}
+        self._lock = Lock()
+
+    def __call__(self, i: int, data: Dict[str, Any]):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.documents[i] = data
+
+    def __len__(self):
+        return len(self.documents)
+
+
+class MongoStorage(object):
+    def __init__(self, uri: str, database: str = "nmdm-loadtest"):
+        from pymongo import MongoClient
+
+        self.collection = MongoClient(uri)[database]["user_info"]
+        self.collection.delete_many({})
+
+    def __call__(self, i: int, data: Dict[str, Any]):
+        self.collection.update_one({"userPoint.userId": i}, {"$set": data}, upsert=True)
+
+    def __len__(self):
+        return self.collection.count_documents({})
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run(config: MockApiConfig, begin: int, end: int, weights: Optional[List[float]] = None, storage=None,
+        retry_workers: int = 1, fetch_workers: Optional[int] = None, store_workers: int = 1,
+        url: Optional[str] = None) -> Dict[str, Any]:
+    storage = storage if storage is not None else MemoryStorage()
+    server = None if url else MockApiServer(config).start()
+    url = url or server.url
+
+    fetcher = IndexFetcher(begin, end, thread_weights=weights, name="LoadTest",
+                           retry_queue=RetryQueue(workers=retry_workers, base_delay=0.05, max_delay=1)
+                           if retry_workers > 0 else None)
+    pipeline = UserInfoScraper(url, storage).pipeline(
+        fetcher.name, fetch_workers or len(fetcher.thread_weights), store_workers=store_workers
+    )
+    handler = pipeline.as_handler()
+    latencies: List[float] = []
+
+    @fetcher.handlers.add
+    def timed_handler(i):
+        begin_time = time.perf_counter()
+        try:
+            handler(i)
+        finally:
+            latencies.append(time.perf_counter() - begin_time)
+
+    pipeline.start()
+    begin_time = time.perf_counter()
+    try:
+        fetcher.start()
+        fetcher.join()
+        fetcher.stop()
+        probe_elapsed = time.perf_counter() - begin_time
+    finally:
+        pipeline.stop()
+        if server is not None:
+            server.stop()
+    elapsed = time.perf_counter() - begin_time
+
+    valid_users = len(storage)
+    expected_valid_users = config.density_map.count_valid(begin, end) if server is not None else None
+    return {
+        "range": [begin, end],
+        "weights": fetcher.thread_weights,
+        "elapsed": elapsed,
+        "probeElapsed": probe_elapsed,
+        "probes": len(latencies),
+        "validUsers": valid_users,
+        "expectedValidUsers": expected_valid_users,
+        "coverage": valid_users / expected_valid_users if expected_valid_users else None,
+        "throughput": len(latencies) / elapsed if elapsed else None,
+        "validThroughput": valid_users / elapsed if elapsed else None,
+        "latency": {
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=None),
+        },
+        "probesPerValidUser": len(latencies) / valid_users if valid_users else None,
+        "mockRequests": server.request_count if server is not None else None,
+        "pipeline": pipeline.stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive an IndexFetcher against a local stand-in API.")
+    parser.add_argument("--begin", type=int, default=0)
+    parser.add_argument("--end", type=int, default=10000)
+    parser.add_argument("--weights", type=float, nargs="*", default=None)
+    parser.add_argument("--retry-workers", type=int, default=1)
+    parser.add_argument("--fetch-workers", type=int, default=None)
+    parser.add_argument("--store-workers", type=int, default=1)
+    parser.add_argument("--storage", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--storage-delay", type=float, default=0.0, help="seconds per write of the memory storage")
+    parser.add_argument("--mongo-uri", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--url", help="use an already running API instead of the bundled stand-in")
+    parser.add_argument("-o", "--output", help="write the report as JSON to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    storage = MongoStorage(args.mongo_uri) if args.storage == "mongo" else MemoryStorage(args.storage_delay)
+    report = run(config_from_arguments(args), args.begin, args.end, args.weights, storage,
+                 retry_workers=args.retry_workers, fetch_workers=args.fetch_workers,
+                 store_workers=args.store_workers, url=args.url)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            fp.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
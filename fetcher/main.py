@@ -1,40 +1,205 @@
+import math
 import os
-from logging import Logger
-from typing import List, Optional, Union
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from datetime import timedelta
+from logging import DEBUG, Logger
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-import requests
 import uvicorn
 from fastapi import FastAPI, HTTPException, Query
-from starlette.responses import RedirectResponse
-
-from src.config import Config, get_logger, get_mongo_database
-from src.exceptions import ExplicitlyStopHandlingError, UserNotFoundError
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
+from starlette.websockets import WebSocket, WebSocketDisconnect
+from websockets.exceptions import ConnectionClosed
+
+from src import jsoncodec
+from src.backends import BackendPool
+from src.breaker import CircuitBreaker
+from src.config import Config, get_logger, get_mongo_database, shutdown_loggers
+from src.exceptions import ProfilerBusyError
 from src.fetcher import IndexFetcher
 from src.flag import ThreadFlag
+from src.journal import ProbeJournal
 from src.monitor import IndexFetcherMonitor
-from src.util import get_traceback_text
+from src.pipeline import Pipeline
+from src.profiler import DeterministicProfiler, SamplingProfiler, all_threads, job_threads
+from src.proxies import ProxyPool
+from src.registry import RangeRegistry
+from src.retry import RetryQueue
+from src.scheduler import FairScheduler, JobPool
+from src.scraper import UserInfoScraper, probe_user_detail
+from src.snapshot import etag_matches
+from src.span import StepSpan
+from src.state import FetcherStore, failed_retries, fetcher_record, pending_retries, remaining_spans
+from src.tracing import Tracer, ZipkinFileExporter
+from src.wal import MongoWalSink, WalReplayer, WriteAheadLog
+
+
+class FastJSONResponse(JSONResponse):
+    """以 jsoncodec 编码的 JSON 响应（可用时使用 orjson）"""
+
+    def render(self, content: Any) -> bytes:
+        return jsoncodec.dumps(content)
+
 
 app = FastAPI()
 
 _fetchers: List[IndexFetcher] = []
+_pipelines: Dict[str, Pipeline] = {}
+_scrapers: Dict[str, UserInfoScraper] = {}
 _monitor = IndexFetcherMonitor(_fetchers)
 _db = None
 _logger: Optional[Logger] = None
+_wal: Optional[WriteAheadLog] = None
+_wal_replayer: Optional[WalReplayer] = None
+_tracer: Optional[Tracer] = None
+_journal: Optional[ProbeJournal] = None
+_profiles: Dict[str, Dict[str, Any]] = {}
+_store: Optional[FetcherStore] = None
+_scheduler: Optional[FairScheduler] = None
+# 所有抓取器共享的作业池，作业线程总数受其限制
+_job_pool: Optional[JobPool] = None
+_registry: Optional[RangeRegistry] = None
+_backends: Optional[BackendPool] = None
+_proxies: Optional[ProxyPool] = None
+_breaker: Optional[CircuitBreaker] = None
+_throttle_codes: Tuple[int, ...] = ()
+
+# 推送快照的连接空闲时发送心跳（或检查连接是否断开）的间隔，单位：秒
+_MONITOR_STREAM_HEARTBEAT = 15
 
 
 @app.on_event("startup")
 def startup():
     Config.load(encoding="utf8")
-    global _db, _logger
+    global _db, _logger, _wal, _wal_replayer, _tracer, _journal, _store, _scheduler, _registry, _backends
+    global _proxies, _throttle_codes, _breaker, _job_pool
     _db = get_mongo_database()
     _logger = get_logger("nmdm-fetcher-logger")
+    _wal = WriteAheadLog(Config.wal_directory, segment_size=int(Config.wal_segment_size),
+                         max_pending_bytes=int(Config.wal_max_pending_bytes))
+    _wal_replayer = WalReplayer(_wal, MongoWalSink(_db), batch_size=int(Config.wal_batch_size))
+    _wal_replayer.start()
+    _tracer = Tracer(ZipkinFileExporter(Config.tracing_file_path, max_bytes=int(Config.tracing_file_max_bytes),
+                                        backup_count=int(Config.tracing_file_backup_count)),
+                     sample_rate=float(Config.tracing_sample_rate))
+    _journal = ProbeJournal(Config.journal_directory, segment_size=int(Config.journal_segment_size),
+                            max_segments=int(Config.journal_max_segments) or None)
+    _journal.start()
+    _backends = BackendPool([url.strip() for url in Config.api_user_info_url.split(",") if url.strip()],
+                            health_path=Config.api_health_path,
+                            check_interval=float(Config.api_health_check_interval),
+                            eject_after=int(Config.api_eject_after_failures))
+    _backends.start()
+    proxy_urls = [url.strip() for url in Config.proxy_urls.split(",") if url.strip()]
+    _proxies = ProxyPool(proxy_urls, cooldown=float(Config.proxy_cooldown),
+                         max_cooldown=float(Config.proxy_max_cooldown)) if proxy_urls else None
+    _throttle_codes = tuple(int(code) for code in Config.proxy_throttle_codes.split(",") if code.strip())
+    breaker_failure_rate = float(Config.breaker_failure_rate)
+    if breaker_failure_rate > 0:
+        _breaker = CircuitBreaker(_upstream_available, window=int(Config.breaker_window),
+                                  failure_rate=breaker_failure_rate, min_calls=int(Config.breaker_min_calls),
+                                  probe_interval=float(Config.breaker_probe_interval),
+                                  settle_time=float(Config.breaker_settle_time))
+        _breaker.emitter.on("CircuitBreaker.opened",
+                            lambda breaker: _logger.warning("上游不可用，熔断器断开，所有作业暂停：%s", breaker.stats()))
+        _breaker.emitter.on("CircuitBreaker.closed", lambda breaker: _logger.info("上游已恢复，熔断器闭合，作业继续运行"))
+        if int(Config.breaker_probe_uid) <= 0:
+            _logger.warning("未配置 breaker probe_uid，熔断后以后端的健康检查判断上游是否恢复，被限流时熔断器可能反复断开、闭合")
+        _breaker.start()
+    scheduler_budget = int(Config.scheduler_budget)
+    _scheduler = FairScheduler(scheduler_budget) if scheduler_budget > 0 else None
+    _job_pool = JobPool(int(Config.scheduler_job_threads) or None)
+    straggler_factor = float(Config.monitor_straggler_factor)
+    _monitor.straggler_factor = straggler_factor or None
+    _monitor.straggler_min_remaining = timedelta(seconds=int(Config.monitor_straggler_min_remaining))
+    _monitor.add_section("wal", lambda: {
+        "pendingBytes": _wal.pending_bytes,
+        "segmentCount": _wal.segment_count,
+        "lastError": repr(_wal_replayer.last_exception) if _wal_replayer.last_exception else None,
+    })
+    _monitor.add_section("journal", lambda: {
+        "written": _journal.written,
+        "dropped": _journal.dropped,
+    })
+    if _scheduler is not None:
+        _monitor.add_section("scheduler", _scheduler.stats)
+    _monitor.add_section("jobPool", _job_pool.stats)
+    _monitor.add_section("backends", _backends.stats)
+    if _breaker is not None:
+        _monitor.add_section("breaker", _breaker.stats)
+    if _proxies is not None:
+        _monitor.add_section("proxies", _proxies.stats)
+    _monitor.add_section("scrapers", lambda: {name: scraper.stats() for name, scraper in _scrapers.copy().items()})
+    _monitor.add_section("pipelines", lambda: {name: pipeline.stats() for name, pipeline in _pipelines.copy().items()})
     _monitor.start()
+    _store = FetcherStore(Config.state_file_path, _snapshot_fetchers, interval=float(Config.state_save_interval))
+    _registry = _store.registry = _store.load_registry()
+    _resume_fetchers(_store.load())
+    _store.start()
+
+
+def _upstream_available():
+    """
+    熔断后检查上游是否恢复：以已知有效的用户 ID（breaker probe_uid）向各后端请求一次用户详情，任一后端返回的业务码为
+    200 即视为恢复（健康检查只说明后端可以连接，被限流时仍会通过，以此判断会使熔断器反复断开、闭合）；未配置 probe_uid 时
+    只能退而以健康检查判断，任一后端通过即视为恢复
+    """
+    uid = int(Config.breaker_probe_uid)
+    if uid <= 0:
+        return any(_backends.health_check(backend) for backend in _backends.backends)
+    proxy = None if _proxies is None else _proxies.choose().url
+    timeout = (float(Config.api_connect_timeout), float(Config.api_read_timeout))
+    return any(probe_user_detail(backend.url, uid, proxy=proxy, timeout=timeout) for backend in _backends.backends)
+
+
+def _snapshot_fetchers():
+    records = [fetcher_record(fetcher, _profiles.get(fetcher.name)) for fetcher in _fetchers.copy()]
+    # 顺便以各抓取器的进度结算区间登记表中已完成的区间，尚未得到重试结果的索引仍视为尚需处理
+    for record in records:
+        _registry.settle(record["name"], _intervals(remaining_spans(record), pending_retries(record)),
+                         _intervals([], failed_retries(record)))
+    return records
+
+
+def _intervals(spans, indexes=()):
+    return [(span.min_val, span.max_val) for span in spans] + [(i, i) for i in indexes]
+
+
+def _resume_fetchers(records):
+    """按保存的记录重建抓取器，之前正在运行的抓取器从保存的进度处继续运行"""
+    for record in records:
+        fetcher = _create_fetcher(record["name"], record["begin"], record["end"], record["step"], record["weights"],
+                                  **record["profile"])
+        # 尚未启动的抓取器也可能只需处理部分区间（被登记表裁剪过）
+        fetcher.restore(remaining_spans(record), pending_retries(record))
+        if record["state"] == "running":
+            fetcher.start()
+            _logger.info("已恢复运行的抓取器：%s", fetcher)
 
 
 @app.on_event("shutdown")
 def shutdown():
     _monitor.stop()
-    _logger.shutdown()
+    # 先停止保存，最后一次保存的是各抓取器停止前的进度，重启后仍会恢复运行
+    _store.stop(timeout=10)
+    # 作业被取消后立即结束，不会等待进行中的请求
+    for fetcher in _fetchers:
+        if ThreadFlag.running in fetcher.flag:
+            try:
+                fetcher.stop(timeout=1)
+            except FuturesTimeoutError:
+                _logger.warning("抓取器 %s 未能在 1 秒内停止", fetcher.name)
+    for name in list(_pipelines):
+        _stop_pipeline(name, timeout=1)
+    if _breaker is not None:
+        _breaker.stop(timeout=1)
+    _backends.stop(timeout=1)
+    _wal_replayer.stop(timeout=10)
+    _wal.close()
+    _tracer.exporter.close()
+    _journal.stop(timeout=10)
+    shutdown_loggers()
 
 
 @app.get("/")
@@ -43,89 +208,244 @@ def home():
 
 
 @app.get("/monitor")
-def monitor():
-    return {
-        "monitor": {
-            "flag": str(_monitor.flag),
-            "processed": _monitor.processed,
-            "averageSpeed": _monitor.average_speed,
-            "effectiveAverageSpeed": _monitor.effective_average_speed,
-            "remainingTime": _monitor.remaining_time,
-            "age": _monitor.age,
-        },
-        "jobs": {
-            str(job_status_data.job): {
-                "flag": str(job_status_data.flag),
-                "processed": job_status_data.processed,
-                "averageSpeed": job_status_data.average_speed,
-                "effectiveAverageSpeed": job_status_data.effective_average_speed,
-                "remainingTime": job_status_data.remaining_time,
-                "age": job_status_data.age,
-            } for job_status_data in _monitor.monitored_jobs.values()
-        }
-    }
+def monitor(request: Request):
+    """返回监视器在最近一个 tick 构建的快照，支持以 If-None-Match 条件请求，快照未变化时返回 304"""
+    snapshot = _monitor.publisher.latest or _monitor.publish_snapshot()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
+
+
+@app.get("/monitor/events")
+async def monitor_events(request: Request):
+    """以 SSE 推送快照：连接后先推送完整快照（snapshot 事件），之后每个 tick 推送与上一版本的差异（patch 事件）"""
+
+    async def events():
+        with _monitor.publisher.subscription() as subscription:
+            while not await request.is_disconnected():
+                message = await subscription.next(timeout=_MONITOR_STREAM_HEARTBEAT)
+                if message is None:
+                    yield b": heartbeat\n\n"
+                    continue
+                kind, snapshot = message
+                data = snapshot.body if kind == "snapshot" else snapshot.patch
+                yield b"event: %s\nid: %d\ndata: %s\n\n" % (kind.encode(), snapshot.version, data)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.websocket("/monitor/ws")
+async def monitor_ws(websocket: WebSocket):
+    """以 WebSocket 推送快照，消息格式为 {"type": "snapshot" | "patch", "version": 版本, "data": 快照或差异}"""
+    await websocket.accept()
+    try:
+        with _monitor.publisher.subscription() as subscription:
+            while True:
+                message = await subscription.next(timeout=_MONITOR_STREAM_HEARTBEAT)
+                if message is None:
+                    continue
+                kind, snapshot = message
+                data = snapshot.body if kind == "snapshot" else snapshot.patch
+                await websocket.send_text('{"type":"%s","version":%d,"data":%s}' % (kind, snapshot.version,
+                                                                                   data.decode("utf-8")))
+    except (WebSocketDisconnect, ConnectionClosed):
+        pass
+
+
+def _profile_duration(duration: float) -> float:
+    """将剖析时间限制在 0 到 profiler max_duration 之间，剖析期间持有剖析锁，不能无限期地占用"""
+    return min(max(duration, 0.0), float(Config.profiler_max_duration))
+
+
+@app.get("/profile/sample")
+def profile_sample(duration: float = 10, interval: float = 0.005, scope: str = "jobs"):
+    """采样剖析，返回折叠栈；scope 为 jobs 时只采集作业线程，为 all 时采集所有线程（包括流水线、重试等线程）"""
+    if scope == "jobs":
+        threads = lambda: job_threads(job for fetcher in _fetchers for job in fetcher.jobs)
+    else:
+        threads = all_threads
+    try:
+        profiler = SamplingProfiler(threads, interval).run(_profile_duration(duration))
+    except ProfilerBusyError as e:
+        raise HTTPException(409, detail=str(e))
+    return PlainTextResponse(profiler.collapsed())
+
+
+@app.get("/profile/deterministic")
+def profile_deterministic(duration: float = 10, sort: str = "cumulative", limit: int = 50, per_thread: bool = True):
+    """确定性剖析所有作业线程以及流水线各阶段的工作线程（重试、监视等其它线程不在其中），返回 pstats 文本"""
+    try:
+        profiler = DeterministicProfiler().run(_profile_duration(duration))
+    except ProfilerBusyError as e:
+        raise HTTPException(409, detail=str(e))
+    text = profiler.stats(sort, limit, per_thread)
+    if profiler.unfinished:
+        text += f"\nThreads that did not report in time: {', '.join(profiler.unfinished)}\n"
+    return PlainTextResponse(text)
 
 
-@app.get("/fetcher")
+@app.get("/fetcher", response_class=FastJSONResponse)
 def fetcher_list():
     return {f.name: str(f) for f in _fetchers}
 
 
-@app.get("/fetcher/new")
+@app.get("/fetcher/new", response_class=FastJSONResponse)
 def fetcher_new(begin: int, end: Optional[int] = Query(None), step: int = 1,
-                weights: Optional[List[Union[int, float]]] = Query(None)):
+                weights: Optional[List[Union[int, float]]] = Query(None),
+                retry_workers: int = 1, retry_max_attempts: int = 5,
+                fetch_workers: Optional[int] = Query(None), parse_workers: int = 1, store_workers: int = 1,
+                queue_size: int = 100, priority: float = 1.0):
+    """新建抓取器，步长为 ±1 时只认领尚未被其它抓取器认领、也尚未完成的部分，区间全部已被覆盖时返回错误"""
+    name = _next_fetcher_name()
+    spans = None
+    if abs(step) == 1:
+        span = StepSpan(begin, end, step)
+        gaps = _registry.claim(name, span.min_val, span.max_val)
+        if not gaps:
+            return {
+                "error": "区间已被其它抓取器认领或已完成"
+            }
+        if gaps != [(span.min_val, span.max_val)]:
+            spans = [StepSpan(low, high, step) if step > 0 else StepSpan(high, low, step) for low, high in gaps]
+    try:
+        fetcher = _create_fetcher(name, begin, end, step, weights, retry_workers=retry_workers,
+                                  retry_max_attempts=retry_max_attempts, fetch_workers=fetch_workers,
+                                  parse_workers=parse_workers, store_workers=store_workers, queue_size=queue_size,
+                                  priority=priority)
+    except Exception:
+        _registry.discard(name)
+        raise
+    if spans is not None:
+        fetcher.restore(spans)
+    _store.save()
+
+    return {
+        "fid": fetcher.name,
+        "spans": [[span.begin, None if math.isinf(span.end) else span.end] for span in fetcher.remaining_spans()],
+    }
+
+
+@app.get("/ranges", response_class=FastJSONResponse)
+def ranges(begin: int = 0, end: Optional[int] = Query(None)):
+    """查询与 [begin, end] 重叠的已认领（按抓取器）、已完成、重试失败以及尚未被覆盖的区间"""
+    _snapshot_fetchers()
+    # 区间可能很多，直接返回响应，跳过 FastAPI 对返回值的逐层转换
+    return FastJSONResponse(_registry.query(begin, math.inf if end is None else end))
+
+
+def _next_fetcher_name():
+    numbers = [int(f.name.rsplit("-", 1)[1]) for f in _fetchers if f.name.rsplit("-", 1)[-1].isdigit()]
+    return f"Fetcher-{max(numbers, default=-1) + 1}"
+
+
+def _create_fetcher(name, begin, end, step, weights, retry_workers=1, retry_max_attempts=5, fetch_workers=None,
+                    parse_workers=1, store_workers=1, queue_size=100, priority=1.0):
+    retry_queue = RetryQueue(workers=retry_workers, max_attempts=retry_max_attempts, name=name) \
+        if retry_workers > 0 else None
     fetcher = IndexFetcher(
-        begin=begin, end=end, step=step, thread_weights=weights, name=f"Fetcher-{len(_fetchers)}"
+        begin=begin, end=end, step=step, thread_weights=weights, name=name, retry_queue=retry_queue, tracer=_tracer,
+        scheduler=_scheduler, priority=priority, breaker=_breaker, pool=_job_pool
     )
 
-    with requests.session() as session:
-        @fetcher.handlers.add
-        def scrape_user_info(i):
-            r = session.get(Config.api_user_info_url, params={"uid": i})
-            data = None
-            if r.status_code == 200:
-                data = r.json()
-            if r.status_code == 404 or data["code"] == 404:
-                raise UserNotFoundError(i)
-            if r.status_code != 200 or data["code"] != 200:
-                raise ExplicitlyStopHandlingError(f"{data}")
-
-            _db["user_info"].update_one({"userPoint.userId": i}, {"$set": data}, upsert=True)
+    def store_user_info(i, body):
+        # 响应体在解析时已校验过，原样嵌入记录，不必先解码再重新编码
+        _wal.append_raw(b'{"c":"user_info","f":{"userPoint.userId":%d},"u":{"$set":%s}}' % (i, body))
+
+    workers = fetch_workers or len(fetcher.thread_weights)
+    timeout_multiplier = float(Config.api_timeout_multiplier)
+    hedge_quantile = float(Config.api_hedge_quantile)
+    scraper = UserInfoScraper(_backends.backends[0].url, store_user_info, journal=_journal, backends=_backends,
+                              timeout=(float(Config.api_connect_timeout), float(Config.api_read_timeout)),
+                              timeout_multiplier=timeout_multiplier or None, min_timeout=float(Config.api_min_timeout),
+                              hedge_quantile=hedge_quantile or None, hedge_workers=2 * workers,
+                              proxies=_proxies, throttle_codes=_throttle_codes, raw=True)
+    pipeline = scraper.pipeline(name, workers, parse_workers, store_workers, queue_size)
+    pipeline.start()
+    fetcher.handlers.add(pipeline.as_handler())
+    _pipelines[name] = pipeline
+    _scrapers[name] = scraper
+
+    # NOTE: 日志使用 % 格式的参数，异常堆栈通过 exc_info 交给日志写入线程格式化；调试级别的监听器只在开启调试日志时注册
+    @pipeline.emitter.on("Pipeline.stage_error")
+    def on_stage_error(sender, stage_name, err_info):
+        _logger.error("流水线 %s 的 %s 阶段出错，出错堆栈：", sender.name, stage_name, exc_info=_exc_info(err_info))
 
     @fetcher.emitter.on("IndexJob.running")
     def on_running(sender):
-        _logger.info(f"即将开始的作业：{sender}")
+        _logger.info("即将开始的作业：%s", sender)
 
     @fetcher.emitter.on("IndexJob.stopped")
     def on_stopped(sender, err_info):
-        _logger.info(f"即将结束的作业：{sender}, 导致结束的出错堆栈：\n{get_traceback_text(*err_info)}")
-
-    @fetcher.emitter.on("IndexJob.step_switch")
-    def on_step_switch(sender):
-        _logger.debug(f"步骤切换的作业：{sender}")
-
-    @fetcher.emitter.on("IndexJob.handled")
-    def on_handled(sender):
-        _logger.debug(f"单次作业已完成：{sender}")
+        _logger.info("即将结束的作业：%s, 导致结束的出错堆栈：", sender, exc_info=_exc_info(err_info))
 
     @fetcher.emitter.on("IndexJob.unexpected_exception")
     def on_unexpected_exception(sender, err_info):
-        _logger.error(f"工作出现意外异常的作业：{sender}, 出错堆栈：\n{get_traceback_text(*err_info)}")
+        _logger.error("工作出现意外异常的作业：%s, 出错堆栈：", sender, exc_info=_exc_info(err_info))
+
+    if _logger.isEnabledFor(DEBUG):
+        @fetcher.emitter.on("IndexJob.step_switch")
+        def on_step_switch(sender):
+            _logger.debug("步骤切换的作业：%s", sender)
+
+        @fetcher.emitter.on("IndexJob.handled")
+        def on_handled(sender):
+            _logger.debug("单次作业已完成：%s", sender)
+
+        @fetcher.emitter.on("IndexJob.handle_skipped")
+        def on_handle_error(sender, err_info):
+            _logger.debug("工作遇到处理过程被跳过的作业：%s，导致跳过的出错堆栈：", sender, exc_info=_exc_info(err_info))
+
+        @fetcher.emitter.on("IndexJob.handle_deferred")
+        def on_handle_deferred(sender, err_info):
+            _logger.debug("工作遇到处理过程被推迟重试的作业：%s，原因：%r", sender, err_info[1])
 
-    @fetcher.emitter.on("IndexJob.handle_skipped")
-    def on_handle_error(sender, err_info):
-        _logger.debug(f"工作遇到处理过程被跳过的作业：{sender}，导致跳过的出错堆栈：\n{get_traceback_text(*err_info)}")
+    @fetcher.emitter.on("IndexJob.retry_exhausted")
+    def on_retry_exhausted(sender, i, err_info):
+        _logger.warning("索引 %s 重试次数已耗尽，来自作业：%s，最后的出错堆栈：", i, sender, exc_info=_exc_info(err_info))
+
+    @fetcher.emitter.on("IndexFetcher.resized")
+    def on_resized(sender, jobs):
+        _logger.info("已调整大小的抓取器：%s，新的作业：%s", sender, ", ".join(str(job) for job in jobs))
+
+    @fetcher.emitter.on("IndexFetcher.split")
+    def on_split(sender, job, new_job):
+        _logger.info("拆分掉队的作业：%s，新的作业：%s", job, new_job)
+
+    @fetcher.emitter.on("IndexFetcher.preempted")
+    def on_preempted(sender, job, new_job):
+        _logger.info("作业让出线程给其它抓取器：%s，排队中的新作业：%s", job, new_job)
 
     @fetcher.emitter.on("error")
     def on_error(err):
-        _logger.error(f"未知错误：{err!r}，来自 {fetcher}")
+        _logger.error("未知错误：%r，来自 %s", err, fetcher)
 
     _fetchers.append(fetcher)
-
-    return {
-        "fid": fetcher.name
+    # 处理器配置随抓取器一同持久化，重启后以相同的配置重建
+    _profiles[name] = {
+        "retry_workers": retry_workers,
+        "retry_max_attempts": retry_max_attempts,
+        "fetch_workers": fetch_workers,
+        "parse_workers": parse_workers,
+        "store_workers": store_workers,
+        "queue_size": queue_size,
+        "priority": priority,
     }
 
+    return fetcher
+
+
+def _stop_pipeline(name, timeout=None):
+    # 先中断进行中的请求，被取消的作业提交的数据不会再被处理，已获取的数据仍会被解析和存储
+    scraper = _scrapers.pop(name)
+    scraper.cancel()
+    _pipelines.pop(name).stop(timeout)
+    scraper.close()
+
+
+def _exc_info(err_info):
+    return err_info if err_info[0] is not None else None
+
 
 def try_find_fetcher(fid):
     fetcher = next((f for f in _fetchers if f.name == fid), None)
@@ -134,10 +454,11 @@ def try_find_fetcher(fid):
     return fetcher
 
 
-@app.get("/fetcher/start")
+@app.get("/fetcher/start", response_class=FastJSONResponse)
 def fetcher_start(fid: str):
     try:
         try_find_fetcher(fid).start()
+        _store.save()
     except Exception as e:
         return {
             "error": str(e)
@@ -146,11 +467,12 @@ def fetcher_start(fid: str):
     return True
 
 
-@app.get("/fetcher/start_all")
+@app.get("/fetcher/start_all", response_class=FastJSONResponse)
 def fetcher_start_all():
     try:
         for fetcher in (f for f in _fetchers if ThreadFlag.pending in f.flag):
             fetcher.start()
+        _store.save()
     except Exception as e:
         return {
             "error": str(e)
@@ -159,10 +481,11 @@ def fetcher_start_all():
     return True
 
 
-@app.get("/fetcher/stop")
+@app.get("/fetcher/stop", response_class=FastJSONResponse)
 def fetcher_stop(fid: str):
     try:
         try_find_fetcher(fid).stop()
+        _store.save()
     except Exception as e:
         return {
             "error": str(e)
@@ -171,11 +494,47 @@ def fetcher_stop(fid: str):
     return True
 
 
-@app.get("/fetcher/stop_all")
+@app.get("/fetcher/stop_all", response_class=FastJSONResponse)
 def fetcher_stop_all():
     try:
         for fetcher in _fetchers:
             fetcher.stop()
+        _store.save()
+    except Exception as e:
+        return {
+            "error": str(e)
+        }
+
+    return True
+
+
+@app.get("/fetcher/resize", response_class=FastJSONResponse)
+def fetcher_resize(fid: str, weights: List[Union[int, float]] = Query(...)):
+    fetcher = try_find_fetcher(fid)
+    try:
+        jobs = fetcher.resize(weights)
+        _store.save()
+    except ValueError as e:
+        # 权重不合法、步长为 0 或终点为无穷大时无法调整大小
+        raise HTTPException(400, detail=str(e))
+    except Exception as e:
+        return {
+            "error": str(e)
+        }
+
+    return {
+        "jobs": [str(job) for job in jobs]
+    }
+
+
+@app.get("/fetcher/priority", response_class=FastJSONResponse)
+def fetcher_priority(fid: str, priority: float):
+    """设置抓取器的优先级，所有抓取器共享的并发额度紧张时，按优先级加权公平分配"""
+    try:
+        fetcher = try_find_fetcher(fid)
+        fetcher.priority = priority
+        _profiles[fetcher.name]["priority"] = priority
+        _store.save()
     except Exception as e:
         return {
             "error": str(e)
@@ -184,12 +543,17 @@ def fetcher_stop_all():
     return True
 
 
-@app.get("/fetcher/delete")
+@app.get("/fetcher/delete", response_class=FastJSONResponse)
 def fetcher_delete(fid: str):
     try:
         fetcher = try_find_fetcher(fid)
         fetcher.stop()
         _fetchers.remove(fetcher)
+        _registry.release(fetcher.name, _intervals(fetcher.remaining_spans(), fetcher.pending_retries()),
+                          _intervals([], fetcher.failed_retries()))
+        _stop_pipeline(fetcher.name)
+        _profiles.pop(fetcher.name, None)
+        _store.save()
     except Exception as e:
         return {
             "error": str(e)
@@ -0,0 +1,140 @@
+#!/usr/env python3
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urljoin
+
+import requests
+
+from .flag import ThreadFlag
+from .status import IStatus
+from .util import repr_injector
+
+_health_check_type = Callable[["Backend"], bool]
+
+
+@repr_injector
+class Backend(object):
+    def __init__(self, url: str):
+        self.url = url
+        # 已发出、尚未返回的请求数
+        self.outstanding = 0
+        # 延迟的指数加权移动平均（秒），没有样本时为 None
+        self.latency: Optional[float] = None
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+
+@repr_injector
+class BackendPool(IStatus):
+    """
+    后端池
+    -----
+    - 在多个后端（NeteaseCloudMusicApi 实例）之间分配请求：选择健康的后端中进行中的请求最少的一个，相同时选择延迟较低的一个
+    - 被动检查：连续失败 eject_after 次的后端被摘除，不再分配请求
+    - 主动检查：每隔 check_interval 秒请求所有后端的 health_path，失败的后端被摘除，被摘除的后端检查成功后重新加入
+    - 所有后端都被摘除时，仍在所有后端中分配，避免完全停止探测
+    """
+
+    def __init__(self, urls: List[str], health_path: str = "/", check_interval: float = 5, check_timeout: float = 2,
+                 eject_after: int = 5, health_check: Optional[_health_check_type] = None,
+                 session: Optional[requests.Session] = None):
+        if not urls:
+            raise ValueError("At least one backend is required!")
+
+        self.backends = [Backend(url) for url in urls]
+        self.health_path = health_path
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.eject_after = eject_after
+        self.health_check = health_check or self._default_health_check
+
+        self._session = session or requests.session()
+        self._flag = ThreadFlag(ThreadFlag.pending)
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def flag(self):
+        return self._flag
+
+    def acquire(self) -> Backend:
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend.healthy] or self.backends
+            backend = min(candidates, key=lambda b: (b.outstanding, b.latency or 0.0))
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, ok: bool, latency: Optional[float] = None):
+        with self._lock:
+            backend.outstanding -= 1
+            if latency is not None:
+                backend.latency = latency if backend.latency is None else 0.8 * backend.latency + 0.2 * latency
+            if ok:
+                backend.consecutive_failures = 0
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.healthy and backend.consecutive_failures >= self.eject_after:
+                self._eject(backend)
+
+    def _eject(self, backend: Backend):
+        backend.healthy = False
+        backend.ejections += 1
+
+    def check(self):
+        """对所有后端进行一次主动健康检查"""
+        for backend in self.backends:
+            # noinspection PyBroadException
+            try:
+                healthy = self.health_check(backend)
+            except Exception:
+                healthy = False
+            with self._lock:
+                if healthy:
+                    if not backend.healthy:
+                        backend.consecutive_failures = 0
+                    backend.healthy = True
+                elif backend.healthy:
+                    self._eject(backend)
+
+    def _default_health_check(self, backend: Backend) -> bool:
+        r = self._session.get(urljoin(backend.url, self.health_path), timeout=self.check_timeout)
+        return r.status_code < 500
+
+    def start(self):
+        if ThreadFlag.pending not in self._flag:
+            raise RuntimeError("Cannot start a backend pool again!")
+        self._flag -= ThreadFlag.pending
+        self._flag += ThreadFlag.running
+        self._thread = Thread(name=f"{self.__class__.__name__}-checker", target=self._work, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        if ThreadFlag.running not in self._flag:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._flag -= ThreadFlag.running
+        self._flag += ThreadFlag.stopping
+
+    def _work(self):
+        while not self._stop_event.wait(self.check_interval):
+            self.check()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                backend.url: {
+                    "healthy": backend.healthy,
+                    "outstanding": backend.outstanding,
+                    "latency": backend.latency,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "ejections": backend.ejections,
+                } for backend in self.backends
+            }
@@ -0,0 +1,164 @@
+#!/usr/env python3
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from pyee import AsyncIOEventEmitter
+
+from .flag import ThreadFlag
+from .status import IStatus
+from .util import repr_injector
+
+
+@repr_injector
+class CircuitBreaker(IStatus):
+    """
+    上游熔断器
+    ---------
+    - 作业每次处理后通过 record 报告上游是否可用（用户不存在也算可用），最近 window 次中失败的比例不低于 failure_rate
+      （且至少已有 min_calls 次）时熔断
+    - 熔断期间作业在当前位置暂停（见 IndexJob），不再向上游发出请求；熔断时已在进行中的请求失败后，作业在恢复后重新处理
+      同一索引，因此上游不可用期间不会有区间被当作无效而跳过
+    - 熔断后每隔 probe_interval 秒调用一次 probe 检查上游是否恢复，成功即恢复，所有暂停的作业继续运行
+    - 断开期间以及恢复后的 settle_time 秒内上游可能反复不稳定，settled 为 False，这期间重试失败的索引不计入重试次数
+      （见 RetryQueue）
+    - 状态变化时发出 CircuitBreaker.opened、CircuitBreaker.closed 事件
+    """
+
+    def __init__(self, probe: Callable[[], bool], window: int = 20, failure_rate: float = 0.5, min_calls: int = 10,
+                 probe_interval: float = 5, settle_time: float = 60, emitter=None,
+                 clock: Callable[[], float] = time.monotonic):
+        if not 0 < failure_rate <= 1:
+            raise ValueError(f"The failure rate must be in (0, 1]: {failure_rate!r}")
+
+        self.probe = probe
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.probe_interval = probe_interval
+        self.settle_time = settle_time
+        self.clock = clock
+
+        self._emitter = emitter or AsyncIOEventEmitter()
+        self._flag = ThreadFlag(ThreadFlag.pending)
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+        # 最近的结果，True 为成功
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._failures = 0
+        self._open = False
+        self._waiters: List[Future] = []
+        self.trips = 0
+        self.opened_at: Optional[datetime] = None
+        # 最近一次恢复的时间（clock 的读数），从未熔断时为 None
+        self._closed_at: Optional[float] = None
+
+    @property
+    def flag(self):
+        return self._flag
+
+    @property
+    def emitter(self):
+        return self._emitter
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    @property
+    def settled(self) -> bool:
+        """熔断器闭合且距最近一次恢复已超过 settle_time 秒（或从未熔断）"""
+        if self._open:
+            return False
+        closed_at = self._closed_at
+        return closed_at is None or self.clock() - closed_at >= self.settle_time
+
+    def record(self, ok: bool):
+        with self._lock:
+            # 熔断期间仍在进行中的请求的结果不计入，恢复后从头统计
+            if self._open:
+                return
+            if len(self._outcomes) == self._outcomes.maxlen and not self._outcomes[0]:
+                self._failures -= 1
+            self._outcomes.append(ok)
+            if not ok:
+                self._failures += 1
+            if len(self._outcomes) < self.min_calls or self._failures < self.failure_rate * len(self._outcomes):
+                return
+            self._open = True
+            self.trips += 1
+            self.opened_at = datetime.now()
+        self._emitter.emit("CircuitBreaker.opened", self)
+
+    def wait_future(self) -> Future:
+        """返回在熔断器处于闭合状态时完成的 Future，作业可以用 IndexJob.wait 等待，被取消时 Future 随之取消"""
+        future = Future()
+        with self._lock:
+            if self._open:
+                self._waiters.append(future)
+                return future
+        future.set_result(None)
+        return future
+
+    def check(self) -> bool:
+        """熔断时调用一次 probe，上游已恢复时闭合熔断器，返回熔断器是否闭合"""
+        if not self._open:
+            return True
+        # noinspection PyBroadException
+        try:
+            recovered = self.probe()
+        except Exception:
+            recovered = False
+        if recovered:
+            self.reset()
+        return recovered
+
+    def reset(self):
+        with self._lock:
+            if not self._open:
+                return
+            self._open = False
+            self._closed_at = self.clock()
+            self._outcomes.clear()
+            self._failures = 0
+            waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            # 等待者已被取消（比如作业被取消）时直接跳过
+            if future.set_running_or_notify_cancel():
+                future.set_result(None)
+        self._emitter.emit("CircuitBreaker.closed", self)
+
+    def start(self):
+        if ThreadFlag.pending not in self._flag:
+            raise RuntimeError("Cannot start a circuit breaker again!")
+        self._flag -= ThreadFlag.pending
+        self._flag += ThreadFlag.running
+        self._thread = Thread(name=f"{self.__class__.__name__}-prober", target=self._work, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        if ThreadFlag.running not in self._flag:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._flag -= ThreadFlag.running
+        self._flag += ThreadFlag.stopping
+
+    def _work(self):
+        while not self._stop_event.wait(self.probe_interval):
+            self.check()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open": self._open,
+                "openedAt": self.opened_at if self._open else None,
+                "recentCalls": len(self._outcomes),
+                "recentFailures": self._failures,
+                "paused": sum(1 for future in self._waiters if not future.cancelled()),
+                "settled": self.settled,
+                "trips": self.trips,
+            }
@@ -2,7 +2,7 @@
 import os
 from configparser import ConfigParser
 from logging import Formatter, Logger, getLevelName
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueListener, TimedRotatingFileHandler
 from pathlib import Path
 from typing import Dict, Optional, Union
 from urllib.parse import quote_plus
@@ -10,6 +10,7 @@ from urllib.parse import quote_plus
 from pymongo import MongoClient
 
 from src.exceptions import ConfigLoadError, ConfigNotLoadedError
+from src.log import queued
 
 
 class ConfigMeta(type):
@@ -39,9 +40,64 @@ class Config(object, metaclass=ConfigMeta):
     logger_log_file_backup_count: Union[int]
     logger_log_file_encoding: str
     logger_format: str
+    logger_queue_size: Union[str, int]
 
     # api
     api_user_info_url: str
+    api_connect_timeout: Union[str, float]
+    api_read_timeout: Union[str, float]
+    api_timeout_multiplier: Union[str, float]
+    api_min_timeout: Union[str, float]
+    api_hedge_quantile: Union[str, float]
+    api_health_path: str
+    api_health_check_interval: Union[str, float]
+    api_eject_after_failures: Union[str, int]
+
+    # proxy
+    proxy_urls: str
+    proxy_cooldown: Union[str, float]
+    proxy_max_cooldown: Union[str, float]
+    proxy_throttle_codes: str
+
+    # wal
+    wal_directory: str
+    wal_segment_size: Union[str, int]
+    wal_max_pending_bytes: Union[str, int]
+    wal_batch_size: Union[str, int]
+
+    # tracing
+    tracing_sample_rate: Union[str, float]
+    tracing_file_path: str
+    tracing_file_max_bytes: Union[str, int]
+    tracing_file_backup_count: Union[str, int]
+
+    # journal
+    journal_directory: str
+    journal_segment_size: Union[str, int]
+    journal_max_segments: Union[str, int]
+
+    # state
+    state_file_path: str
+    state_save_interval: Union[str, float]
+
+    # monitor
+    monitor_straggler_factor: Union[str, float]
+    monitor_straggler_min_remaining: Union[str, int]
+
+    # scheduler
+    scheduler_budget: Union[str, int]
+    scheduler_job_threads: Union[str, int]
+
+    # breaker
+    breaker_window: Union[str, int]
+    breaker_failure_rate: Union[str, float]
+    breaker_min_calls: Union[str, int]
+    breaker_probe_interval: Union[str, float]
+    breaker_probe_uid: Union[str, int]
+    breaker_settle_time: Union[str, float]
+
+    # profiler
+    profiler_max_duration: Union[str, float]
 
     @classmethod
     def set_parser(cls, parser: Optional[ConfigParser]):
@@ -87,9 +143,58 @@ class Config(object, metaclass=ConfigMeta):
             "logger_format": lambda: cls._parser.get(
                 "logger", "format",
                 fallback="[%(asctime)s][%(name)s/%(threadName)s][%(levelname)s]: %(message)s"),
+            "logger_queue_size": lambda: cls._parser.getint("logger", "queue_size", fallback=10000),
             # api
             "api_user_info_url": lambda: cls._parser.get("api", "user_info_url",
-                                                         fallback="http://127.0.0.1:3000/user/detail")
+                                                         fallback="http://127.0.0.1:3000/user/detail"),
+            "api_connect_timeout": lambda: cls._parser.getfloat("api", "connect_timeout", fallback=3.05),
+            "api_read_timeout": lambda: cls._parser.getfloat("api", "read_timeout", fallback=30),
+            "api_timeout_multiplier": lambda: cls._parser.getfloat("api", "timeout_multiplier", fallback=3.0),
+            "api_min_timeout": lambda: cls._parser.getfloat("api", "min_timeout", fallback=1.0),
+            "api_hedge_quantile": lambda: cls._parser.getfloat("api", "hedge_quantile", fallback=0),
+            "api_health_path": lambda: cls._parser.get("api", "health_path", fallback="/"),
+            "api_health_check_interval": lambda: cls._parser.getfloat("api", "health_check_interval", fallback=5),
+            "api_eject_after_failures": lambda: cls._parser.getint("api", "eject_after_failures", fallback=5),
+            # proxy
+            "proxy_urls": lambda: cls._parser.get("proxy", "urls", fallback=""),
+            "proxy_cooldown": lambda: cls._parser.getfloat("proxy", "cooldown", fallback=30),
+            "proxy_max_cooldown": lambda: cls._parser.getfloat("proxy", "max_cooldown", fallback=600),
+            "proxy_throttle_codes": lambda: cls._parser.get("proxy", "throttle_codes", fallback="-460,405"),
+            # wal
+            "wal_directory": lambda: cls._parser.get("wal", "directory", fallback="wal"),
+            "wal_segment_size": lambda: cls._parser.getint("wal", "segment_size", fallback=64 * 1024 * 1024),
+            "wal_max_pending_bytes": lambda: cls._parser.getint("wal", "max_pending_bytes",
+                                                                fallback=1024 * 1024 * 1024),
+            "wal_batch_size": lambda: cls._parser.getint("wal", "batch_size", fallback=500),
+            # tracing
+            "tracing_sample_rate": lambda: cls._parser.getfloat("tracing", "sample_rate", fallback=0.001),
+            "tracing_file_path": lambda: cls._parser.get("tracing", "file_path", fallback="logs/traces.jsonl"),
+            "tracing_file_max_bytes": lambda: cls._parser.getint("tracing", "file_max_bytes",
+                                                                 fallback=64 * 1024 * 1024),
+            "tracing_file_backup_count": lambda: cls._parser.getint("tracing", "file_backup_count", fallback=5),
+            # journal
+            "journal_directory": lambda: cls._parser.get("journal", "directory", fallback="journal"),
+            "journal_segment_size": lambda: cls._parser.getint("journal", "segment_size", fallback=64 * 1024 * 1024),
+            "journal_max_segments": lambda: cls._parser.getint("journal", "max_segments", fallback=0),
+            # state
+            "state_file_path": lambda: cls._parser.get("state", "file_path", fallback="state/fetchers.json"),
+            "state_save_interval": lambda: cls._parser.getfloat("state", "save_interval", fallback=10),
+            # monitor
+            "monitor_straggler_factor": lambda: cls._parser.getfloat("monitor", "straggler_factor", fallback=3.0),
+            "monitor_straggler_min_remaining": lambda: cls._parser.getint("monitor", "straggler_min_remaining",
+                                                                          fallback=60),
+            # scheduler
+            "scheduler_budget": lambda: cls._parser.getint("scheduler", "budget", fallback=16),
+            "scheduler_job_threads": lambda: cls._parser.getint("scheduler", "job_threads", fallback=64),
+            # breaker
+            "breaker_window": lambda: cls._parser.getint("breaker", "window", fallback=20),
+            "breaker_failure_rate": lambda: cls._parser.getfloat("breaker", "failure_rate", fallback=0.5),
+            "breaker_min_calls": lambda: cls._parser.getint("breaker", "min_calls", fallback=10),
+            "breaker_probe_interval": lambda: cls._parser.getfloat("breaker", "probe_interval", fallback=5),
+            "breaker_probe_uid": lambda: cls._parser.getint("breaker", "probe_uid", fallback=0),
+            "breaker_settle_time": lambda: cls._parser.getfloat("breaker", "settle_time", fallback=60),
+            # profiler
+            "profiler_max_duration": lambda: cls._parser.getfloat("profiler", "max_duration", fallback=60),
         }
         # 遍历加载
         for key, getter in fields.items():
@@ -113,9 +218,15 @@ def get_mongo_database():
 
 
 _loggers: Dict[str, Logger] = {}
+_logger_listeners: Dict[str, QueueListener] = {}
 
 
 def get_logger(name: str) -> Logger:
+    """
+    获取日志记录器
+    -------------
+    日志经由有界队列交给单独的写入线程写入文件，队列已满时丢弃日志，记录日志的线程不会因磁盘 I/O 而阻塞
+    """
     if name in _loggers:
         return _loggers[name]
 
@@ -130,8 +241,20 @@ def get_logger(name: str) -> Logger:
         encoding=Config.logger_log_file_encoding
     )
     handler.setFormatter(Formatter(Config.logger_format))
-    logger.addHandler(handler)
+    queue_handler, listener = queued(handler, maxsize=int(Config.logger_queue_size))
+    logger.addHandler(queue_handler)
+    listener.start()
 
     _loggers[name] = logger
+    _logger_listeners[name] = listener
 
     return logger
+
+
+def shutdown_loggers():
+    """停止所有日志记录器的写入线程，已入队的日志会先被写入"""
+    for name in list(_logger_listeners):
+        listener = _logger_listeners.pop(name)
+        listener.stop()
+        for handler in (*_loggers.pop(name).handlers, *listener.handlers):
+            handler.close()
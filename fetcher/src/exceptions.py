@@ -24,6 +24,10 @@ class ExplicitlySkipHandlingError(Exception):
     """明确跳过处理错误，用于处理器中，将导致当前作业的单个处理步骤被跳过"""
 
 
+class ExplicitlyRetryHandlingError(Exception):
+    """明确重试处理错误，用于处理器中，将导致当前索引被放入重试队列稍后重试（若作业未配置重试队列，则视为跳过）"""
+
+
 class UserNotFoundError(ExplicitlySkipHandlingError):
     """用户未找到错误"""
 
@@ -41,3 +45,7 @@ class ConfigNotLoadedError(ConfigError):
 
 class JobCancelError(Exception):
     """作业取消错误，用于中断作业执行"""
+
+
+class ProfilerBusyError(RuntimeError):
+    """剖析器忙碌错误，同一时间只允许进行一次剖析"""
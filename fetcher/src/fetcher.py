@@ -1,36 +1,37 @@
 #!/usr/env python3
 import math
+import time
 from abc import ABC
-from concurrent.futures import (Executor, Future, ThreadPoolExecutor,
-                                as_completed)
+from concurrent.futures import Future, as_completed
 from inspect import Parameter
 from itertools import islice
-from typing import Callable, Dict, Iterable, List, Optional
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Set
 
 from pyee import AsyncIOEventEmitter
 
+from .breaker import CircuitBreaker
 from .flag import ThreadFlag
 from .job import Handlers, IndexJob
+from .retry import RetryQueue
+from .scheduler import FairScheduler, FairShare, JobLane, JobPool
 from .span import StepSpan
 from .status import IStatus
+from .tracing import Tracer
 from .util import jump_step, repr_injector
 
-_executor_factory_type = Optional[Callable[[], Executor]]
-
-
 class BaseFetcher(IStatus, ABC):
     __counter = 0
 
-    def __init__(self, name=None, emitter=None, thread_weights=None, executor_factory: _executor_factory_type = None):
+    def __init__(self, name=None, emitter=None, thread_weights=None, pool: Optional[JobPool] = None):
         self.name = name or self.__class__.__name__
         self.thread_weights = thread_weights or [1]
+        # 运行作业的作业池，多个抓取器可以共享；同时运行的作业数与线程权重的数量一致，调整大小时随之调整
+        self.pool = pool or JobPool()
 
         self._emitter = emitter or AsyncIOEventEmitter()
         self._flag = ThreadFlag(ThreadFlag.pending)
         self._handlers: Dict[Callable[..., None], Parameter] = {}
-        self._executor_factory = executor_factory or (
-            lambda: ThreadPoolExecutor(thread_name_prefix=self.name)
-        )
 
     def __str__(self):
         return f"[{self.__class__.__name__}]" \
@@ -70,17 +71,34 @@ class IndexFetcher(BaseFetcher, StepSpan):
 
     def __init__(self, begin: int, end: Optional[int] = None, step: int = 1,
                  jump_step_func: Callable[[], Iterable[int]] = None, name: Optional[str] = None, emitter=None,
-                 thread_weights=None, executor_factory: _executor_factory_type = None):
+                 thread_weights=None, pool: Optional[JobPool] = None,
+                 retry_queue: Optional[RetryQueue] = None, tracer: Optional[Tracer] = None,
+                 scheduler: Optional[FairScheduler] = None, priority: float = 1.0,
+                 breaker: Optional[CircuitBreaker] = None):
 
         self.jump_step_func = jump_step_func or jump_step
         self.handlers = Handlers()
+        self.retry_queue = retry_queue
+        self.tracer = tracer
+        # 多个抓取器共享同一个调度器时，所有作业同时进行中的探测数受其全局额度限制，并按 priority 加权公平分配
+        self.scheduler = scheduler
+        self._priority = priority
+        self._share: Optional[FairShare] = None
+        # 上游熔断器，熔断时所有作业在当前位置暂停，可与其它抓取器共享
+        self.breaker = breaker
 
         self._jobs: List[IndexJob] = []
         self._job_futures: Dict[IndexJob, Future] = {}
-        self._executor: Optional[Executor] = None
+        self._lane: Optional[JobLane] = None
+        self._resize_lock = Lock()
+        self._stop_requested = False
+        # 已移除的（正常结束的）作业中重试次数耗尽的索引
+        self._failed_retries: Set[int] = set()
+        # 从持久化的进度恢复时，启动后只处理这些区间以及停止时尚未得到重试结果的索引
+        self._restored_spans: Optional[List[StepSpan]] = None
+        self._restored_retries: List[int] = []
 
-        BaseFetcher.__init__(self, name=name, emitter=emitter, thread_weights=thread_weights,
-                             executor_factory=executor_factory)
+        BaseFetcher.__init__(self, name=name, emitter=emitter, thread_weights=thread_weights, pool=pool)
         StepSpan.__init__(self, begin, end, step)
         # 如果自己的区间长度还没有线程权重长，那么将退化为使用一个线程，即线程权重为 [1]
         if len(self) < len(self.thread_weights):
@@ -97,34 +115,239 @@ class IndexFetcher(BaseFetcher, StepSpan):
     def emitter(self):
         return self._emitter
 
+    @property
+    def priority(self) -> float:
+        return self._priority
+
+    @priority.setter
+    def priority(self, value: float):
+        if value <= 0:
+            raise ValueError(f"The priority must be positive: {value!r}")
+        self._priority = value
+        if self._share is not None:
+            self._share.weight = value
+        if self._lane is not None:
+            self._lane.weight = value
+
+    @property
+    def idle_workers(self) -> int:
+        """还能立即开始运行的作业数"""
+        lane = self._lane
+        return 0 if lane is None else lane.idle
+
     def start(self):
         if ThreadFlag.stopping in self._flag:
             raise RuntimeError(f"Cannot stop a Fetcher that has already stopped.")
         self._jobs.clear()
         self._job_futures.clear()
-        self._executor = self._executor_factory()
-        for job in self.job_iter():
+        self._lane = self.pool.register(self.name, len(self.thread_weights), self._priority, self._yield_job)
+        if self.scheduler is not None:
+            self._share = self.scheduler.register(self.name, self._priority)
+        if self.retry_queue is not None:
+            self.retry_queue.start()
+        if self._restored_spans is None or self.step == 0:
+            jobs = self.job_iter()
+        else:
+            spans = self._restored_spans + [StepSpan(i, i, self.step) for i in self._restored_retries
+                                            if not any(span.contain(i) for span in self._restored_spans)]
+            jobs = (self._job_factory(begin, end) for begin, end in self._partition(spans))
+        for job in jobs:
             self._jobs.append(job)
-            self._job_futures[job] = self._executor.submit(job)
+            self._job_futures[job] = self._lane.submit(job)
         self._flag -= ThreadFlag.pending
         self._flag += ThreadFlag.running
 
+    def restore(self, spans: Iterable[StepSpan], pending_retries: Iterable[int] = ()):
+        """
+        以之前保存的剩余区间（见 remaining_spans）代替整个区间，启动后只处理这些区间
+        - pending_retries 为之前尚未得到重试结果的索引（见 pending_retries），它们可能位于剩余区间之前，启动后重新处理
+        """
+        if ThreadFlag.pending not in self._flag:
+            raise RuntimeError("Cannot restore a Fetcher that has already started.")
+        self._restored_spans = list(spans)
+        self._restored_retries = sorted(set(pending_retries))
+
+    def remaining_spans(self) -> List[StepSpan]:
+        """尚需处理的区间，可用于保存进度，之后通过 restore 恢复"""
+        if ThreadFlag.pending in self._flag:
+            if self._restored_spans is not None:
+                return self._restored_spans.copy()
+            return [StepSpan(self.begin, self.end, self.step)]
+        with self._resize_lock:
+            spans = (job.remaining_span() for job in self._jobs)
+            return [span for span in spans if span is not None]
+
+    def pending_retries(self) -> List[int]:
+        """尚未得到重试结果的索引，与 remaining_spans 一同保存，之后通过 restore 恢复"""
+        if ThreadFlag.pending in self._flag:
+            return self._restored_retries.copy()
+        with self._resize_lock:
+            return sorted({i for job in self._jobs for i in job.pending_retries})
+
+    def failed_retries(self) -> List[int]:
+        """重试次数耗尽的索引，结算区间登记表时不计入已完成"""
+        with self._resize_lock:
+            return sorted(self._failed_retries.union(*(job.failed_retries for job in self._jobs)))
+
     def join(self, timeout=None):
-        for future in as_completed(self._job_futures.values(), timeout=timeout):
-            exc = future.exception(timeout=timeout)
-            if exc is not None:
-                raise exc  # 理论上来讲这里只会抛出 AssertionError
+        # 调整大小时会提交新的作业，因此要反复等待，直到没有未等待过的作业
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = set()
+        while True:
+            futures = [future for future in list(self._job_futures.values()) if future not in waited]
+            if not futures:
+                return
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            for future in as_completed(futures, timeout=remaining):
+                waited.add(future)
+                exc = future.exception()
+                if exc is not None:
+                    raise exc  # 理论上来讲这里只会抛出 AssertionError
 
     def stop(self, timeout=None):
         if ThreadFlag.pending in self._flag:
             return
-        for job in self._jobs:
-            job.cancel()
+        # 与调整大小互斥，保证停止之后不会再有新的作业被提交
+        with self._resize_lock:
+            self._stop_requested = True
+            for job in self._jobs:
+                job.cancel()
         self.join(timeout)
-        self._executor.shutdown()
+        self._lane.close()
+        if self.retry_queue is not None:
+            self.retry_queue.stop(timeout)
+        if self._share is not None:
+            self.scheduler.unregister(self._share)
         self._flag -= ThreadFlag.running
         self._flag += ThreadFlag.stopping
 
+    def resize(self, thread_weights) -> List[IndexJob]:
+        """
+        调整运行中的抓取器的线程数与线程权重
+        --------------------------------
+        - 截下所有作业中尚未访问过的区间（尚未开始的作业整个取消），合并相邻的区间后按新的权重重新划分为新的作业
+        - 同时运行的作业数随之调整为新的线程数，正在运行的作业处理完已访问的部分后自然结束，它们也计入其中，
+          因此任何时候运行中的作业都不会超过新的线程数
+        - 返回新创建的作业
+        """
+        if ThreadFlag.running not in self._flag:
+            raise RuntimeError("Cannot resize a Fetcher that is not running.")
+        if self.step == 0:
+            raise ValueError("Cannot resize a Fetcher whose step is 0.")
+        if math.isinf(self.end):
+            raise ValueError("Cannot resize a Fetcher whose end is infinite.")
+
+        with self._resize_lock:
+            if self._stop_requested:
+                raise RuntimeError("Cannot resize a Fetcher that is stopping.")
+            self.thread_weights = thread_weights
+            self._prune_finished()
+            spans = []
+            for job in self._jobs.copy():
+                future = self._job_futures[job]
+                if future.cancel():
+                    self._jobs.remove(job)
+                    self._job_futures.pop(job)
+                    spans.append(StepSpan(job.begin, job.end, job.step))
+                    continue
+                span = job.truncate()
+                if span is not None:
+                    spans.append(span)
+
+            self._lane.limit = len(self.thread_weights)
+
+            jobs = [self._job_factory(begin, end) for begin, end in self._partition(spans)]
+            for job in jobs:
+                self._jobs.append(job)
+                self._job_futures[job] = self._lane.submit(job)
+
+        self._emitter.emit("IndexFetcher.resized", self, jobs)
+        return jobs
+
+    def split(self, job: IndexJob, keep: float = 0.5) -> Optional[IndexJob]:
+        """
+        拆分作业
+        -------
+        - 作业保留从未访问过的尾部区间的前 keep 部分，剩余部分作为新的作业提交到执行器中，返回新的作业
+        - 没有可拆分的部分或抓取器不在运行时返回 None
+        """
+        new_job = self._split(job, keep)
+        if new_job is not None:
+            self._emitter.emit("IndexFetcher.split", self, job, new_job)
+        return new_job
+
+    def _split(self, job: IndexJob, keep: float) -> Optional[IndexJob]:
+        with self._resize_lock:
+            if self._stop_requested or ThreadFlag.running not in self._flag or job not in self._job_futures:
+                return None
+            span = job.truncate(keep)
+            if span is None:
+                return None
+            self._prune_finished()
+            new_job = self._job_factory(span.begin, span.end)
+            self._jobs.append(new_job)
+            self._job_futures[new_job] = self._lane.submit(new_job)
+        return new_job
+
+    def _yield_job(self) -> bool:
+        """
+        作业池请求让出线程时调用：截下一个运行中的作业尚未访问过的整个尾部区间，作为排队的新作业，
+        该作业处理完已访问的部分后结束，让出线程；没有可以截断的作业时返回 False
+        """
+        for job in self.jobs:
+            future = self._job_futures.get(job)
+            if future is None or not future.running():
+                continue
+            new_job = self._split(job, 0.0)
+            if new_job is not None:
+                self._emitter.emit("IndexFetcher.preempted", self, job, new_job)
+                return True
+        return False
+
+    def _prune_finished(self):
+        """
+        移除已正常结束的作业（调用者需持有 _resize_lock），调整大小与拆分会不断产生新的作业，
+        不移除时 jobs 以及监视器每个 tick 的开销会随历史作业的数量增长；重试次数耗尽的索引并入抓取器保留
+        """
+        for job in self._jobs.copy():
+            if self._job_futures[job].done() and job.remaining_span() is None:
+                self._failed_retries.update(job.failed_retries)
+                self._jobs.remove(job)
+                self._job_futures.pop(job)
+
+    def _partition(self, spans: List[StepSpan]):
+        """将若干互不相交的区间按线程权重划分，划分点落在区间的空隙处时，一份会被拆成多个作业"""
+        pieces = []
+        for span in sorted(spans, key=lambda span_: span_.begin * self.step):
+            # 终点统一对齐到步长上
+            end = span.begin + (span.end - span.begin) // self.step * self.step
+            if pieces and pieces[-1][1] + self.step == span.begin:
+                pieces[-1] = (pieces[-1][0], end)
+            else:
+                pieces.append((span.begin, end))
+        counts = [(end - begin) // self.step + 1 for begin, end in pieces]
+        total = sum(counts)
+        if total == 0:
+            return
+
+        piece_index = 0
+        offset = 0
+        position = 0
+        accumulated_weight = 0
+        for n, weight in enumerate(self.thread_weights):
+            accumulated_weight += weight
+            stop = total if n == len(self.thread_weights) - 1 else round(total * accumulated_weight)
+            while position < stop:
+                begin, _ = pieces[piece_index]
+                size = min(stop - position, counts[piece_index] - offset)
+                job_begin = begin + offset * self.step
+                yield job_begin, job_begin + (size - 1) * self.step
+                position += size
+                offset += size
+                if offset == counts[piece_index]:
+                    piece_index += 1
+                    offset = 0
+
     def job_iter(self):
         if self.step == 0:
             all_indexes_to_work = [self.begin]
@@ -152,7 +375,8 @@ class IndexFetcher(BaseFetcher, StepSpan):
                 yield self._job_factory(job_begin, job_end)
 
     def _job_factory(self, begin, end):
-        job = IndexJob(begin, end, self.step, self.jump_step_func, self.emitter)
+        job = IndexJob(begin, end, self.step, self.jump_step_func, self.emitter, self.retry_queue, self.tracer,
+                       self._share, self.breaker)
         # 继承自身的处理器
         job.handlers = Handlers(self.handlers)
         return job
@@ -1,40 +1,104 @@
 #!/usr/env python3
+import asyncio
 import math
 import sys
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import Future
 from contextlib import contextmanager
 from copy import copy
 from functools import partial
-from inspect import signature
+from inspect import iscoroutinefunction, signature
 from itertools import count
-from typing import Callable, Iterable, Optional, Union
+from threading import Condition, Event, Lock, Thread, current_thread, local
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional,
+                    Set, Union)
 
 from pyee import AsyncIOEventEmitter
 
-from .exceptions import (ExplicitlySkipHandlingError,
+from .exceptions import (ExplicitlyRetryHandlingError,
+                         ExplicitlySkipHandlingError,
                          ExplicitlyStopHandlingError, JobCancelError)
 from .flag import JobStepFlag
 from .span import StepSpan, WorkSpan
 from .status import IStatus
+from .tracing import Tracer, span
 from .util import jump_step, repr_injector
 
+if TYPE_CHECKING:
+    from .breaker import CircuitBreaker
+    from .retry import RetryQueue
+    from .scheduler import FairShare
+
 _handler_type = Union[Callable[[int, "BaseJob"], None], Callable[[int], None]]
 
 
+class CompiledHandlers(NamedTuple):
+    # 逐个索引调用的分发函数
+    dispatch: Callable[[int], None]
+    # 作业结束时交付批量处理器中剩余索引的冲刷函数
+    flush: Callable[[], None]
+    # ((处理器, 适配函数), ...)，供追踪时逐个处理器记录跨度
+    adapters: tuple
+    # 成块探测函数，接收一块候选索引，返回 {索引: True / False / 异常实例}，没有探测处理器时为 None
+    probe: Optional[Callable[[List[int]], Dict[int, Any]]]
+    # 每块候选索引的数量
+    probe_size: int
+
+
+def _copy_exception(e: BaseException) -> BaseException:
+    """复制异常（不包括堆栈），原异常作为其 __cause__ 保留；无法复制时返回原异常"""
+    try:
+        copied = copy(e)
+    except Exception:
+        return e
+    copied.__cause__ = e
+    return copied
+
+
 class Handlers(object):
+    """
+    处理器集合
+    ---------
+    - 添加处理器时可通过 kind 指定处理器的种类：
+        - sync：普通函数，签名为 (i) 或 (i, job)
+        - async：协程函数，签名同上，在作业线程自己的事件循环中运行
+        - batch：批量处理器，签名为 (indexes) 或 (indexes, job)，只会收到通过了之前所有处理器的索引，
+          每攒够 batch_size 个索引或作业结束时调用一次，其异常不影响索引的有效性，而是通过 "IndexJob.batch_error" 事件发出
+        - probe：探测处理器，签名为 (indexes) 或 (indexes, job)，一次收到状态机接下来将要访问的至多 batch_size 个候选索引，
+          返回与之一一对应的有效性序列，或者 {索引: 有效性} 的映射（缺少的索引视为无效）；有效性可以是布尔值，
+          也可以是异常实例，比如 ExplicitlyRetryHandlingError()，此时相当于处理该索引时抛出了这个异常。
+          探测处理器先于其它处理器执行，其它处理器只会收到探测有效的索引
+      缺省为 auto，即协程函数视为 async，其余视为 sync
+    - 作业开始时通过 compile 将所有处理器编译为一个分发函数，每个处理器的适配方式只在编译时确定一次
+    - 复制是写时复制的，作业继承抓取器的处理器集合时不会复制底层的字典
+    """
+
+    KINDS = ("auto", "sync", "async", "batch", "probe")
+
     def __init__(self, handlers=None):
         if isinstance(handlers, Handlers):
-            self._data = handlers._data.copy()
+            self._data = handlers._data
+            self._options = handlers._options
+            # 双方都标记为共享，任意一方修改前都需要先复制
+            self._shared = handlers._shared = True
         else:
             self._data = handlers or {}
+            self._options = {}
+            self._shared = False
 
     def add(self, handler: _handler_type = None, **kwargs):
         if handler is None:
             return partial(self.add, **kwargs)
 
+        kind = kwargs.get("kind", "auto")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown handler kind: {kind!r}")
+
         handler_sig = signature(handler)
 
+        self._own()
         self._data[handler] = handler_sig.parameters
+        self._options[handler] = kwargs
 
         return handler
 
@@ -42,11 +106,152 @@ class Handlers(object):
         return self._data.items()
 
     def clear(self):
+        self._own()
+        self._options.clear()
         return self._data.clear()
 
     def pop(self, k):
+        self._own()
+        self._options.pop(k, None)
         return self._data.pop(k)
 
+    def compile(self, job: "BaseJob") -> CompiledHandlers:
+        pairs = []
+        flushes = []
+        probes = []
+        probe_size = None
+        for handler, params in self._data.items():
+            options = self._options.get(handler, {})
+            if len(params) not in (1, 2):
+                raise ValueError(f"Unsupported handler: {handler}")
+            if options.get("kind") == "probe":
+                probes.append((handler, len(params)))
+                size = options.get("batch_size", 100)
+                probe_size = size if probe_size is None else min(probe_size, size)
+                continue
+            adapter, flush = self._adapt(handler, len(params), options, job)
+            pairs.append((handler, adapter))
+            if flush is not None:
+                flushes.append(flush)
+        pairs = tuple(pairs)
+
+        def flush_all():
+            for flush_ in flushes:
+                flush_()
+
+        if not pairs:
+            dispatch = lambda i: None
+        elif len(pairs) == 1:
+            dispatch = pairs[0][1]
+        else:
+            adapters = tuple(adapter_ for _, adapter_ in pairs)
+
+            def dispatch(i):
+                for adapter_ in adapters:
+                    adapter_(i)
+
+        probe = self._compile_probes(probes, job) if probes else None
+        return CompiledHandlers(dispatch, flush_all, pairs, probe, probe_size or 1)
+
+    def _own(self):
+        if self._shared:
+            self._data = self._data.copy()
+            self._options = self._options.copy()
+            self._shared = False
+
+    @staticmethod
+    def _compile_probes(probes, job: "BaseJob"):
+        last = len(probes) - 1
+
+        def probe(indexes: List[int]) -> Dict[int, Any]:
+            results = dict.fromkeys(indexes, True)
+            pending = indexes
+            for n, (handler, param_count) in enumerate(probes):
+                # noinspection PyBroadException
+                try:
+                    result = handler(pending) if param_count == 1 else handler(pending, job)
+                    # 大多数探测处理器直接返回列表，跳过较慢的抽象基类检查
+                    if type(result) is not list:
+                        if isinstance(result, Mapping):
+                            result = [result.get(i, False) for i in pending]
+                        else:
+                            result = list(result)
+                    if len(result) != len(pending):
+                        raise ValueError(f"The probe handler {handler} returned {len(result)} results "
+                                         f"for {len(pending)} indexes")
+                except Exception as e:
+                    # 整块探测失败时，块中的每个索引都视为抛出了同样的异常，但各自是独立的异常对象，
+                    # 之后逐个抛出时堆栈不会叠加在同一个对象上
+                    result = [_copy_exception(e) for _ in pending]
+                for i, valid in zip(pending, result):
+                    if valid is not True and valid is not False:
+                        valid = valid if isinstance(valid, BaseException) else bool(valid)
+                    results[i] = valid
+                if n == last:
+                    break
+                pending = [i for i in pending if results[i] is True]
+                if not pending:
+                    break
+            return results
+
+        return probe
+
+    @staticmethod
+    def _adapt(handler, param_count: int, options: dict, job: "BaseJob"):
+        kind = options.get("kind", "auto")
+        if kind == "auto":
+            kind = "async" if iscoroutinefunction(handler) else "sync"
+
+        if kind == "sync":
+            if param_count == 1:
+                return handler, None
+            return lambda i: handler(i, job), None
+
+        if kind == "async":
+            def async_adapter(i):
+                coroutine = handler(i) if param_count == 1 else handler(i, job)
+                return _thread_event_loop().run_until_complete(coroutine)
+
+            return async_adapter, None
+
+        batch_size = options.get("batch_size", 100)
+        buffer: List[int] = []
+        lock = Lock()
+
+        def flush():
+            nonlocal buffer
+            with lock:
+                indexes, buffer = buffer, []
+            if not indexes:
+                return
+            # noinspection PyBroadException
+            try:
+                if param_count == 1:
+                    handler(indexes)
+                else:
+                    handler(indexes, job)
+            except Exception:
+                job.emitter.emit("IndexJob.batch_error", job, indexes, sys.exc_info())
+
+        def batch_adapter(i):
+            with lock:
+                buffer.append(i)
+                full = len(buffer) >= batch_size
+            if full:
+                flush()
+
+        return batch_adapter, flush
+
+
+_local = local()
+
+
+def _thread_event_loop():
+    loop = getattr(_local, "loop", None)
+    if loop is None:
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop
+
 
 @repr_injector
 class BaseJob(IStatus, metaclass=ABCMeta):
@@ -54,6 +259,10 @@ class BaseJob(IStatus, metaclass=ABCMeta):
         self.handlers = Handlers()
         self._emitter = emitter or AsyncIOEventEmitter()
         self._flag: JobStepFlag = flag or JobStepFlag(JobStepFlag.pending)
+        # 取消时设置，等待中的作业线程（见 wait）会被立即唤醒
+        self._cancel_event = Event()
+        self._cancel_lock = Lock()
+        self._cancel_waiters: Set[Event] = set()
 
     def __call__(self, *args, **kwargs):
         return self.run()
@@ -84,9 +293,44 @@ class BaseJob(IStatus, metaclass=ABCMeta):
             self._flag -= JobStepFlag.running
             self._flag += JobStepFlag.stopping
 
+    @property
+    def cancel_event(self) -> Event:
+        """作业被取消时设置的事件，耗时较长的处理器可以用它代替 time.sleep 等待，以便及时退出"""
+        return self._cancel_event
+
     def cancel(self):
+        # 已结束的作业无需取消
+        if JobStepFlag.stopping in self.flag:
+            return
         self._flag -= JobStepFlag.running
         self._flag += JobStepFlag.canceling
+        with self._cancel_lock:
+            self._cancel_event.set()
+            waiters = list(self._cancel_waiters)
+        for waiter in waiters:
+            waiter.set()
+
+    def wait(self, future: Future, timeout: Optional[float] = None):
+        """
+        等待 future 完成并返回其结果
+        --------------------------
+        - 作业被取消时立即停止等待，尝试取消 future 并抛出 JobCancelError，作业线程不会被进行中的请求拖住
+        - 超时抛出 concurrent.futures.TimeoutError
+        """
+        done = Event()
+        future.add_done_callback(lambda _: done.set())
+        with self._cancel_lock:
+            self._cancel_waiters.add(done)
+        try:
+            if not self._cancel_event.is_set():
+                done.wait(timeout)
+        finally:
+            with self._cancel_lock:
+                self._cancel_waiters.discard(done)
+        if not future.done() and self._cancel_event.is_set():
+            future.cancel()
+            raise JobCancelError
+        return future.result(0)
 
     def _try_cancel(self):
         if JobStepFlag.canceling in self.flag:
@@ -94,16 +338,43 @@ class BaseJob(IStatus, metaclass=ABCMeta):
 
 
 class IndexJob(BaseJob, WorkSpan):
+    # 每次探测前以及作业结束时在作业线程中调用的钩子，用于剖析等需要在作业线程中执行的诊断功能
+    probe_hook: Optional[Callable[["IndexJob", bool], None]] = None
 
     def __init__(self, begin: int, end: Optional[int] = None, step: int = 1,
-                 jump_step_func: Callable[[], Iterable[int]] = None, emitter=None):
+                 jump_step_func: Callable[[], Iterable[int]] = None, emitter=None,
+                 retry_queue: Optional["RetryQueue"] = None, tracer: Optional[Tracer] = None,
+                 share: Optional["FairShare"] = None, breaker: Optional["CircuitBreaker"] = None):
 
         self.jump_step_func = jump_step_func or jump_step
         self.job_span = StepSpan(begin, end, step)
+        self.retry_queue = retry_queue
+        self.tracer = tracer
+        # 全局调度器中所属抓取器的份额，设置时每次处理（或成块探测）都需要先取得一个并发额度
+        self.share = share
+        # 上游熔断器，熔断期间作业在当前位置暂停，恢复后继续
+        self.breaker = breaker
 
         self._break_point_span: Optional[StepSpan] = None
         self._break_point_current: Optional[int] = None
         self._reverse_leaping_first_unaccepted_value: Optional[int] = None
+        # 重试相关：等待重试结果的索引数量、跃进时被推迟的索引、重试后确认有效而需要重新步进的种子索引
+        self._retry_cond = Condition()
+        self._deferred_count = 0
+        # 尚未得到重试结果的索引，停止时被重试队列丢弃的索引也保留在其中，随进度一同保存
+        self._pending_retries: Set[int] = set()
+        # 重试次数耗尽（或重试时出现意外异常）的索引，不能视为已完成
+        self._failed_retries: Set[int] = set()
+        # 跃进时被推迟的索引与重试后确认有效的种子索引，值为推迟时所在跃进的起点（跃进前遇到的第一个无效索引）；
+        # 停止时仍未处理完的索引连同其起点保留下来，恢复点退回到最早的起点（见 remaining_span）
+        self._leap_deferred: Dict[int, int] = {}
+        self._revisit_seeds: Dict[int, int] = {}
+        self._thread: Optional[Thread] = None
+        # 保护区间边界：作业线程移动当前索引、切换断点时，与其它线程截断区间互斥
+        self._bounds_lock = Lock()
+        self._compiled: Optional[CompiledHandlers] = None
+        # 探测处理器对候选索引的探测结果，由状态机逐个消费
+        self._probe_results: Dict[int, Any] = {}
 
         BaseJob.__init__(self, emitter=emitter)
         WorkSpan.__init__(self, begin, end, step)
@@ -114,7 +385,7 @@ class IndexJob(BaseJob, WorkSpan):
     def __eq__(self, other):
         if not isinstance(other, IndexJob):
             return False
-        return self.__dict__ == other.__dict__
+        return self.__dict__ == other.__dict__ and self._key() == other._key()
 
     def __hash__(self):
         # NOTE: 重写基类 WorkSpan 的 __hash__ 方法，我们希望这个类是按其在内存中的地址进行 hash 计算的，即基类 BaseJob 的算法
@@ -124,6 +395,11 @@ class IndexJob(BaseJob, WorkSpan):
     def emitter(self):
         return self._emitter
 
+    @property
+    def thread(self) -> Optional[Thread]:
+        """作业最近一次运行所在的线程"""
+        return self._thread
+
     @contextmanager
     def list(self, handler: _handler_type = None, only_index=True, record_valid_data=True):
         result = []
@@ -149,12 +425,18 @@ class IndexJob(BaseJob, WorkSpan):
             self._set_current(current)
 
     def run(self):
-        self._worked_span = None
+        self._reset_worked_span()
+        self._thread = current_thread()
+        with self._retry_cond:
+            self._leap_deferred.clear()
+            self._revisit_seeds.clear()
         with self._work():
             err_info = (None, None, None)
             # noinspection PyBroadException
             try:
                 self._emitter.emit("IndexJob.running", self)
+                # 每次运行前重新编译，处理器签名不受支持时作业在开始时即以异常结束
+                self._compile_handlers()
                 self._current = self.job_span.begin
                 self._flag += JobStepFlag.stepping
                 # 循环处理，下面是步骤简化图：
@@ -167,13 +449,19 @@ class IndexJob(BaseJob, WorkSpan):
                 #  |     \  v
                 # 反向步进<--反向跃进
                 #
-                while True:
-                    self._emitter.emit("IndexJob.step_switch", self)
-
-                    if JobStepFlag.stepping in self.flag:
-                        self._handle_stepping()
-                    elif JobStepFlag.leaping in self.flag:
-                        self._handle_leaping()
+                try:
+                    while True:
+                        self._emitter.emit("IndexJob.step_switch", self)
+                        self._revisit_retried()
+
+                        if JobStepFlag.stepping in self.flag:
+                            self._handle_stepping()
+                        elif JobStepFlag.leaping in self.flag:
+                            self._handle_leaping()
+                except IndexError:
+                    # 扫描已到达终点，但仍需等待重试队列中属于本作业的索引处理完毕
+                    self._wait_retried()
+                    raise
             except IndexError:
                 err_info = sys.exc_info()
             except JobCancelError:
@@ -191,8 +479,169 @@ class IndexJob(BaseJob, WorkSpan):
                 self._break_point_span = None
                 self._break_point_current = None
                 self._reverse_leaping_first_unaccepted_value = None
+                self._probe_results = {}
+                # 无论作业如何结束，都将批量处理器中已通过的索引交付出去
+                self._flush_handlers()
+                if IndexJob.probe_hook is not None:
+                    IndexJob.probe_hook(self, True)
                 self._emitter.emit("IndexJob.stopped", self, err_info)
 
+    @property
+    def resume_point(self) -> int:
+        """
+        恢复点：从该索引开始重新扫描，不会遗漏任何尚未确认的区域
+        - 正向步进时为当前索引
+        - 跃进以及反向跃进、反向步进时，为跃进前遇到的第一个无效索引，其后跳过的区域尚未被反向填补
+        """
+        if self._worked_min is None:
+            return self.begin
+        first_unaccepted_value = self._reverse_leaping_first_unaccepted_value
+        if first_unaccepted_value is not None and (
+                JobStepFlag.leaping in self.flag or JobStepFlag.reverse in self.flag):
+            return first_unaccepted_value
+        return self.current
+
+    def remaining_span(self) -> Optional[StepSpan]:
+        """
+        尚需处理的区间：作业正常结束时为 None，尚未开始时为整个区间，否则为恢复点到终点
+        - 跃进时被推迟而尚未得到重试结果的索引、重试后确认有效而尚未重新步进的种子索引，其两侧可能有被跃进跳过的有效区域，
+          此时从它们所在跃进的起点开始，重新扫描时会像原来一样跃进到这些索引并在其两侧补齐
+        """
+        flag = self.flag
+        if JobStepFlag.pending in flag:
+            return StepSpan(self.begin, self.end, self.step)
+        if JobStepFlag.stopping in flag and not (
+                JobStepFlag.stopping_with_canceled in flag or JobStepFlag.stopping_with_exception in flag):
+            return None
+        resume_point = self.resume_point
+        with self._retry_cond:
+            origins = [*self._leap_deferred.values(), *self._revisit_seeds.values()]
+        if origins:
+            earliest = min(origins) if self.step > 0 else max(origins)
+            if (earliest - resume_point) * self.step < 0:
+                resume_point = earliest
+        return StepSpan(resume_point, self.end, self.step)
+
+    def truncate(self, keep: float = 0.0) -> Optional[StepSpan]:
+        """
+        截断作业
+        -------
+        - 作业保留从未访问过的尾部区间的前 keep（0~1）部分，将终点收缩到该处，返回被截下的区间，没有可截断的部分时返回 None
+        - 可在作业运行时由其它线程调用，截断之后作业会像到达原终点一样正常结束，已访问区域内的处理（反向步进、重试等）不受影响
+        - 作业尚未开始时，至少保留起点
+        """
+        if self.step == 0:
+            return None
+        with self._bounds_lock:
+            if JobStepFlag.stopping in self.flag:
+                return None
+            if self._worked_min is None:
+                furthest = self.begin
+            else:
+                furthest = self._worked_max if self.step > 0 else self._worked_min
+            old_end = self.end
+            untouched_count = (old_end - furthest) // self.step
+            new_end = furthest + int(untouched_count * keep) * self.step
+            tail_begin = new_end + self.step
+            if (self.step > 0 and tail_begin > old_end) or (self.step < 0 and tail_begin < old_end):
+                return None
+
+            self.end = new_end
+            # 反向（反向跃进、反向步进）时作业区间是局部的，原方向的终点保存在断点中
+            if JobStepFlag.reverse not in self.flag:
+                self.job_span.end = new_end
+            if self._break_point_span is not None:
+                self._break_point_span.end = new_end
+        return StepSpan(tail_begin, old_end, self.step)
+
+    def cancel(self):
+        super().cancel()
+        # 唤醒等待重试结果的作业线程
+        with self._retry_cond:
+            self._retry_cond.notify_all()
+
+    def retry(self, i: int):
+        """在重试队列的工作线程中重新处理索引 i，异常会原样抛出，由重试队列决定后续的处理方式"""
+        self._handle(i)
+
+    @property
+    def pending_retries(self) -> List[int]:
+        """尚未得到重试结果的索引，包括停止时被重试队列丢弃的索引，恢复时需要重新处理"""
+        with self._retry_cond:
+            return sorted(self._pending_retries)
+
+    @property
+    def failed_retries(self) -> List[int]:
+        """重试次数耗尽（或重试时出现意外异常）的索引"""
+        with self._retry_cond:
+            return sorted(self._failed_retries)
+
+    def merge_retry_result(self, i: int, valid: bool, abandoned: bool = False, failed: bool = False):
+        """
+        合并重试结果
+        -----------
+        - 跃进过程中被推迟的索引若重试后确认有效，说明跃进跳过了可能有效的区域，将其作为种子，由作业线程在其两侧重新步进
+        - 步进过程中被推迟的索引已被视为有效，扫描没有跳过任何区域，无需修正
+        - abandoned 表示索引因停止或取消而未被重试，其仍保留在 pending_retries 中
+        - failed 表示索引的重试次数耗尽，其被移入 failed_retries
+        """
+        with self._retry_cond:
+            self._deferred_count -= 1
+            if not abandoned:
+                self._pending_retries.discard(i)
+            if failed:
+                self._failed_retries.add(i)
+            # 因停止而未被重试的索引仍需补齐其两侧，保留其跃进的起点
+            if i in self._leap_deferred and not abandoned:
+                origin = self._leap_deferred.pop(i)
+                if valid:
+                    self._revisit_seeds[i] = origin
+            self._retry_cond.notify_all()
+
+    def _defer(self, i: int):
+        with self._retry_cond:
+            self._deferred_count += 1
+            self._pending_retries.add(i)
+            if JobStepFlag.leaping in self.flag:
+                self._leap_deferred[i] = self._reverse_leaping_first_unaccepted_value
+        self.retry_queue.put(self, i)
+
+    def _revisit_retried(self):
+        while True:
+            with self._retry_cond:
+                if not self._revisit_seeds:
+                    return
+                seed, origin = self._revisit_seeds.popitem()
+            self._emitter.emit("IndexJob.revisiting", self, seed)
+            try:
+                with self._anchor():
+                    # 沿原方向和反方向分别步进，直到遇到无效索引或越界
+                    for step in (self.step, -self.step):
+                        if step == 0:
+                            break
+                        for i in count(seed + step, step):
+                            if not self.contain(i):
+                                break
+                            self._try_cancel()
+                            self._set_current(i)
+                            if not self.__safe_handle():
+                                break
+            except BaseException:
+                # 未完成的种子保留下来，停止后仍计入恢复点
+                with self._retry_cond:
+                    self._revisit_seeds[seed] = origin
+                raise
+
+    def _wait_retried(self):
+        while True:
+            self._revisit_retried()
+            with self._retry_cond:
+                if self._deferred_count == 0 and not self._revisit_seeds:
+                    return
+                if JobStepFlag.canceling not in self.flag:
+                    self._retry_cond.wait()
+            self._try_cancel()
+
     def _jumper(self, begin, sign):
         i = begin
         for d in self.jump_step_func():
@@ -205,20 +654,24 @@ class IndexJob(BaseJob, WorkSpan):
             self.__safe_handle()
             return
 
-        for i in count(self.current, self.job_span.step):
+        for i in self._prefetching(count(self.current, self.job_span.step)):
             self._try_cancel()
             self._set_current(i)
             if not self.__safe_handle():
                 break
 
     def _leap(self):
-        for i in self._jumper(self.current, self.job_span.step):
+        for i in self._prefetching(self._jumper(self.current, self.job_span.step)):
             self._try_cancel()
             self._set_current(i)
             if self.__safe_handle():
                 break
 
     def _prepare_stepping(self):
+        with self._bounds_lock:
+            self.__prepare_stepping()
+
+    def __prepare_stepping(self):
         # ===============为「步进」状态做准备（「反向步进/反向跃进」->「步进」）====================
         # 取消反转标志位
         self._flag -= JobStepFlag.reverse
@@ -244,6 +697,10 @@ class IndexJob(BaseJob, WorkSpan):
         self._current += self.job_span.step
 
     def _prepare_reverse_leaping(self):
+        with self._bounds_lock:
+            self.__prepare_reverse_leaping()
+
+    def __prepare_reverse_leaping(self):
         # ===============为「反向跃进」状态做准备（「跃进」->「反向跃进」）====================
         # 保存断点
         self._break_point_span = copy(self.job_span)
@@ -293,31 +750,172 @@ class IndexJob(BaseJob, WorkSpan):
         err_info = (None, None, None)
         # noinspection PyBroadException
         try:
+            if IndexJob.probe_hook is not None:
+                IndexJob.probe_hook(self, False)
             self._emitter.emit("IndexJob.handling", self)
-            self._handle()
+            self._handle(self.current)
             self._emitter.emit("IndexJob.handled", self)
             return True
         except ExplicitlySkipHandlingError:
             err_info = sys.exc_info()
             self._emitter.emit("IndexJob.handle_skipped", self, err_info)
             return False
-        except (ExplicitlyStopHandlingError, AssertionError) as e:
+        except ExplicitlyRetryHandlingError:
+            err_info = sys.exc_info()
+            if self.retry_queue is None:
+                self._emitter.emit("IndexJob.handle_skipped", self, err_info)
+                return False
+            self._defer(self.current)
+            self._emitter.emit("IndexJob.handle_deferred", self, err_info)
+            # 步进时暂视为有效，保证扫描前沿不会因暂时性错误而跳跃；跃进时暂视为无效，继续跃进，待重试结果出来后再修正
+            return JobStepFlag.stepping in self.flag
+        except (ExplicitlyStopHandlingError, JobCancelError, AssertionError) as e:
             raise e
         except Exception:
             err_info = sys.exc_info()
             self._emitter.emit("IndexJob.unexpected_exception", self, err_info)
             return False
 
-    def _handle(self):
-        for handler, params in self.handlers.items():
-            if len(params) == 1:
-                handler(self.current)
-            elif len(params) == 2:
-                handler(self.current, self)
-            else:
-                raise ValueError(f"Unsupported handler: {handler}")
+    def _handle(self, i):
+        breaker = self.breaker
+        if breaker is None:
+            self._handle_once(i)
+            return
+        while True:
+            if breaker.is_open:
+                self._emitter.emit("IndexJob.paused", self)
+                self.wait(breaker.wait_future())
+                self._emitter.emit("IndexJob.resumed", self)
+            try:
+                self._handle_once(i)
+            except ExplicitlySkipHandlingError:
+                # 上游正常答复了（比如用户不存在）
+                breaker.record(True)
+                raise
+            except ExplicitlyRetryHandlingError:
+                breaker.record(False)
+                # 已经熔断时，失败多半是上游不可用造成的，不作为结果，恢复后重新处理同一索引
+                if breaker.is_open:
+                    continue
+                raise
+            except (ExplicitlyStopHandlingError, JobCancelError, AssertionError):
+                # 停止、取消与断言失败与上游是否可用无关
+                raise
+            except Exception:
+                # 意外的异常（比如连接被重置、响应无法解析）同样视为上游失败
+                breaker.record(False)
+                raise
+            breaker.record(True)
+            return
+
+    def _handle_once(self, i):
+        compiled = self._compiled or self._compile_handlers()
+        if compiled.probe is not None:
+            self._consume_probe_result(i)
+            # 只有探测处理器时没有需要逐个调用的处理器，也无需再为每个索引取得并发额度
+            if not compiled.adapters:
+                return
+        self._admitted(self._dispatch, i)
+
+    def _dispatch(self, i):
+        compiled = self._compiled
+        if self.tracer is None:
+            compiled.dispatch(i)
+            return
+        with self.tracer.trace("IndexJob.handle", uid=i, job=str(self)) as root:
+            if root is None:
+                compiled.dispatch(i)
+                return
+            for handler, adapter in compiled.adapters:
+                with span(f"handler:{getattr(handler, '__name__', handler)}"):
+                    adapter(i)
+
+    def _compile_handlers(self) -> CompiledHandlers:
+        self._compiled = self.handlers.compile(self)
+        return self._compiled
+
+    def _flush_handlers(self):
+        if self._compiled is not None:
+            self._compiled.flush()
+
+    def _prefetching(self, candidates: Iterable[int]) -> Iterator[int]:
+        """
+        按块探测候选索引，再逐个交给状态机消费
+        - 块大小从 1 开始逐块翻倍直到 probe_size（类似预读），状态频繁切换时不会浪费太多探测
+        - 遇到越界的候选索引即停止探测，但仍将其原样交出，使状态机照常在越界时结束当前阶段
+        """
+        compiled = self._compiled
+        if compiled is None or compiled.probe is None:
+            yield from candidates
+            return
+
+        iterator = iter(candidates)
+        block_size = 1
+        while True:
+            # 每块重新读取边界，作业可能已被截断
+            low, high = self.min_val, self.max_val
+            block = []
+            out_of_bounds = None
+            for i in iterator:
+                if i < low or high < i:
+                    out_of_bounds = i
+                    break
+                block.append(i)
+                if len(block) >= block_size:
+                    break
+            results = self._probe_results
+            self._probe([i for i in block if i not in results])
+            yield from block
+            if out_of_bounds is not None:
+                yield out_of_bounds
+                return
+            if not block:
+                return
+            block_size = min(block_size * 2, compiled.probe_size)
+
+    def _probe(self, indexes: List[int]):
+        if not indexes:
+            return
+        compiled = self._compiled
+        # 状态切换时尚未消费的探测结果会保留下来，状态机之后往往还会访问到这些索引；结果过多时直接丢弃
+        if len(self._probe_results) > compiled.probe_size * 4:
+            self._probe_results = {}
+        if self.tracer is None:
+            self._probe_results.update(self._admitted(compiled.probe, indexes))
+            return
+        with self.tracer.trace("IndexJob.probe", size=len(indexes), job=str(self)):
+            self._probe_results.update(self._admitted(compiled.probe, indexes))
+
+    def _consume_probe_result(self, i: int):
+        # 没有探测结果的索引（比如重试、重新步进的索引）单独探测
+        result = self._probe_results.pop(i, None)
+        if result is None:
+            result = self._admitted(self._compiled.probe, [i])[i]
+        if result is True:
+            return
+        if result is False:
+            raise ExplicitlySkipHandlingError(i)
+        raise result
+
+    def _admitted(self, func, arg):
+        """取得并发额度后调用 func(arg)，没有设置份额时直接调用"""
+        share = self.share
+        if share is None:
+            return func(arg)
+        future = share.acquire()
+        try:
+            self.wait(future)
+        except JobCancelError:
+            # 取消与授予同时发生时，额度已被授予，需要归还
+            if not future.cancelled():
+                share.release()
+            raise
+        try:
+            return func(arg)
+        finally:
+            share.release()
 
-    def _set_current(self, i):
-        i = int(i)
-        self._update_worked_span(i)
-        self._current = i
+    def _set_current(self, i: int):
+        with self._bounds_lock:
+            self._update_worked_span(i)
+            self._current = i
@@ -0,0 +1,271 @@
+#!/usr/env python3
+import gzip
+import os
+import shutil
+import struct
+import time
+from enum import IntEnum
+from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import Iterator, List, Optional, Tuple, Union
+
+from .flag import ThreadFlag
+from .status import IStatus
+from .util import repr_injector
+
+# 分段文件头：魔数 + 版本（uint16）+ 单条记录的字节数（uint16）+ 保留（uint32）
+_MAGIC = b"NMDMPJ"
+_VERSION = 1
+_FILE_HEADER = struct.Struct("<6sHHI")
+# 单条记录：时间戳（float64，秒）、用户 ID（int64）、延迟（float32，秒）、上游返回的 code（int32）、
+# HTTP 状态码（uint16）、结果（uint8）、保留（5 字节），共 32 字节
+_RECORD = struct.Struct("<dqfiHB5x")
+_SEGMENT_SUFFIX = ".pj"
+_COMPRESSED_SUFFIX = ".pj.gz"
+
+# 与 _RECORD 一一对应的 NumPy 结构化类型描述
+RECORD_DTYPE_SPEC = [
+    ("time", "<f8"),
+    ("uid", "<i8"),
+    ("latency", "<f4"),
+    ("code", "<i4"),
+    ("status", "<u2"),
+    ("outcome", "u1"),
+    ("reserved", "V5"),
+]
+
+_record_type = Tuple[float, int, float, int, int, int]
+# 停止写入的标记，写入线程取到它时立即写出缓冲区并退出，无需等待 flush_interval
+_STOP = object()
+
+
+class ProbeOutcome(IntEnum):
+    # 用户存在
+    valid = 1
+    # 用户不存在
+    invalid = 2
+    # 上游返回了需要重试的结果（比如限流）
+    retry = 3
+    # 请求本身失败（比如网络错误）
+    error = 4
+
+
+@repr_injector
+class ProbeJournal(IStatus):
+    """
+    探测日志
+    -------
+    - 以定长二进制记录追加写入每次探测的用户 ID、结果、HTTP 状态码、上游 code 与延迟，供离线分析
+    - append 只是将记录放入有界队列，由后台线程批量写入；队列已满时丢弃记录并计数，探测线程永远不会被磁盘阻塞
+    - 分段写满 segment_size 后轮转，旧的分段交给独立的压缩线程压缩为 gzip，写入线程不会被压缩阻塞；
+      超出 max_segments 的最旧的分段由压缩线程删除
+    - 启动时上次运行留下的未压缩的分段（比如进程在压缩完成前退出）同样交给压缩线程压缩
+    - 使用 read_journal / load_segment 读取（需要 NumPy）
+    """
+
+    def __init__(self, directory: Union[str, Path], segment_size: int = 64 * 1024 * 1024,
+                 max_segments: Optional[int] = None, queue_size: int = 100000, flush_interval: float = 1.0,
+                 compress: bool = True):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.compress = compress
+
+        self._flag = ThreadFlag(ThreadFlag.pending)
+        self._queue: Queue = Queue(queue_size)
+        self._lock = Lock()
+        self._dropped = 0
+        self._written = 0
+        self._thread: Optional[Thread] = None
+        # 等待压缩（以及清理旧分段）的分段路径，由压缩线程处理
+        self._rotated: Queue = Queue()
+        self._compressor: Optional[Thread] = None
+        self._active_fp = None
+        self._active_size = 0
+
+    @property
+    def flag(self):
+        return self._flag
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    def append(self, uid: int, outcome: ProbeOutcome, status: int = 0, code: int = 0, latency: float = 0.0):
+        try:
+            self._queue.put_nowait((time.time(), uid, latency, code, status, int(outcome)))
+        except Full:
+            with self._lock:
+                self._dropped += 1
+
+    def start(self):
+        if ThreadFlag.pending not in self._flag:
+            raise RuntimeError("Cannot start a journal again!")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for temp_path in self.directory.glob(f"*{_COMPRESSED_SUFFIX}.tmp"):
+            temp_path.unlink()
+        for path in segment_paths(self.directory):
+            if path.name.endswith(_SEGMENT_SUFFIX):
+                self._rotated.put(path)
+        self._open_segment()
+        self._flag -= ThreadFlag.pending
+        self._flag += ThreadFlag.running
+        self._compressor = Thread(name=f"{self.__class__.__name__}-compressor", target=self._compress_work,
+                                  daemon=True)
+        self._compressor.start()
+        self._thread = Thread(name=f"{self.__class__.__name__}-writer", target=self._work, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """停止写入，已经入队的记录会先被写入"""
+        if ThreadFlag.running not in self._flag:
+            return
+        self._flag -= ThreadFlag.running
+        self._flag += ThreadFlag.stopping
+        # 阻塞地放入结束标记，队列已满时写入线程很快就会腾出空间
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        # 写入线程退出后不会再有轮转的分段，压缩线程处理完剩余的分段后退出
+        self._rotated.put(_STOP)
+        self._compressor.join(timeout)
+
+    def _work(self):
+        buffer = bytearray()
+        last_flush = time.monotonic()
+        stopping = False
+        while not stopping:
+            try:
+                records = [self._queue.get(timeout=self.flush_interval)]
+            except Empty:
+                records = []
+            if records and records[0] is not _STOP:
+                # 尽量一次取出队列中所有的记录
+                records += self._drain(4096)
+            if records and records[-1] is _STOP:
+                stopping = True
+                records.pop()
+            for record in records:
+                buffer += _RECORD.pack(*record)
+            if buffer and (len(buffer) >= 1024 * 1024 or time.monotonic() - last_flush >= self.flush_interval
+                           or stopping):
+                self._write(buffer)
+                buffer = bytearray()
+                last_flush = time.monotonic()
+        self._active_fp.close()
+
+    def _drain(self, max_count: int) -> List[_record_type]:
+        records = []
+        try:
+            while len(records) < max_count:
+                record = self._queue.get_nowait()
+                records.append(record)
+                if record is _STOP:
+                    break
+        except Empty:
+            pass
+        return records
+
+    def _write(self, data: bytearray):
+        view = memoryview(data)
+        while view:
+            # 按记录边界切分，保证每个分段中的记录都是完整的
+            room = max(_RECORD.size, (self.segment_size - self._active_size) // _RECORD.size * _RECORD.size)
+            chunk, view = view[:room], view[room:]
+            self._active_fp.write(chunk)
+            self._active_size += len(chunk)
+            self._written += len(chunk) // _RECORD.size
+            if self._active_size >= self.segment_size:
+                self._rotate()
+        self._active_fp.flush()
+
+    def _open_segment(self):
+        seq = max((_segment_seq(path) for path in segment_paths(self.directory)), default=0) + 1
+        self._active_fp = open(self.directory / f"{seq:020d}{_SEGMENT_SUFFIX}", "wb")
+        self._active_fp.write(_FILE_HEADER.pack(_MAGIC, _VERSION, _RECORD.size, 0))
+        self._active_size = _FILE_HEADER.size
+
+    def _rotate(self):
+        self._active_fp.close()
+        self._rotated.put(Path(self._active_fp.name))
+        self._open_segment()
+
+    def _compress_work(self):
+        while True:
+            path = self._rotated.get()
+            if path is _STOP:
+                return
+            # 分段可能已作为最旧的分段被删除
+            if self.compress and path.exists():
+                temp_path = path.with_suffix(_COMPRESSED_SUFFIX + ".tmp")
+                with open(path, "rb") as src, gzip.open(temp_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(temp_path, path.with_suffix(_COMPRESSED_SUFFIX))
+                path.unlink()
+            if self.max_segments:
+                for old_path in segment_paths(self.directory)[:-self.max_segments]:
+                    old_path.unlink(missing_ok=True)
+
+
+def _segment_seq(path: Path) -> int:
+    return int(path.name.split(".", 1)[0])
+
+
+def segment_paths(directory: Union[str, Path]) -> List[Path]:
+    """按写入顺序返回所有分段文件（包括已压缩的）"""
+    directory = Path(directory)
+    paths = [*directory.glob(f"*{_SEGMENT_SUFFIX}"), *directory.glob(f"*{_COMPRESSED_SUFFIX}")]
+    return sorted(paths, key=_segment_seq)
+
+
+def _check_header(header: bytes, path: Path):
+    magic, version, record_size, _ = _FILE_HEADER.unpack(header)
+    if magic != _MAGIC or record_size != _RECORD.size:
+        raise ValueError(f"Not a probe journal segment (version {version}): {path}")
+
+
+def iter_records(path: Union[str, Path]) -> Iterator[_record_type]:
+    """逐条读取分段中的记录，返回 (时间戳, 用户 ID, 延迟, code, HTTP 状态码, 结果)，不依赖 NumPy"""
+    path = Path(path)
+    opener = gzip.open if path.name.endswith(_COMPRESSED_SUFFIX) else open
+    with opener(path, "rb") as fp:
+        _check_header(fp.read(_FILE_HEADER.size), path)
+        data = fp.read()
+    # 正在写入的分段可能以不完整的记录结尾
+    yield from _RECORD.iter_unpack(data[:len(data) // _RECORD.size * _RECORD.size])
+
+
+def load_segment(path: Union[str, Path]):
+    """将分段加载为 NumPy 结构化数组，未压缩的分段通过 mmap 映射，不会读入内存"""
+    import numpy as np
+
+    path = Path(path)
+    dtype = np.dtype(RECORD_DTYPE_SPEC)
+    if path.name.endswith(_COMPRESSED_SUFFIX):
+        with gzip.open(path, "rb") as fp:
+            data = fp.read()
+        _check_header(data[:_FILE_HEADER.size], path)
+        count = (len(data) - _FILE_HEADER.size) // dtype.itemsize
+        return np.frombuffer(data, dtype=dtype, count=count, offset=_FILE_HEADER.size)
+
+    with open(path, "rb") as fp:
+        _check_header(fp.read(_FILE_HEADER.size), path)
+    count = (path.stat().st_size - _FILE_HEADER.size) // dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=_FILE_HEADER.size, shape=(count,))
+
+
+def read_journal(directory: Union[str, Path]):
+    """将目录下所有分段按写入顺序拼接为一个 NumPy 结构化数组"""
+    import numpy as np
+
+    segments = [load_segment(path) for path in segment_paths(directory)]
+    if not segments:
+        return np.empty(0, dtype=np.dtype(RECORD_DTYPE_SPEC))
+    return np.concatenate(segments)
@@ -0,0 +1,33 @@
+#!/usr/env python3
+"""
+JSON 编解码
+----------
+- 安装了 orjson 时使用 orjson，否则退回标准库 json，两者的输出均为紧凑的 UTF-8 字节串，非 ASCII 字符不转义
+- 非字符串的键（比如整数）会被转为字符串，与标准库的行为一致
+- default 用于编码两者都不支持的类型，比如 timedelta
+"""
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "json" if orjson is None else "orjson"
+
+_default_type = Optional[Callable[[Any], Any]]
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def dumps(data: Any, default: _default_type = None) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,40 @@
+#!/usr/env python3
+from collections import deque
+from threading import Lock
+from typing import List, Optional
+
+
+class LatencyWindow(object):
+    """
+    延迟窗口
+    -------
+    - 保存最近 size 个请求的延迟（秒）
+    - 每新增 refresh 个样本才重新排序一次，读取分位数只是一次下标访问，可以在每个请求前调用
+    """
+
+    def __init__(self, size: int = 1000, refresh: int = 50):
+        self.refresh = refresh
+
+        self._lock = Lock()
+        self._samples = deque(maxlen=size)
+        self._sorted: List[float] = []
+        self._unsorted = 0
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+            self._unsorted += 1
+            # 样本较少时每次都重新排序，尽快得到可用的分位数
+            if self._unsorted >= self.refresh or len(self._samples) <= self.refresh:
+                self._sorted = sorted(self._samples)
+                self._unsorted = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """分位数，没有样本时返回 None"""
+        samples = self._sorted
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
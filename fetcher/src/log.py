@@ -0,0 +1,130 @@
+#!/usr/env python3
+import re
+from functools import lru_cache
+from logging import WARNING, Handler, LogRecord
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from threading import Lock
+from traceback import TracebackException
+from typing import Any, Dict, List, Optional, Tuple
+
+# 这些类型的参数不可变且格式化的开销很小，原样入队
+_PRIMITIVE_TYPES = (str, int, float, bool, type(None))
+# % 格式中的一个转换说明：可选的映射键、标志、宽度、精度、长度修饰符以及转换类型
+_CONVERSION = re.compile(r"%(?:\((?P<key>[^)]*)\))?[#0\- +]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[hlL]?(?P<type>[diouxXeEfFgGcrsa%])")
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    有界、不阻塞的队列日志处理器
+    -------------------------
+    - 队列已满时直接丢弃日志并计数，记录日志的线程永远不会因为写入磁盘缓慢而阻塞
+    - 消息留给写入线程格式化；记录日志的线程只把非基本类型的参数（比如作业）按其转换类型（%s、%r 等）转为字符串，
+      日志反映的是记录时而不是写入时的状态，基本类型的参数原样入队
+    - 异常堆栈在入队前转为不引用帧的摘要（不读取源码），由写入线程格式化，排队的日志不会让各帧的局部变量一直存活
+    - 队列恢复空闲后，补记一条被丢弃的日志数量的警告
+    """
+
+    def __init__(self, queue: Queue):
+        super().__init__(queue)
+        self._lock = Lock()
+        self._dropped = 0
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        if not isinstance(record.msg, str):
+            record.msg = str(record.msg)
+        if record.args:
+            record.args = _snapshot_args(record.msg, record.args)
+        if record.exc_info:
+            if record.exc_info[0] is not None:
+                record.exc_summary = TracebackException(*record.exc_info, lookup_lines=False)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: LogRecord):
+        if self._dropped:
+            self._report_dropped(record)
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _report_dropped(self, record: LogRecord):
+        with self._lock:
+            dropped, self._dropped = self._dropped, 0
+        report = LogRecord(record.name, WARNING, __file__, 0, f"日志队列已满，丢弃了 {dropped} 条日志", None, None)
+        try:
+            self.queue.put_nowait(report)
+        except Full:
+            with self._lock:
+                self._dropped += dropped
+
+
+@lru_cache(maxsize=1024)
+def _conversions(msg: str) -> Tuple[List[str], Dict[str, str]]:
+    """消息中依次出现的位置参数的转换类型，以及映射参数的键对应的转换类型"""
+    positional, named = [], {}
+    for match in _CONVERSION.finditer(msg):
+        conversion = match.group("type")
+        if conversion == "%":
+            continue
+        if match.group("key") is not None:
+            named[match.group("key")] = conversion
+        else:
+            positional.append(conversion)
+    return positional, named
+
+
+def _snapshot(value: Any, conversion: Optional[str]) -> Any:
+    if isinstance(value, _PRIMITIVE_TYPES):
+        return value
+    if conversion == "r":
+        return _Formatted(repr(value))
+    if conversion == "a":
+        return _Formatted(ascii(value))
+    if conversion == "s":
+        return str(value)
+    # 数值转换需要原值，转换类型无法确定时退回 str
+    return value if conversion is not None else str(value)
+
+
+def _snapshot_args(msg: str, args):
+    positional, named = _conversions(msg)
+    if isinstance(args, dict):
+        return {key: _snapshot(value, named.get(key)) for key, value in args.items()}
+    return tuple(_snapshot(arg, positional[n] if n < len(positional) else None) for n, arg in enumerate(args))
+
+
+class _Formatted(str):
+    """已按 %r 或 %a 转为字符串的参数，写入线程以 %r、%a 格式化时原样输出"""
+
+    def __repr__(self):
+        return str(self)
+
+
+class BlockingStopQueueListener(QueueListener):
+    """停止时阻塞地放入结束标记，保证队列满时也能停止，并且已入队的日志都会被写入"""
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        summary = getattr(record, "exc_summary", None)
+        if summary is not None and not record.exc_text:
+            record.exc_text = "".join(summary.format()).rstrip("\n")
+        return record
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def queued(handler: Handler, maxsize: int = 10000, level: Optional[int] = None):
+    """将处理器包装为 (队列处理器, 队列监听器)，监听器需要调用者启动和停止"""
+    queue = Queue(maxsize)
+    queue_handler = DroppingQueueHandler(queue)
+    if level is not None:
+        queue_handler.setLevel(level)
+    listener = BlockingStopQueueListener(queue, handler, respect_handler_level=True)
+    return queue_handler, listener
@@ -1,16 +1,17 @@
 #!/usr/env python3
 import statistics
-import time
 from abc import ABCMeta, abstractmethod
 from collections import deque
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from threading import Thread
-from typing import Callable, Dict, List, Optional, Union
+from itertools import count
+from threading import Event, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from .fetcher import IndexFetcher
-from .flag import ThreadFlag
+from .flag import JobStepFlag, ThreadFlag
 from .job import IndexJob
+from .snapshot import Snapshot, SnapshotPublisher
 from .status import IIndexWorkStatus
 from .util import repr_injector
 
@@ -30,6 +31,8 @@ class Monitor(IIndexWorkStatus, metaclass=ABCMeta):
             lambda work_func: Thread(name=f"{self.__class__.__name__.lower()}-thread", target=work_func)
         )
         self._work_thread: Optional[Thread] = None
+        # 停止时设置，工作线程等待下一个 tick 时会被立即唤醒
+        self._stop_event = Event()
         self._start_working_time: Optional[datetime] = None
         self._end_working_time: Optional[datetime] = None
         self._exception: Optional[Exception] = None
@@ -55,6 +58,7 @@ class Monitor(IIndexWorkStatus, metaclass=ABCMeta):
         if self._work_thread is not None and self._work_thread.is_alive():
             self.stop()
 
+        self._stop_event.clear()
         self._work_thread = self._work_thread_factory(self._work)
         self._work_thread.daemon = True
         self._work_thread.start()
@@ -62,8 +66,9 @@ class Monitor(IIndexWorkStatus, metaclass=ABCMeta):
     def stop(self):
         self._flag -= ThreadFlag.running
         self._flag += ThreadFlag.canceling
-        while self._work_thread is not None and self._work_thread.is_alive():
-            time.sleep(1)
+        self._stop_event.set()
+        if self._work_thread is not None:
+            self._work_thread.join()
         self._flag -= ThreadFlag.canceling
         self._flag += ThreadFlag.stopping_with_canceled
 
@@ -78,8 +83,7 @@ class Monitor(IIndexWorkStatus, metaclass=ABCMeta):
         try:
             while True:
                 self._tick()
-                time.sleep(self._tick_interval.seconds)
-                if ThreadFlag.canceling in self.flag:
+                if self._stop_event.wait(self._tick_interval.total_seconds()):
                     self._flag -= ThreadFlag.running
                     self._flag -= ThreadFlag.canceling
                     self._flag += ThreadFlag.stopping_with_canceled
@@ -102,9 +106,12 @@ class JobStatusData(IIndexWorkStatus):
     job: IndexJob
     start_monitoring_time: datetime
     end_monitoring_time: Optional[datetime] = None
-    total_count_of_indexes: int = 1
-    total_count_of_valid_indexes: int = 1
-    process_deque: deque = deque(maxlen=60)
+    total_count_of_indexes: int = 0
+    total_count_of_valid_indexes: int = 0
+    process_deque: deque = field(default_factory=lambda: deque(maxlen=60))
+    fetcher: Optional[IndexFetcher] = None
+    # 快照中作业的键，开始监视时分配，在作业的整个生命周期内保持不变
+    key: Optional[str] = None
 
     @property
     def age(self):
@@ -138,18 +145,7 @@ class JobStatusData(IIndexWorkStatus):
         """
         if not self.job.working:
             return None
-
-        if len(self.process_deque) < 2:
-            return timedelta.max
-
-        average_progress = statistics.mean(
-            self.process_deque[i + 1] - self.process_deque[i] for i in range(len(self.process_deque) - 1)
-        )
-
-        if average_progress == 0:
-            return timedelta.max
-
-        return self._tick_interval * ((1 - self.job.processed) / average_progress)
+        return self._remaining_time(self.job.processed)
 
     @property
     def average_speed(self) -> Optional[float]:
@@ -163,9 +159,7 @@ class JobStatusData(IIndexWorkStatus):
         """
         if not self.job.working:
             return None
-        if self.age.seconds == 0:
-            return 0
-        return self.total_count_of_indexes / self.age.seconds
+        return self._speed(self.total_count_of_indexes, self.age)
 
     @property
     def effective_average_speed(self) -> Optional[float]:
@@ -179,22 +173,100 @@ class JobStatusData(IIndexWorkStatus):
         """
         if not self.job.working:
             return None
-        if self.age.seconds == 0:
+        return self._speed(self.total_count_of_valid_indexes, self.age)
+
+    def sample(self) -> "JobSample":
+        """计算作业当前的状态，作业的状态与进度只读取一次"""
+        flag = self.job.flag
+        working = JobStepFlag.running in flag
+        processed = self.job.processed
+        age = self.age
+        return JobSample(
+            data=self,
+            flag=str(flag),
+            working=working,
+            stopping=JobStepFlag.stopping in flag,
+            processed=processed,
+            remaining_time=self._remaining_time(processed) if working else None,
+            average_speed=self._speed(self.total_count_of_indexes, age) if working else None,
+            effective_average_speed=self._speed(self.total_count_of_valid_indexes, age) if working else None,
+            age=age,
+        )
+
+    def _remaining_time(self, processed: float) -> timedelta:
+        if len(self.process_deque) < 2:
+            return timedelta.max
+
+        # 相邻进度之差的平均值，各项相加后只剩首尾两项
+        average_progress = (self.process_deque[-1] - self.process_deque[0]) / (len(self.process_deque) - 1)
+
+        if average_progress == 0:
+            return timedelta.max
+
+        return self._tick_interval * ((1 - processed) / average_progress)
+
+    @staticmethod
+    def _speed(count: int, age: timedelta) -> float:
+        if age.seconds == 0:
             return 0
-        return self.total_count_of_valid_indexes / self.age.seconds
+        return count / age.seconds
+
+
+@dataclass(frozen=True)
+class JobSample(object):
+    """作业在一个 tick 中的状态，每个 tick 只计算一次，检查掉队作业、退役作业与构建快照时共用"""
+    data: JobStatusData
+    flag: str
+    working: bool
+    stopping: bool
+    processed: float
+    remaining_time: Optional[timedelta]
+    average_speed: Optional[float]
+    effective_average_speed: Optional[float]
+    age: timedelta
+
+
+@dataclass
+class FetcherTotals(object):
+    """抓取器中已退役（已结束而不再监视）的作业的计数之和"""
+    retired_jobs: int = 0
+    total_count_of_indexes: int = 0
+    total_count_of_valid_indexes: int = 0
 
 
 class IndexFetcherMonitor(Monitor, IIndexWorkStatus):
+    """
+    抓取器监视器
+    -----------
+    - 设置了 straggler_factor 时，每个 tick 检查各抓取器中的掉队作业：抓取器有空闲线程，且作业的剩余时间超过
+      同一抓取器中其它作业剩余时间中位数（已结束的作业视为 0）的 straggler_factor 倍以及 straggler_min_remaining 时，
+      将其从未访问过的尾部区间拆出一半作为新的作业，由空闲线程运行
+    - 每个 tick 结束时构建一次快照（监视器与各作业的状态，以及 add_section 添加的其它部分），由 publisher 发布，
+      所有读取者和订阅者共享同一份快照，不会因为读取者增多而重复计算
+    - 计数的监听器按抓取器注册，同一抓取器的所有作业共用；作业结束后在下一个 tick 退役：计数并入所属抓取器的累计值，
+      不再保留其状态。抓取器被移出 fetchers 后，其监听器被移除，累计值被丢弃。长期运行时内存与每个 tick 的开销不随
+      历史作业的数量增长
+    """
 
     def __init__(self, fetchers: Union[IndexFetcher, List[IndexFetcher]],
                  tick_interval: Union[int, timedelta] = None,
-                 work_thread_factory: _work_thread_factory_type = None):
+                 work_thread_factory: _work_thread_factory_type = None,
+                 straggler_factor: Optional[float] = None,
+                 straggler_min_remaining: Optional[timedelta] = None):
         if isinstance(fetchers, IndexFetcher):
             fetchers = [fetchers]
 
         self.fetchers = fetchers
+        self.straggler_factor = straggler_factor
+        self.straggler_min_remaining = timedelta(minutes=1) if straggler_min_remaining is None else straggler_min_remaining
+
+        self.publisher = SnapshotPublisher()
 
         self._monitored_jobs: Dict[IndexJob, JobStatusData] = {}
+        self._fetcher_totals: Dict[IndexFetcher, FetcherTotals] = {}
+        self._listeners: Dict[IndexFetcher, List[Tuple[str, Callable]]] = {}
+        self._sections: Dict[str, Callable[[], Any]] = {}
+        self._job_seq = count()
 
         super().__init__(tick_interval, work_thread_factory)
 
@@ -202,24 +274,189 @@ class IndexFetcherMonitor(Monitor, IIndexWorkStatus):
     def monitored_jobs(self):
         return self._monitored_jobs.copy()
 
+    @property
+    def fetcher_totals(self) -> Dict[IndexFetcher, FetcherTotals]:
+        return self._fetcher_totals.copy()
+
+    def add_section(self, name: str, func: Callable[[], Any]):
+        """添加快照中的一部分，每次构建快照时调用 func 获取其内容"""
+        self._sections[name] = func
+
+    def snapshot(self, samples: Optional[Dict[IndexJob, JobSample]] = None) -> Dict[str, Any]:
+        """构建快照，samples 为本次 tick 中各作业的状态，未提供时重新计算"""
+        if samples is None:
+            samples = self._sample()
+
+        working = [sample for sample in samples.values() if sample.working]
+        # 一次遍历按抓取器分组汇总计数
+        counts: Dict[IndexFetcher, List[int]] = {}
+        for sample in samples.values():
+            fetcher_counts = counts.setdefault(sample.data.fetcher, [0, 0])
+            fetcher_counts[0] += sample.data.total_count_of_indexes
+            fetcher_counts[1] += sample.data.total_count_of_valid_indexes
+
+        return {
+            "monitor": {
+                "flag": str(self.flag),
+                "processed": _mean([sample.processed for sample in working]),
+                "averageSpeed": _mean([sample.average_speed for sample in working]),
+                "effectiveAverageSpeed": _mean([sample.effective_average_speed for sample in working]),
+                "remainingTime": max((sample.remaining_time for sample in working
+                                      if sample.remaining_time is not None), default=None),
+                "age": self.age,
+            },
+            **{name: self._section(func) for name, func in self._sections.copy().items()},
+            # 以稳定的键区分作业，作业的描述与当前索引放在值中，相邻两次快照的差异只包含变化的字段
+            "jobs": {
+                sample.data.key: {
+                    "job": str(sample.data.job),
+                    "current": sample.data.job.current,
+                    "flag": sample.flag,
+                    "processed": sample.processed,
+                    "averageSpeed": sample.average_speed,
+                    "effectiveAverageSpeed": sample.effective_average_speed,
+                    "remainingTime": sample.remaining_time,
+                    "age": sample.age,
+                } for sample in samples.values()
+            },
+            "fetchers": {
+                fetcher.name: {
+                    "retiredJobs": totals.retired_jobs,
+                    "indexes": totals.total_count_of_indexes + counts.get(fetcher, (0, 0))[0],
+                    "validIndexes": totals.total_count_of_valid_indexes + counts.get(fetcher, (0, 0))[1],
+                } for fetcher, totals in self.fetcher_totals.items()
+            },
+        }
+
+    def _sample(self) -> Dict[IndexJob, JobSample]:
+        return {job: job_status_data.sample() for job, job_status_data in self.monitored_jobs.items()}
+
+    @staticmethod
+    def _section(func: Callable[[], Any]) -> Any:
+        # 某一部分出错不应影响整个快照以及监视线程
+        # noinspection PyBroadException
+        try:
+            return func()
+        except Exception as e:
+            return {"error": repr(e)}
+
+    def publish_snapshot(self) -> Snapshot:
+        return self.publisher.publish(self.snapshot())
+
     def _tick(self):
-        for fetcher in self.fetchers:
-            for job in fetcher.jobs:
-                if job in self._monitored_jobs:
+        fetchers = list(self.fetchers)
+        fetcher_jobs: Dict[IndexFetcher, List[IndexJob]] = {}
+        for fetcher in fetchers:
+            if fetcher not in self._fetcher_totals:
+                self._watch(fetcher)
+            fetcher_jobs[fetcher] = jobs = fetcher.jobs
+            for job in jobs:
+                job_status_data = self._monitored_jobs.get(job)
+                if job_status_data is not None:
                     # NOTE: 由于计算剩余时间时，所用的双端队列的索引是从左往右，而正确的计算顺序应该是新的进度减去旧的进度，
                     # 新进度（i+1，靠右）- 旧进度（i，靠左），因此要保证较新的进度值从双端队列的右端加入，较旧的进度从双端队列的左端弹出
-                    self._monitored_jobs[job].process_deque.append(job.processed)
-                    continue
-
-                self._monitored_jobs[job] = JobStatusData(self._tick_interval, job, datetime.now())
-
-                @job.emitter.on("IndexJob.handling")
-                def handling_trigger(sender: IndexJob):
-                    self._monitored_jobs[sender].total_count_of_indexes += 1
-
-                @job.emitter.on("IndexJob.handled")
-                def handled_trigger(sender: IndexJob):
-                    self._monitored_jobs[sender].total_count_of_valid_indexes += 1
+                    job_status_data.process_deque.append(job.processed)
+                elif JobStepFlag.stopping not in job.flag:
+                    # NOTE: 拆分或调整大小产生的新作业在下一个 tick 之前尚未被监视，这期间的计数不会被统计
+                    self._monitored_jobs[job] = JobStatusData(self._tick_interval, job, datetime.now(), fetcher=fetcher,
+                                                              key=f"{fetcher.name}:{next(self._job_seq)}")
+
+        # 每个作业的状态在一个 tick 中只计算一次
+        samples = self._sample()
+        if self.straggler_factor is not None:
+            for fetcher, jobs in fetcher_jobs.items():
+                self._split_stragglers(fetcher, jobs, samples)
+
+        self._retire(fetcher_jobs, samples)
+        self.publisher.publish(self.snapshot(samples))
+
+    def _watch(self, fetcher: IndexFetcher):
+        """在抓取器的事件发射器上注册计数的监听器，同一抓取器的所有作业共用"""
+
+        def handling_trigger(sender: IndexJob):
+            job_status_data = self._monitored_jobs.get(sender)
+            if job_status_data is not None:
+                job_status_data.total_count_of_indexes += 1
+
+        def handled_trigger(sender: IndexJob):
+            job_status_data = self._monitored_jobs.get(sender)
+            if job_status_data is not None:
+                job_status_data.total_count_of_valid_indexes += 1
+
+        def retried_trigger(sender: IndexJob, i: int):
+            handled_trigger(sender)
+
+        listeners = [
+            ("IndexJob.handling", handling_trigger),
+            ("IndexJob.handled", handled_trigger),
+            ("IndexJob.retried", retried_trigger),
+        ]
+        for event, listener in listeners:
+            fetcher.emitter.on(event, listener)
+        self._listeners[fetcher] = listeners
+        self._fetcher_totals[fetcher] = FetcherTotals()
+
+    def _unwatch(self, fetcher: IndexFetcher):
+        for event, listener in self._listeners.pop(fetcher, ()):
+            fetcher.emitter.remove_listener(event, listener)
+        self._fetcher_totals.pop(fetcher, None)
+
+    def _retire(self, fetcher_jobs: Dict[IndexFetcher, List[IndexJob]], samples: Dict[IndexJob, JobSample]):
+        """
+        退役已结束或已不属于任何抓取器（比如抓取器重新启动、被移除）的作业，并移除已被移出 fetchers 的抓取器，
+        退役的作业同时从 samples 中移除
+        """
+        live_jobs = {job for jobs in fetcher_jobs.values() for job in jobs}
+        for job, sample in list(samples.items()):
+            if not sample.stopping and job in live_jobs:
+                continue
+            del samples[job]
+            job_status_data = self._monitored_jobs.pop(job)
+            totals = self._fetcher_totals.get(job_status_data.fetcher)
+            if totals is not None:
+                totals.retired_jobs += 1
+                totals.total_count_of_indexes += job_status_data.total_count_of_indexes
+                totals.total_count_of_valid_indexes += job_status_data.total_count_of_valid_indexes
+
+        for fetcher in set(self._fetcher_totals) - set(fetcher_jobs):
+            self._unwatch(fetcher)
+
+    def _split_stragglers(self, fetcher: IndexFetcher, jobs: List[IndexJob], samples: Dict[IndexJob, JobSample]):
+        idle_workers = fetcher.idle_workers
+        if idle_workers <= 0:
+            return
+
+        estimates = {}
+        for job in jobs:
+            sample = samples.get(job)
+            if sample is None:
+                # 已结束的作业可能已经退役，不再有监视数据
+                if JobStepFlag.stopping in job.flag:
+                    estimates[job] = timedelta(0)
+                continue
+            if sample.stopping:
+                estimates[job] = timedelta(0)
+            elif sample.working:
+                remaining_time = sample.remaining_time
+                # 数据不足时无法判断
+                if remaining_time is not None and remaining_time != timedelta.max:
+                    estimates[job] = remaining_time
+        if len(estimates) < 2:
+            return
+
+        for job, remaining_time in sorted(estimates.items(), key=lambda item: item[1], reverse=True):
+            if idle_workers <= 0 or remaining_time <= self.straggler_min_remaining:
+                break
+            peers = [estimate for peer, estimate in estimates.items() if peer is not job]
+            if remaining_time <= statistics.median(peers) * self.straggler_factor:
+                break
+            if fetcher.split(job) is None:
+                continue
+            idle_workers -= 1
+            # 作业的区间变短后，旧的进度数据不再可比
+            job_status_data = self._monitored_jobs[job]
+            job_status_data.process_deque.clear()
+            samples[job] = job_status_data.sample()
 
     @property
     def processed(self) -> Optional[float]:
@@ -233,13 +470,8 @@ class IndexFetcherMonitor(Monitor, IIndexWorkStatus):
         :return: Optional[float]
         """
         """当前进度（以浮点数表示，范围 0~1），如果状态不支持，返回 None"""
-        try:
-            return statistics.mean(
-                job_status_data.processed for job_status_data in self._monitored_jobs.values() if
-                job_status_data.job.working
-            )
-        except statistics.StatisticsError as e:
-            return None
+        return _mean([job_status_data.processed for job_status_data in self._monitored_jobs.values() if
+                      job_status_data.job.working])
 
     @property
     def average_speed(self) -> Optional[float]:
@@ -251,13 +483,8 @@ class IndexFetcherMonitor(Monitor, IIndexWorkStatus):
 
         :return: Optional[float]
         """
-        try:
-            return statistics.mean(
-                job_status_data.average_speed for job_status_data in self._monitored_jobs.values() if
-                job_status_data.job.working
-            )
-        except statistics.StatisticsError:
-            return None
+        return _mean([job_status_data.average_speed for job_status_data in self._monitored_jobs.values() if
+                      job_status_data.job.working])
 
     @property
     def remaining_time(self) -> Optional[timedelta]:
@@ -269,8 +496,9 @@ class IndexFetcherMonitor(Monitor, IIndexWorkStatus):
 
         :return: Optional[timedelta]
         """
-        return max((job_status_data.remaining_time for job_status_data in self._monitored_jobs.values() if
-                    job_status_data.job.working and job_status_data.remaining_time is not None), default=None)
+        remaining_times = (job_status_data.remaining_time for job_status_data in self._monitored_jobs.values() if
+                           job_status_data.job.working)
+        return max((remaining_time for remaining_time in remaining_times if remaining_time is not None), default=None)
 
     @property
     def effective_average_speed(self) -> Optional[float]:
@@ -282,10 +510,12 @@ class IndexFetcherMonitor(Monitor, IIndexWorkStatus):
 
         :return: Optional[float]
         """
-        try:
-            return statistics.mean(
-                job_status_data.effective_average_speed for job_status_data in self._monitored_jobs.values() if
-                job_status_data.job.working
-            )
-        except statistics.StatisticsError:
-            return None
+        return _mean([job_status_data.effective_average_speed for job_status_data in self._monitored_jobs.values() if
+                      job_status_data.job.working])
+
+
+def _mean(values: List[Any]) -> Optional[Any]:
+    """平均值，没有任何值时返回 None"""
+    if not values:
+        return None
+    return sum(values) / len(values)
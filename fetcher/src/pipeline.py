@@ -0,0 +1,241 @@
+#!/usr/env python3
+import sys
+import time
+from concurrent.futures import CancelledError, Future, InvalidStateError
+from queue import Queue
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from pyee import AsyncIOEventEmitter
+
+from .flag import ThreadFlag
+from .status import IStatus
+from .tracing import activate, current_span, span
+from .util import repr_injector
+
+_stage_func_type = Callable[[Any], Any]
+_STOP = object()
+
+
+@repr_injector
+class Stage(object):
+    def __init__(self, name: str, func: _stage_func_type, workers: int = 1, maxsize: int = 0):
+        if workers <= 0:
+            raise ValueError(f"The number of workers must be positive: {workers!r}")
+
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue: Queue = Queue(maxsize)
+
+        self._lock = Lock()
+        self._processed = 0
+        self._stall_time = 0.0
+        self._busy_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    @property
+    def processed(self) -> int:
+        return self._processed
+
+    @property
+    def stall_time(self) -> float:
+        """上游因本阶段队列已满而阻塞等待的总时间（秒），持续增长说明本阶段是瓶颈"""
+        return self._stall_time
+
+    @property
+    def busy_time(self) -> float:
+        """本阶段所有工作线程处理数据的总时间（秒）"""
+        return self._busy_time
+
+    def put(self, item):
+        if not self.queue.full():
+            self.queue.put(item)
+            return
+        begin = time.perf_counter()
+        self.queue.put(item)
+        with self._lock:
+            self._stall_time += time.perf_counter() - begin
+
+    def _record(self, busy_time: float):
+        with self._lock:
+            self._processed += 1
+            self._busy_time += busy_time
+
+
+@repr_injector
+class Pipeline(IStatus):
+    """
+    分阶段流水线
+    -----------
+    - 每个阶段拥有独立的有界队列和工作线程数，上一阶段的返回值作为下一阶段的输入
+    - submit 返回的 Future 在「结果阶段」（默认为最后一个阶段）完成后即得到结果，后续阶段（比如存储）在后台继续进行
+    - 结果阶段及其之前的阶段抛出的异常会设置到 Future 上，之后的阶段抛出的异常通过 "Pipeline.stage_error" 事件发出
+    - 停止时逐个阶段发送结束标记，上游阶段的工作线程全部退出后才向下游发送；超时仍未退出时不再向下游发送，
+      所有尚未完成的 Future 以 CancelledError 结束，等待它们的作业不会一直阻塞
+    """
+    # 每处理一项数据前以及工作线程退出时在阶段的工作线程中调用的钩子，与 IndexJob.probe_hook 一样用于剖析等诊断功能
+    item_hook: Optional[Callable[["Pipeline", bool], None]] = None
+
+    def __init__(self, name: Optional[str] = None, emitter=None):
+        self.name = name or self.__class__.__name__
+
+        self._emitter = emitter or AsyncIOEventEmitter()
+        self._flag = ThreadFlag(ThreadFlag.pending)
+        self._stages: List[Stage] = []
+        self._outcome_index: Optional[int] = None
+        self._threads: List[Thread] = []
+        # 已提交而尚未完成的 Future
+        self._outstanding_lock = Lock()
+        self._outstanding: Set[Future] = set()
+
+    @property
+    def flag(self):
+        return self._flag
+
+    @property
+    def emitter(self):
+        return self._emitter
+
+    @property
+    def stages(self):
+        return self._stages.copy()
+
+    def add_stage(self, name: str, func: _stage_func_type, workers: int = 1, maxsize: int = 0,
+                  outcome: bool = False) -> "Pipeline":
+        if ThreadFlag.pending not in self._flag:
+            raise RuntimeError("Cannot add stages to a started pipeline!")
+        self._stages.append(Stage(name, func, workers, maxsize))
+        if outcome:
+            self._outcome_index = len(self._stages) - 1
+        return self
+
+    def start(self):
+        if not self._stages:
+            raise RuntimeError("Cannot start a pipeline without stages!")
+        if ThreadFlag.pending not in self._flag:
+            raise RuntimeError("Cannot start a pipeline again!")
+        self._flag -= ThreadFlag.pending
+        self._flag += ThreadFlag.running
+        for index, stage in enumerate(self._stages):
+            for n in range(stage.workers):
+                thread = Thread(name=f"{self.name}-{stage.name}-{n}", target=self._work, args=(index,), daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self, timeout=None):
+        """停止流水线，已经提交的数据会先被处理完"""
+        if ThreadFlag.running not in self._flag:
+            return
+        self._flag -= ThreadFlag.running
+        self._flag += ThreadFlag.stopping
+        # 逐个阶段发送结束标记，上游阶段的工作线程全部退出后才向下游发送，保证上游阶段的数据先全部流入下游
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for stage in self._stages:
+            for _ in range(stage.workers):
+                stage.put(_STOP)
+            threads, self._threads = self._threads[:stage.workers], self._threads[stage.workers:]
+            for thread in threads:
+                thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if any(thread.is_alive() for thread in threads):
+                # 此时向下游发送结束标记，上游之后交出的数据会被丢弃，其 Future 永远不会完成
+                self._cancel_outstanding()
+                return
+
+    def _cancel_outstanding(self):
+        with self._outstanding_lock:
+            outstanding, self._outstanding = self._outstanding, set()
+        for future in outstanding:
+            # 尚未开始处理的 Future 直接取消，正在处理的以 CancelledError 结束
+            if not future.cancel():
+                _resolve(future, exception=CancelledError())
+
+    def submit(self, item) -> Future:
+        if ThreadFlag.running not in self._flag:
+            raise RuntimeError("The pipeline is not running!")
+        future = Future()
+        with self._outstanding_lock:
+            self._outstanding.add(future)
+        future.add_done_callback(self._discard_outstanding)
+        # 携带提交时的追踪上下文，使各阶段的跨度挂在同一次探测之下
+        self._stages[0].put((item, future, current_span()))
+        return future
+
+    def _discard_outstanding(self, future: Future):
+        with self._outstanding_lock:
+            self._outstanding.discard(future)
+
+    def as_handler(self) -> Callable[..., Any]:
+        """将流水线包装为 IndexJob 的处理器，作业线程只等待结果阶段完成，作业被取消时立即停止等待"""
+
+        def pipeline_handler(i, sender=None):
+            future = self.submit(i)
+            if sender is None:
+                return future.result()
+            return sender.wait(future)
+
+        return pipeline_handler
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "queueDepth": stage.queue_depth,
+                "stallTime": stage.stall_time,
+                "busyTime": stage.busy_time,
+                "processed": stage.processed,
+            } for stage in self._stages
+        }
+
+    def _work(self, index: int):
+        stage = self._stages[index]
+        next_stage = self._stages[index + 1] if index + 1 < len(self._stages) else None
+        outcome_index = len(self._stages) - 1 if self._outcome_index is None else self._outcome_index
+
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                if Pipeline.item_hook is not None:
+                    Pipeline.item_hook(self, True)
+                break
+            if Pipeline.item_hook is not None:
+                Pipeline.item_hook(self, False)
+            value, future, trace_span = item
+            # 等待结果的作业已被取消时，不再处理尚未开始的数据
+            if index == 0 and not future.set_running_or_notify_cancel():
+                continue
+            begin = time.perf_counter()
+            # noinspection PyBroadException
+            try:
+                if trace_span is None:
+                    value = stage.func(value)
+                else:
+                    with activate(trace_span), span(f"pipeline:{stage.name}", pipeline=self.name):
+                        value = stage.func(value)
+            except Exception as e:
+                if index <= outcome_index:
+                    _resolve(future, exception=e)
+                else:
+                    self._emitter.emit("Pipeline.stage_error", self, stage.name, sys.exc_info())
+                continue
+            finally:
+                stage._record(time.perf_counter() - begin)
+
+            if index == outcome_index:
+                _resolve(future, value)
+            if next_stage is not None:
+                next_stage.put((value, future, trace_span))
+
+
+def _resolve(future: Future, result=None, exception: Optional[BaseException] = None):
+    # 流水线停止超时时 Future 可能已被取消
+    try:
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
+    except InvalidStateError:
+        pass
@@ -0,0 +1,172 @@
+#!/usr/env python3
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .exceptions import ProfilerBusyError
+from .job import IndexJob
+from .pipeline import Pipeline
+
+_thread_source_type = Callable[[], Dict[int, str]]
+
+# 同一时间只允许进行一次剖析
+_profiling_lock = threading.Lock()
+
+
+def job_threads(jobs) -> Dict[int, str]:
+    """获取正在运行的作业所在的线程，返回 {线程 ID: 线程名}"""
+    result = {}
+    for job in jobs:
+        thread = job.thread
+        if job.working and thread is not None and thread.ident is not None:
+            result[thread.ident] = thread.name
+    return result
+
+
+def all_threads() -> Dict[int, str]:
+    current = threading.get_ident()
+    return {thread.ident: thread.name for thread in threading.enumerate() if thread.ident != current}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler(object):
+    """
+    采样剖析器
+    ---------
+    - 按固定间隔采集目标线程的调用栈，开销与被剖析的代码无关
+    - 结果为折叠栈格式（每行「线程名;栈底帧;...;栈顶帧 次数」），可直接用于生成火焰图
+    """
+
+    def __init__(self, threads: _thread_source_type, interval: float = 0.005):
+        self.threads = threads
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+
+    def run(self, duration: float) -> "SamplingProfiler":
+        if not _profiling_lock.acquire(blocking=False):
+            raise ProfilerBusyError("Another profiling session is in progress.")
+        try:
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                self._sample()
+                time.sleep(self.interval)
+        finally:
+            _profiling_lock.release()
+        return self
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def per_thread(self) -> Dict[str, int]:
+        result: Counter = Counter()
+        for stack, count in self.samples.items():
+            result[stack.split(";", 1)[0]] += count
+        return dict(result)
+
+    def _sample(self):
+        threads = self.threads()
+        self.sample_count += 1
+        for ident, frame in sys._current_frames().items():
+            name = threads.get(ident)
+            if name is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(name)
+            self.samples[";".join(reversed(labels))] += 1
+
+
+class DeterministicProfiler(object):
+    """
+    确定性剖析器
+    -----------
+    - cProfile 只能剖析调用 enable 的线程，因此通过 IndexJob.probe_hook 在每个作业线程的下一次探测时开启剖析，
+      通过 Pipeline.item_hook 在流水线各阶段的工作线程处理下一项数据时开启剖析
+    - 剖析时间结束后，各线程在下一次探测（处理下一项数据）或结束时自行关闭剖析并提交结果
+    - 在 grace 时间内仍未提交结果的线程（比如卡在网络请求中，或流水线已没有数据可处理）会被记录在 unfinished 中，
+      其结果被丢弃。结束时无论如何都会卸载钩子，不让钩子留在探测的热路径上；cProfile 只能在开启它的线程中关闭，
+      这些线程的剖析会持续到线程结束（作业线程随作业结束），或下一次确定性剖析在该线程中重新开启并关闭剖析
+    - 重试队列、监视器等其它线程不在剖析范围内，可使用 SamplingProfiler 采集
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = False
+        self._profiles: Dict[int, Tuple[str, cProfile.Profile]] = {}
+        self._finished: List[Tuple[str, cProfile.Profile]] = []
+
+    @property
+    def unfinished(self) -> List[str]:
+        with self._lock:
+            return [name for name, _ in self._profiles.values()]
+
+    def run(self, duration: float, grace: float = 1.0) -> "DeterministicProfiler":
+        if not _profiling_lock.acquire(blocking=False):
+            raise ProfilerBusyError("Another profiling session is in progress.")
+        try:
+            self._active = True
+            IndexJob.probe_hook = self._on_probe
+            Pipeline.item_hook = self._on_probe
+            time.sleep(duration)
+            self._active = False
+            deadline = time.monotonic() + grace
+            while self.unfinished and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            self._active = False
+            if IndexJob.probe_hook == self._on_probe:
+                IndexJob.probe_hook = None
+            if Pipeline.item_hook == self._on_probe:
+                Pipeline.item_hook = None
+            _profiling_lock.release()
+        return self
+
+    def stats(self, sort: str = "cumulative", limit: Optional[int] = 50, per_thread: bool = True) -> str:
+        stream = io.StringIO()
+        with self._lock:
+            finished = self._finished.copy()
+        if not finished:
+            return "No samples were collected."
+
+        combined = pstats.Stats(finished[0][1], stream=stream)
+        for _, profile in finished[1:]:
+            combined.add(profile)
+        stream.write(f"===== all threads ({len(finished)}) =====\n")
+        combined.sort_stats(sort).print_stats(limit)
+
+        if per_thread:
+            for name, profile in finished:
+                stream.write(f"===== {name} =====\n")
+                pstats.Stats(profile, stream=stream).sort_stats(sort).print_stats(limit)
+
+        return stream.getvalue()
+
+    def _on_probe(self, sender: Union[IndexJob, Pipeline], stopping: bool = False):
+        ident = threading.get_ident()
+        with self._lock:
+            entry = self._profiles.get(ident)
+            if self._active and not stopping:
+                if entry is None:
+                    profile = cProfile.Profile()
+                    self._profiles[ident] = (threading.current_thread().name, profile)
+                    profile.enable()
+                return
+            if entry is None:
+                return
+            del self._profiles[ident]
+        entry[1].disable()
+        with self._lock:
+            self._finished.append(entry)
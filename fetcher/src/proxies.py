@@ -0,0 +1,134 @@
+#!/usr/env python3
+import random
+import time
+from collections import deque
+from enum import Enum
+from threading import Lock
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from .util import repr_injector
+
+
+class ProxyOutcome(Enum):
+    # 请求成功（包括用户不存在）
+    success = "success"
+    # 上游限流
+    throttled = "throttled"
+    # 其它失败（超时、上游错误等）
+    failure = "failure"
+
+
+@repr_injector
+class Proxy(object):
+    def __init__(self, url: str):
+        self.url = url
+        # 成功率的指数加权移动平均，新加入的代理视为完全成功，以便尽快得到样本
+        self.success_rate = 1.0
+        # 延迟的指数加权移动平均（秒），没有样本时为 None
+        self.latency: Optional[float] = None
+        # 冷却结束的时间（clock 的读数），冷却中的代理不会被选择
+        self.cooldown_until = 0.0
+        self.consecutive_throttles = 0
+        self.requests = 0
+        self.successes = 0
+        self.throttles = 0
+        self.failures = 0
+        self.cooldowns = 0
+        # 最近 throughput_window 秒内每秒的成功次数，元素为 [秒, 次数]
+        self._buckets: Deque[List[int]] = deque()
+
+
+@repr_injector
+class ProxyPool(object):
+    """
+    代理池
+    -----
+    - 上游按 IP 限流，每次探测经由 choose 选择的代理发出（NeteaseCloudMusicApi 的 proxy 参数），把请求分散到多个出口 IP
+    - 选择时随机取两个不在冷却中的代理，选择 成功率 / 延迟 较高的一个：偏向表现好的代理，又不会把请求全部压到同一个代理上
+    - 被限流的代理进入冷却，冷却时间为 cooldown 秒，连续被限流时加倍，不超过 max_cooldown 秒，成功一次即恢复
+    - 所有代理都在冷却中时选择最早结束冷却的一个，避免完全停止探测
+    """
+
+    def __init__(self, urls: List[str], cooldown: float = 30, max_cooldown: float = 600, throughput_window: int = 60,
+                 clock: Callable[[], float] = time.monotonic, seed: Optional[int] = None):
+        if not urls:
+            raise ValueError("At least one proxy is required!")
+
+        self.proxies = [Proxy(url) for url in urls]
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.throughput_window = throughput_window
+        self.clock = clock
+
+        self._lock = Lock()
+        self._random = random.Random(seed)
+
+    @staticmethod
+    def _score(proxy: Proxy) -> float:
+        # 没有延迟样本的代理优先，以便尽快得到样本
+        return proxy.success_rate / max(proxy.latency or 0.0, 1e-3)
+
+    def choose(self) -> Proxy:
+        with self._lock:
+            now = self.clock()
+            candidates = [proxy for proxy in self.proxies if proxy.cooldown_until <= now]
+            if not candidates:
+                proxy = min(self.proxies, key=lambda p: p.cooldown_until)
+            elif len(candidates) == 1:
+                proxy = candidates[0]
+            else:
+                proxy = max(self._random.sample(candidates, 2), key=self._score)
+            proxy.requests += 1
+            return proxy
+
+    def report(self, proxy: Proxy, outcome: ProxyOutcome, latency: Optional[float] = None):
+        with self._lock:
+            if latency is not None:
+                proxy.latency = latency if proxy.latency is None else 0.8 * proxy.latency + 0.2 * latency
+            proxy.success_rate = 0.9 * proxy.success_rate + (0.1 if outcome == ProxyOutcome.success else 0.0)
+            if outcome == ProxyOutcome.success:
+                proxy.successes += 1
+                proxy.consecutive_throttles = 0
+                self._count(proxy)
+            elif outcome == ProxyOutcome.throttled:
+                proxy.throttles += 1
+                proxy.consecutive_throttles += 1
+                # 冷却期间仍在进行中的请求被限流时不重复延长冷却
+                if proxy.cooldown_until <= self.clock():
+                    cooldown = min(self.max_cooldown, self.cooldown * 2 ** (proxy.consecutive_throttles - 1))
+                    proxy.cooldown_until = self.clock() + cooldown
+                    proxy.cooldowns += 1
+            else:
+                proxy.failures += 1
+
+    def _count(self, proxy: Proxy):
+        second = int(self.clock())
+        if proxy._buckets and proxy._buckets[-1][0] == second:
+            proxy._buckets[-1][1] += 1
+        else:
+            proxy._buckets.append([second, 1])
+        self._expire(proxy, second)
+
+    def _expire(self, proxy: Proxy, second: int):
+        while proxy._buckets and proxy._buckets[0][0] <= second - self.throughput_window:
+            proxy._buckets.popleft()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = self.clock()
+            result = {}
+            for proxy in self.proxies:
+                self._expire(proxy, int(now))
+                result[proxy.url] = {
+                    "successRate": proxy.success_rate,
+                    "latency": proxy.latency,
+                    "cooldown": max(0.0, proxy.cooldown_until - now),
+                    # 最近 throughput_window 秒内平均每秒的成功次数
+                    "throughput": sum(count for _, count in proxy._buckets) / self.throughput_window,
+                    "requests": proxy.requests,
+                    "successes": proxy.successes,
+                    "throttles": proxy.throttles,
+                    "failures": proxy.failures,
+                    "cooldowns": proxy.cooldowns,
+                }
+            return result
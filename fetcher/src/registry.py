@@ -0,0 +1,192 @@
+#!/usr/env python3
+import math
+from bisect import bisect_left, bisect_right
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+_end_type = Union[int, float]
+_interval_type = Tuple[int, _end_type]
+
+
+class IntervalSet(object):
+    """
+    区间集合
+    -------
+    - 以两个有序列表保存互不相交的整数闭区间（终点可以为无穷大），重叠或相邻的区间在加入时即被合并
+    - 插入、删除、查询都先二分定位到受影响的区间，只处理与之重叠的部分
+    """
+
+    def __init__(self, intervals: Iterable[_interval_type] = ()):
+        self._starts: List[int] = []
+        self._ends: List[_end_type] = []
+        for low, high in intervals:
+            self.add(low, high)
+
+    def __iter__(self) -> Iterator[_interval_type]:
+        return iter(list(zip(self._starts, self._ends)))
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __eq__(self, other):
+        if not isinstance(other, IntervalSet):
+            return False
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({list(self)!r})"
+
+    def copy(self) -> "IntervalSet":
+        result = IntervalSet()
+        result._starts = self._starts.copy()
+        result._ends = self._ends.copy()
+        return result
+
+    def add(self, low: int, high: _end_type):
+        # 与 [low, high] 重叠或相邻的区间为 [i, j)
+        i = bisect_left(self._ends, low - 1)
+        j = bisect_right(self._starts, high + 1)
+        if i < j:
+            low = min(low, self._starts[i])
+            high = max(high, self._ends[j - 1])
+        self._starts[i:j] = [low]
+        self._ends[i:j] = [high]
+
+    def remove(self, low: int, high: _end_type):
+        i = bisect_left(self._ends, low)
+        j = bisect_right(self._starts, high)
+        if i >= j:
+            return
+        starts, ends = [], []
+        if self._starts[i] < low:
+            starts.append(self._starts[i])
+            ends.append(low - 1)
+        if self._ends[j - 1] > high:
+            starts.append(high + 1)
+            ends.append(self._ends[j - 1])
+        self._starts[i:j] = starts
+        self._ends[i:j] = ends
+
+    def update(self, other: Iterable[_interval_type]):
+        for low, high in other:
+            self.add(low, high)
+
+    def overlapping(self, low: int, high: _end_type) -> List[_interval_type]:
+        """与 [low, high] 重叠的部分"""
+        i = bisect_left(self._ends, low)
+        j = bisect_right(self._starts, high)
+        return [(max(start, low), min(end, high)) for start, end in zip(self._starts[i:j], self._ends[i:j])]
+
+    def gaps(self, low: int, high: _end_type) -> List[_interval_type]:
+        """[low, high] 中不被集合覆盖的部分"""
+        result = []
+        position = low
+        for start, end in self.overlapping(low, high):
+            if start > position:
+                result.append((position, start - 1))
+            position = end + 1
+        # 被无穷大的终点覆盖时 position 也为无穷大
+        if position <= high and not math.isinf(position):
+            result.append((position, high))
+        return result
+
+
+def _to_json(intervals: Iterable[_interval_type]) -> List[List[Optional[int]]]:
+    return [[low, None if math.isinf(high) else high] for low, high in intervals]
+
+
+def _from_json(intervals: Iterable[List[Optional[int]]]) -> List[_interval_type]:
+    return [(low, math.inf if high is None else high) for low, high in intervals]
+
+
+class RangeRegistry(object):
+    """
+    用户 ID 区间登记表
+    ----------------
+    - 记录各抓取器认领的区间以及已完成的区间，新建抓取器时通过 claim 只认领尚未被覆盖的部分，同一区间不会被探测两次
+    - settle 以抓取器尚需处理的区间结算出已完成的部分，release 在删除抓取器时结算并释放其认领的区间，已完成的部分仍被保留
+    - 重试次数耗尽的索引记为失败而不是已完成，认领者释放后重新变为可认领，再次被认领时移出失败的区间
+    - 区间一律以 (最小值, 最大值) 的闭区间表示，与抓取器的方向无关，只适用于步长为 ±1 的抓取器
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._claims: Dict[str, IntervalSet] = {}
+        self._completed = IntervalSet()
+        self._failed = IntervalSet()
+
+    def covered(self) -> IntervalSet:
+        """已被认领或已完成的区间"""
+        with self._lock:
+            return self._covered()
+
+    def _covered(self) -> IntervalSet:
+        result = self._completed.copy()
+        for claimed in self._claims.values():
+            result.update(claimed)
+        return result
+
+    def claim(self, owner: str, low: int, high: _end_type) -> List[_interval_type]:
+        """认领 [low, high] 中尚未被覆盖的部分并返回，全部已被覆盖时返回空列表"""
+        with self._lock:
+            gaps = self._covered().gaps(low, high)
+            if gaps:
+                self._claims.setdefault(owner, IntervalSet()).update(gaps)
+                for gap_low, gap_high in gaps:
+                    self._failed.remove(gap_low, gap_high)
+            return gaps
+
+    def settle(self, owner: str, remaining: Iterable[_interval_type], failed: Iterable[_interval_type] = ()):
+        """
+        owner 认领的区间中，不在 remaining（尚需处理的区间，包括尚未得到重试结果的索引）中的部分视为已完成，
+        其中 failed（重试次数耗尽的索引）以及之前已记为失败的部分除外
+        """
+        with self._lock:
+            claimed = self._claims.get(owner)
+            if claimed is None:
+                return
+            for low, high in failed:
+                self._failed.update(claimed.overlapping(low, high))
+            done = claimed.copy()
+            for low, high in remaining:
+                done.remove(low, high)
+            for low, high in self._failed:
+                done.remove(low, high)
+            self._completed.update(done)
+
+    def release(self, owner: str, remaining: Iterable[_interval_type] = (), failed: Iterable[_interval_type] = ()):
+        self.settle(owner, remaining, failed)
+        self.discard(owner)
+
+    def discard(self, owner: str):
+        """放弃 owner 认领的区间，不结算已完成的部分（比如抓取器创建失败时）"""
+        with self._lock:
+            self._claims.pop(owner, None)
+
+    def query(self, low: int = 0, high: _end_type = math.inf) -> Dict[str, Any]:
+        """查询与 [low, high] 重叠的认领、已完成、失败以及尚未被覆盖的区间，默认查询所有非负的用户 ID"""
+        with self._lock:
+            return {
+                "claimed": {owner: _to_json(claimed.overlapping(low, high)) for owner, claimed in self._claims.items()
+                            if claimed.overlapping(low, high)},
+                "completed": _to_json(self._completed.overlapping(low, high)),
+                "failed": _to_json(self._failed.overlapping(low, high)),
+                "uncovered": _to_json(self._covered().gaps(low, high)),
+            }
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "claimed": {owner: _to_json(claimed) for owner, claimed in self._claims.items()},
+                "completed": _to_json(self._completed),
+                "failed": _to_json(self._failed),
+            }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "RangeRegistry":
+        registry = cls()
+        registry._claims = {owner: IntervalSet(_from_json(claimed)) for owner, claimed in data["claimed"].items()}
+        registry._completed = IntervalSet(_from_json(data["completed"]))
+        # 较早保存的登记表中没有失败的区间
+        registry._failed = IntervalSet(_from_json(data.get("failed", [])))
+        return registry
@@ -0,0 +1,167 @@
+#!/usr/env python3
+import heapq
+import random
+import sys
+import time
+from itertools import count
+from threading import Condition, Thread
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from .exceptions import ExplicitlyRetryHandlingError, ExplicitlySkipHandlingError, JobCancelError
+from .flag import ThreadFlag
+from .status import IStatus
+from .util import repr_injector
+
+if TYPE_CHECKING:
+    from .job import IndexJob
+
+_worker_thread_factory_type = Optional[Callable[[Callable[[], None], int], Thread]]
+
+
+@repr_injector
+class RetryQueue(IStatus):
+    """
+    重试队列
+    --------
+    - 存放处理过程中遇到暂时性错误（ExplicitlyRetryHandlingError）的索引
+    - 由独立的工作线程按指数退避（附带随机抖动）的时间重新处理，不会阻塞作业的扫描前沿
+    - 重试结果会通过 IndexJob.merge_retry_result 合并回对应的作业
+    - 作业的熔断器尚未稳定（见 CircuitBreaker.settled）时，重试失败不计入重试次数，不会因上游反复不稳定而耗尽
+    """
+
+    def __init__(self, workers: int = 1, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 jitter: float = 0.5, name: Optional[str] = None,
+                 worker_thread_factory: _worker_thread_factory_type = None):
+        if workers <= 0:
+            raise ValueError(f"The number of workers must be positive: {workers!r}")
+        if not 0 <= jitter <= 1:
+            raise ValueError(f"The jitter must be between 0 and 1: {jitter!r}")
+
+        self.name = name or self.__class__.__name__
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+        self._flag = ThreadFlag(ThreadFlag.pending)
+        self._cond = Condition()
+        self._heap: List[Tuple[float, int, "IndexJob", int, int]] = []
+        self._seq = count()
+        self._threads: List[Thread] = []
+        self._worker_thread_factory = worker_thread_factory or (
+            lambda work_func, n: Thread(name=f"{self.name}-retry-{n}", target=work_func, daemon=True)
+        )
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    @property
+    def flag(self):
+        return self._flag
+
+    @property
+    def working(self):
+        return ThreadFlag.running in self._flag
+
+    def delay(self, attempt: int) -> float:
+        """第 attempt 次（从 0 开始）重试前需要等待的秒数"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+    def put(self, job: "IndexJob", i: int, attempt: int = 0):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + self.delay(attempt), next(self._seq), job, i, attempt))
+            self._cond.notify()
+
+    def pending(self) -> Dict["IndexJob", int]:
+        """各个作业尚在队列中等待重试的索引数量"""
+        result = {}
+        with self._cond:
+            for _, _, job, _, _ in self._heap:
+                result[job] = result.get(job, 0) + 1
+        return result
+
+    def start(self):
+        if ThreadFlag.stopping in self._flag:
+            raise RuntimeError("Cannot start a stopped retry queue again!")
+        if self.working:
+            return
+        self._flag -= ThreadFlag.pending
+        self._flag += ThreadFlag.running
+        self._threads = [self._worker_thread_factory(self._work, n) for n in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        if ThreadFlag.pending in self._flag:
+            return
+        with self._cond:
+            self._flag -= ThreadFlag.running
+            self._flag += ThreadFlag.stopping
+            dropped, self._heap = self._heap, []
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        # 被丢弃的索引也需要通知作业，否则作业会一直等待其结果
+        for _, _, job, i, _ in dropped:
+            job.merge_retry_result(i, False, abandoned=True)
+
+    def _take(self):
+        with self._cond:
+            while True:
+                if not self.working:
+                    return None
+                if self._heap:
+                    wait_time = self._heap[0][0] - time.monotonic()
+                    if wait_time <= 0:
+                        return heapq.heappop(self._heap)
+                else:
+                    wait_time = None
+                self._cond.wait(wait_time)
+
+    def _work(self):
+        while True:
+            item = self._take()
+            if item is None:
+                break
+            _, _, job, i, attempt = item
+            # 作业已结束（比如被取消）时，不再重试其索引
+            if not job.working:
+                job.merge_retry_result(i, False, abandoned=True)
+                continue
+            self._retry(job, i, attempt)
+
+    def _retry(self, job: "IndexJob", i: int, attempt: int):
+        # noinspection PyBroadException
+        try:
+            job.emitter.emit("IndexJob.retrying", job, i)
+            job.retry(i)
+        except ExplicitlyRetryHandlingError:
+            # 熔断器断开或刚恢复时上游尚不稳定，这期间的失败不计入重试次数
+            breaker = job.breaker
+            if breaker is not None and not breaker.settled:
+                self.put(job, i, attempt)
+                return
+            if attempt + 1 < self.max_attempts:
+                self.put(job, i, attempt + 1)
+                return
+            job.emitter.emit("IndexJob.retry_exhausted", job, i, sys.exc_info())
+            job.merge_retry_result(i, False, failed=True)
+            return
+        except ExplicitlySkipHandlingError:
+            job.emitter.emit("IndexJob.retry_skipped", job, i, sys.exc_info())
+        except JobCancelError:
+            # 作业在重试过程中被取消
+            job.merge_retry_result(i, False, abandoned=True)
+            return
+        except Exception:
+            job.emitter.emit("IndexJob.unexpected_exception", job, sys.exc_info())
+            job.merge_retry_result(i, False, failed=True)
+            return
+        else:
+            job.emitter.emit("IndexJob.retried", job, i)
+            job.merge_retry_result(i, True)
+            return
+        job.merge_retry_result(i, False)
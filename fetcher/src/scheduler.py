@@ -0,0 +1,369 @@
+#!/usr/env python3
+import heapq
+import math
+from collections import deque
+from concurrent.futures import Future
+from itertools import count
+from threading import Lock, Thread
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .util import repr_injector
+
+
+@repr_injector
+class FairShare(object):
+    """调度器中的一个参与者（通常对应一个抓取器），权重越大，额度紧张时分得的份额越多"""
+
+    def __init__(self, scheduler: "FairScheduler", name: str, weight: float):
+        self.scheduler = scheduler
+        self.name = name
+
+        self._weight = weight
+        # 该参与者最近一个请求的虚拟完成时间
+        self._last_finish = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.granted = 0
+
+    @property
+    def weight(self) -> float:
+        return self._weight
+
+    @weight.setter
+    def weight(self, value: float):
+        if value <= 0:
+            raise ValueError(f"The weight must be positive: {value!r}")
+        self._weight = value
+
+    def acquire(self) -> Future:
+        return self.scheduler.acquire(self)
+
+    def release(self):
+        self.scheduler.release(self)
+
+
+@repr_injector
+class FairScheduler(object):
+    """
+    全局并发额度与加权公平排队
+    -----------------------
+    - 同时进行中的探测数不超过 budget，所有抓取器共享这一额度
+    - 额度用尽时按加权公平排队（WFQ）授予：每个请求的虚拟完成时间为 max(全局虚拟时间, 同一参与者上一个请求的虚拟完成时间)
+      加上 1 / 权重，额度释放时授予虚拟完成时间最小的请求。权重高的参与者优先，但权重低的参与者也始终能分到与权重成比例的份额
+    - 闲置的参与者不会积攒额度，重新开始请求时从当前的全局虚拟时间排起
+    - acquire 返回 Future，得到额度时完成，作业可以用 IndexJob.wait 等待，被取消时 Future 随之取消，不会占用额度
+    """
+
+    def __init__(self, budget: int):
+        if budget <= 0:
+            raise ValueError(f"The budget must be positive: {budget!r}")
+
+        self.budget = budget
+
+        self._lock = Lock()
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        self._heap: List[Tuple[float, int, float, FairShare, Future]] = []
+        self._seq = count()
+        self._shares: List[FairShare] = []
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def register(self, name: str, weight: float = 1.0) -> FairShare:
+        share = FairShare(self, name, 1.0)
+        share.weight = weight
+        with self._lock:
+            self._shares.append(share)
+        return share
+
+    def unregister(self, share: FairShare):
+        with self._lock:
+            if share in self._shares:
+                self._shares.remove(share)
+
+    def acquire(self, share: FairShare) -> Future:
+        future = Future()
+        with self._lock:
+            start = max(self._virtual_time, share._last_finish)
+            share._last_finish = start + 1 / share.weight
+            if self._in_flight < self.budget and not self._heap:
+                self._grant(start, share, future)
+            else:
+                share.waiting += 1
+                heapq.heappush(self._heap, (share._last_finish, next(self._seq), start, share, future))
+        return future
+
+    def release(self, share: FairShare):
+        with self._lock:
+            share.in_flight -= 1
+            self._in_flight -= 1
+            while self._heap and self._in_flight < self.budget:
+                _, _, start, waiting_share, future = heapq.heappop(self._heap)
+                waiting_share.waiting -= 1
+                self._grant(start, waiting_share, future)
+
+    def _grant(self, start: float, share: FairShare, future: Future):
+        # 等待者已被取消（比如作业被取消）时直接跳过
+        if not future.set_running_or_notify_cancel():
+            return
+        self._virtual_time = max(self._virtual_time, start)
+        self._in_flight += 1
+        share.in_flight += 1
+        share.granted += 1
+        future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "inFlight": self._in_flight,
+                "shares": {
+                    share.name: {
+                        "weight": share.weight,
+                        "inFlight": share.in_flight,
+                        "waiting": share.waiting,
+                        "granted": share.granted,
+                    } for share in self._shares
+                },
+            }
+
+
+@repr_injector
+class JobLane(object):
+    """
+    作业池中的一个参与者（通常对应一个抓取器），同时运行的作业数不超过 limit
+    - weight 越大，线程紧张时分得的线程越多
+    - 设置了 preempt 时，其它参与者分不到线程的情况下，作业池会调用它请该参与者让出一个线程（比如让一个作业提前结束），
+      返回是否有作业会因此让出线程
+    """
+
+    def __init__(self, pool: "JobPool", name: str, limit: int, weight: float = 1.0,
+                 preempt: Optional[Callable[[], bool]] = None):
+        self.pool = pool
+        self.name = name
+        self.preempt = preempt
+
+        self._limit = limit
+        self._weight = weight
+        # 排队中的作业：(提交序号, 作业, Future)
+        self._queue: Deque[Tuple[int, Callable[[], Any], Future]] = deque()
+        self._thread_seq = count()
+        self.running = 0
+        # 已请求让出、尚未让出的线程数
+        self.yielding = 0
+        self.preempted = 0
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @limit.setter
+    def limit(self, value: int):
+        self.pool.set_limit(self, value)
+
+    @property
+    def weight(self) -> float:
+        return self._weight
+
+    @weight.setter
+    def weight(self, value: float):
+        if value <= 0:
+            raise ValueError(f"The weight must be positive: {value!r}")
+        self._weight = value
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    @property
+    def idle(self) -> int:
+        """还能立即开始运行的作业数"""
+        return self.pool.idle(self)
+
+    def submit(self, fn: Callable[[], Any]) -> Future:
+        return self.pool.submit(self, fn)
+
+    def close(self):
+        self.pool.unregister(self)
+
+
+@repr_injector
+class JobPool(object):
+    """
+    作业池
+    -----
+    - 每个作业在自己的线程中运行，线程随作业结束而退出，作业线程的数量即正在运行的作业数
+    - 每个参与者同时运行的作业数不超过其 limit，超出的作业排队；调低 limit 时，正在运行的作业照常运行到结束，
+      在此之前不会开始新的作业
+    - 设置了 max_workers 时，所有参与者同时运行的作业总数（即所有抓取器的作业线程总数）也不超过它。有空闲的线程时，
+      在有作业排队且未达到 limit 的参与者中，选择运行中的作业数与权重之比最小的一个，同一参与者的作业按提交顺序开始
+    - 作业通常要运行很久，线程被先来的参与者占满后，后来的参与者可能长时间分不到线程：此时请运行中的作业数超出其按权重
+      应得份额最多的参与者让出线程（见 JobLane.preempt），让出的线程由分不到线程的参与者优先取得
+    - submit 返回 Future，排队中的作业可以取消，被取消的作业不会占用名额
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is not None and max_workers <= 0:
+            raise ValueError(f"The max workers must be positive: {max_workers!r}")
+
+        self.max_workers = max_workers
+
+        self._lock = Lock()
+        self._running = 0
+        self._seq = count()
+        self._lanes: List[JobLane] = []
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def register(self, name: str, limit: int, weight: float = 1.0,
+                 preempt: Optional[Callable[[], bool]] = None) -> JobLane:
+        if limit <= 0:
+            raise ValueError(f"The limit must be positive: {limit!r}")
+        lane = JobLane(self, name, limit, 1.0, preempt)
+        lane.weight = weight
+        with self._lock:
+            self._lanes.append(lane)
+        return lane
+
+    def unregister(self, lane: JobLane):
+        with self._lock:
+            if lane in self._lanes:
+                self._lanes.remove(lane)
+
+    def set_limit(self, lane: JobLane, limit: int):
+        if limit <= 0:
+            raise ValueError(f"The limit must be positive: {limit!r}")
+        with self._lock:
+            lane._limit = limit
+            starts = self._dispatch()
+        self._start(starts)
+
+    def idle(self, lane: JobLane) -> int:
+        with self._lock:
+            idle = lane._limit - lane.running - len(lane._queue)
+            if self.max_workers is not None:
+                idle = min(idle, self.max_workers - self._running - sum(len(lane_._queue) for lane_ in self._lanes))
+            return max(0, idle)
+
+    def submit(self, lane: JobLane, fn: Callable[[], Any]) -> Future:
+        future = Future()
+        with self._lock:
+            lane._queue.append((next(self._seq), fn, future))
+            starts = self._dispatch()
+            victims = self._rebalance()
+        self._start(starts)
+        self._preempt(victims)
+        return future
+
+    def _dispatch(self) -> List[Tuple[JobLane, Callable[[], Any], Future]]:
+        """取出可以开始运行的作业（调用者需持有 _lock），排队中已被取消的作业被丢弃"""
+        for lane in self._lanes:
+            if any(future.cancelled() for _, _, future in lane._queue):
+                lane._queue = deque(entry for entry in lane._queue if not entry[2].cancelled())
+        starts = []
+        while self.max_workers is None or self._running < self.max_workers:
+            lanes = [lane for lane in self._lanes if lane._queue and lane.running < lane._limit]
+            if not lanes:
+                break
+            lane = min(lanes, key=lambda lane_: (lane_.running / lane_.weight, lane_._queue[0][0]))
+            _, fn, future = lane._queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            lane.running += 1
+            self._running += 1
+            starts.append((lane, fn, future))
+        return starts
+
+    def _rebalance(self) -> List[JobLane]:
+        """
+        找出需要让出线程的参与者（调用者需持有 _lock）：分不到线程的参与者每缺一个应得的线程，请一个运行中的作业数超出其
+        应得份额最多的参与者让出一个线程，已请求而尚未让出的线程计入其中
+        """
+        if self.max_workers is None:
+            return []
+        active = [lane for lane in self._lanes if lane.running or lane._queue]
+        total_weight = sum(lane.weight for lane in active)
+        if not total_weight:
+            return []
+
+        def fair_share(lane_: JobLane) -> float:
+            return self.max_workers * lane_.weight / total_weight
+
+        # 缺少的线程数：排队中的作业因线程总数已满而不能开始，且运行中的作业数未达到应得的份额
+        deficit = sum(max(0, min(lane.running + len(lane._queue), lane._limit, math.ceil(fair_share(lane)))
+                          - lane.running) for lane in active if lane._queue)
+        free = self.max_workers - self._running + sum(lane.yielding for lane in active)
+        victims = []
+        while deficit > free:
+            candidates = [lane for lane in active if lane.preempt is not None
+                          and lane.running - lane.yielding > fair_share(lane)]
+            if not candidates:
+                break
+            victim = max(candidates, key=lambda lane_: (lane_.running - lane_.yielding) / lane_.weight)
+            victim.yielding += 1
+            victims.append(victim)
+            free += 1
+        return victims
+
+    def _preempt(self, victims: List[JobLane]):
+        # 提交作业的一方可能持有自己的锁（比如抓取器调整大小时），让出线程需要取得被请求的参与者的锁，在单独的线程中进行
+        if victims:
+            Thread(name=f"{self.__class__.__name__}-preempt", target=self._request_yield, args=(victims,),
+                   daemon=True).start()
+
+    def _request_yield(self, victims: List[JobLane]):
+        for lane in victims:
+            # noinspection PyBroadException
+            try:
+                preempted = lane.preempt()
+            except Exception:
+                preempted = False
+            with self._lock:
+                if preempted:
+                    lane.preempted += 1
+                else:
+                    lane.yielding = max(0, lane.yielding - 1)
+
+    def _start(self, starts: List[Tuple[JobLane, Callable[[], Any], Future]]):
+        for lane, fn, future in starts:
+            Thread(name=f"{lane.name}_{next(lane._thread_seq)}", target=self._run, args=(lane, fn, future)).start()
+
+    def _run(self, lane: JobLane, fn: Callable[[], Any], future: Future):
+        result, exception = None, None
+        try:
+            result = fn()
+        except BaseException as e:
+            exception = e
+        # 先让出名额再完成 Future，等待作业结束的一方看到的名额总是已经释放的
+        with self._lock:
+            lane.running -= 1
+            self._running -= 1
+            lane.yielding = max(0, lane.yielding - 1)
+            starts = self._dispatch()
+            victims = self._rebalance()
+        self._start(starts)
+        self._preempt(victims)
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "maxWorkers": self.max_workers,
+                "running": self._running,
+                "lanes": {
+                    lane.name: {
+                        "limit": lane._limit,
+                        "weight": lane.weight,
+                        "running": lane.running,
+                        "queued": len(lane._queue),
+                        "preempted": lane.preempted,
+                    } for lane in self._lanes
+                },
+            }
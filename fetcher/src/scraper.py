@@ -0,0 +1,283 @@
+#!/usr/env python3
+import socket
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures import wait
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from . import jsoncodec
+from .backends import BackendPool
+from .exceptions import ExplicitlyRetryHandlingError, UserNotFoundError
+from .journal import ProbeJournal, ProbeOutcome
+from .latency import LatencyWindow
+from .pipeline import Pipeline
+from .proxies import Proxy, ProxyOutcome, ProxyPool
+from .tracing import span
+from .util import repr_injector
+
+_store_type = Callable[[int, Union[Dict[str, Any], bytes]], None]
+_timeout_type = Optional[Union[float, Tuple[float, float]]]
+
+
+class CancellableHTTPAdapter(HTTPAdapter):
+    """
+    可取消的 HTTP 适配器
+    ------------------
+    - 记录经由本适配器建立的连接，cancel 时关闭（shutdown）这些连接的套接字，阻塞在读写上的请求会立即以连接错误结束
+    - 被关闭的空闲连接在下次使用前会被连接池识别并重新建立，适配器在取消之后仍可继续使用
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._connections = weakref.WeakSet()
+        self._connections_lock = Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": self._tracked_pool_class(HTTPConnectionPool),
+            "https": self._tracked_pool_class(HTTPSConnectionPool),
+        }
+
+    def _tracked_pool_class(self, pool_class):
+        adapter = self
+
+        class TrackedConnection(pool_class.ConnectionCls):
+            def connect(self):
+                super().connect()
+                with adapter._connections_lock:
+                    adapter._connections.add(self)
+
+        return type(pool_class.__name__, (pool_class,), {"ConnectionCls": TrackedConnection})
+
+    def cancel(self):
+        with self._connections_lock:
+            connections = list(self._connections)
+        for connection in connections:
+            sock = getattr(connection, "sock", None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def probe_user_detail(url: str, uid: int, session: Optional[requests.Session] = None, proxy: Optional[str] = None,
+                      timeout: _timeout_type = 5) -> bool:
+    """以已知有效的用户 ID 请求一次用户详情，业务码为 200 时返回 True，用于确认上游确实能正常答复而不只是可以连接"""
+    params = {"uid": uid} if proxy is None else {"uid": uid, "proxy": proxy}
+    try:
+        r = (session or requests).get(url, params=params, timeout=timeout)
+        if r.status_code != 200:
+            return False
+        data = jsoncodec.loads(r.content)
+    except (requests.RequestException, ValueError):
+        return False
+    return isinstance(data, dict) and data.get("code") == 200
+
+
+@repr_injector
+class UserInfoScraper(object):
+    """
+    用户信息抓取器
+    -------------
+    将一次探测拆分为获取（HTTP 请求）、解析（JSON 解码与校验）、存储三个步骤，可组装为 Pipeline 作为作业的处理器
+    给定 journal 时，每次探测的结果都会记录到探测日志中
+    请求以 timeout（连接超时，读取超时）为限，cancel 可立即中断所有进行中的请求，用于快速停止
+
+    自适应超时与对冲请求（需要至少 min_samples 个最近请求的延迟样本）：
+    - 设置了 timeout_multiplier 时，读取超时取最近延迟的 p99 的 timeout_multiplier 倍，不小于 min_timeout，
+      不大于 timeout 中的读取超时
+    - 设置了 hedge_quantile 时，请求在该分位数的延迟内仍未返回，则再发出一个相同的请求，先成功返回的为准，
+      另一个请求在后台结束。每次探测最多多出一个请求
+    给定 backends 时，每个请求（包括对冲请求）都由后端池选择发往哪个后端，url 不再使用
+    给定 proxies 时，每个请求都经由代理池选择的代理发出，解析时根据结果（业务码属于 throttle_codes 即为被限流）向代理池报告
+    响应体以 jsoncodec 解码（可用时使用 orjson）；raw 为 True 时 store 收到的是校验过的响应体原始字节而不是解码后的字典，
+    可直接嵌入存储记录，免去重新编码
+    """
+
+    def __init__(self, url: str, store: _store_type, session: Optional[requests.Session] = None,
+                 journal: Optional[ProbeJournal] = None, timeout: _timeout_type = (3.05, 30),
+                 timeout_multiplier: Optional[float] = None, min_timeout: float = 1.0,
+                 hedge_quantile: Optional[float] = None, hedge_workers: int = 8, min_samples: int = 50,
+                 backends: Optional[BackendPool] = None, proxies: Optional[ProxyPool] = None,
+                 throttle_codes: Tuple[int, ...] = (-460, 405), raw: bool = False):
+        self.url = url
+        self.backends = backends
+        self.proxies = proxies
+        self.throttle_codes = throttle_codes
+        self.raw = raw
+        self.store = store
+        self.session = session or requests.session()
+        self.journal = journal
+        self.timeout = timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.latency = LatencyWindow()
+
+        self._adapter = CancellableHTTPAdapter()
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge") \
+            if hedge_quantile is not None else None
+        self._lock = Lock()
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    def cancel(self):
+        """中断所有进行中的请求，它们会以连接错误结束"""
+        self._adapter.cancel()
+
+    def close(self):
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+
+    def current_timeout(self) -> _timeout_type:
+        timeout = self.timeout
+        if self.timeout_multiplier is None or len(self.latency) < self.min_samples:
+            return timeout
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        adaptive = max(self.min_timeout, self.latency.quantile(0.99) * self.timeout_multiplier)
+        if read_timeout is not None:
+            adaptive = min(adaptive, read_timeout)
+        return connect_timeout, adaptive
+
+    def stats(self) -> Dict[str, Any]:
+        timeout = self.current_timeout()
+        return {
+            "samples": len(self.latency),
+            "p50": self.latency.quantile(0.5),
+            "p95": self.latency.quantile(0.95),
+            "p99": self.latency.quantile(0.99),
+            "readTimeout": timeout[1] if isinstance(timeout, tuple) else timeout,
+            "hedged": self._hedged,
+            "hedgeWins": self._hedge_wins,
+        }
+
+    def fetch(self, i: int) -> Tuple[int, requests.Response]:
+        try:
+            with span("http.request", url=self.url):
+                if self._hedge_executor is None or len(self.latency) < self.min_samples:
+                    return i, self._get(i)
+                return i, self._hedged_get(i)
+        except requests.RequestException as e:
+            self._record(i, ProbeOutcome.error)
+            raise ExplicitlyRetryHandlingError(f"{e!r}") from e
+
+    def _get(self, i: int) -> requests.Response:
+        timeout = self.current_timeout()
+        backend = None if self.backends is None else self.backends.acquire()
+        proxy = None if self.proxies is None else self.proxies.choose()
+        params = {"uid": i} if proxy is None else {"uid": i, "proxy": proxy.url}
+        try:
+            r = self.session.get(self.url if backend is None else backend.url, params=params, timeout=timeout)
+        except requests.RequestException as e:
+            latency = None
+            if isinstance(e, requests.ReadTimeout):
+                # 超时的请求以超时时间计入样本，否则样本只包含快的请求，超时会越算越短
+                latency = timeout[1] if isinstance(timeout, tuple) else timeout
+                self.latency.add(latency)
+            if backend is not None:
+                self.backends.release(backend, False, latency)
+            if proxy is not None:
+                self.proxies.report(proxy, ProxyOutcome.failure, latency)
+            raise
+        latency = r.elapsed.total_seconds()
+        self.latency.add(latency)
+        if backend is not None:
+            self.backends.release(backend, r.status_code < 500, latency)
+        # 是否被限流要到解析时才能确定，在解析时报告
+        r.proxy = proxy
+        return r
+
+    def _hedged_get(self, i: int) -> requests.Response:
+        primary = self._hedge_executor.submit(self._get, i)
+        try:
+            return primary.result(timeout=self.latency.quantile(self.hedge_quantile))
+        except FuturesTimeoutError:
+            pass
+        with self._lock:
+            self._hedged += 1
+        hedge = self._hedge_executor.submit(self._get, i)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    return future.result()
+            # 两个请求都失败时抛出后失败的异常
+            if not pending:
+                raise done.pop().exception()
+
+    def parse(self, item: Tuple[int, requests.Response]) -> Tuple[int, Union[Dict[str, Any], bytes]]:
+        i, r = item
+        if r.status_code == 404:
+            self._report_proxy(r, 404)
+            self._record(i, ProbeOutcome.invalid, r)
+            raise UserNotFoundError(i)
+        if r.status_code != 200:
+            self._report_proxy(r)
+            self._record(i, ProbeOutcome.retry, r)
+            raise ExplicitlyRetryHandlingError(f"HTTP {r.status_code}")
+        with span("json.decode", size=len(r.content)):
+            data = jsoncodec.loads(r.content)
+        self._report_proxy(r, data["code"])
+        if data["code"] == 404:
+            self._record(i, ProbeOutcome.invalid, r, data["code"])
+            raise UserNotFoundError(i)
+        if data["code"] != 200:
+            self._record(i, ProbeOutcome.retry, r, data["code"])
+            raise ExplicitlyRetryHandlingError(f"{data}")
+        self._record(i, ProbeOutcome.valid, r, data["code"])
+        return i, r.content if self.raw else data
+
+    def _report_proxy(self, r: requests.Response, code: Optional[int] = None):
+        proxy: Optional[Proxy] = getattr(r, "proxy", None)
+        if proxy is None:
+            return
+        if code is None:
+            # 被限流时 HTTP 状态码不一定固定，以响应体中的业务码为准
+            try:
+                data = jsoncodec.loads(r.content)
+            except ValueError:
+                data = None
+            code = data.get("code") if isinstance(data, dict) else None
+        if code in (200, 404):
+            outcome = ProxyOutcome.success
+        elif code in self.throttle_codes or r.status_code == 429:
+            outcome = ProxyOutcome.throttled
+        else:
+            outcome = ProxyOutcome.failure
+        self.proxies.report(proxy, outcome, r.elapsed.total_seconds())
+
+    def _record(self, i: int, outcome: ProbeOutcome, r: Optional[requests.Response] = None, code: int = 0):
+        if self.journal is None:
+            return
+        if r is None:
+            self.journal.append(i, outcome)
+        else:
+            self.journal.append(i, outcome, r.status_code, code, r.elapsed.total_seconds())
+
+    def save(self, item: Tuple[int, Union[Dict[str, Any], bytes]]):
+        with span("storage.write"):
+            self.store(*item)
+
+    def pipeline(self, name: Optional[str] = None, fetch_workers: int = 1, parse_workers: int = 1,
+                 store_workers: int = 1, queue_size: int = 100) -> Pipeline:
+        # 获取 -> 解析 -> 存储，解析完成后作业即可得知索引是否有效，存储在后台进行
+        return Pipeline(name=name) \
+            .add_stage("fetch", self.fetch, fetch_workers, queue_size) \
+            .add_stage("parse", self.parse, parse_workers, queue_size, outcome=True) \
+            .add_stage("store", self.save, store_workers, queue_size)
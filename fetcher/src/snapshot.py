@@ -0,0 +1,164 @@
+#!/usr/env python3
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from . import jsoncodec
+
+
+class Snapshot(NamedTuple):
+    version: int
+    etag: str
+    # 序列化后的完整快照
+    body: bytes
+    # 与上一版本之间的 JSON Merge Patch（RFC 7386），首个版本为 None
+    patch: Optional[bytes]
+
+
+def _json_default(obj):
+    # 与 FastAPI 默认的编码方式保持一致
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+def dumps(data: Any) -> bytes:
+    return jsoncodec.dumps(data, default=_json_default)
+
+
+def merge_patch(old: Any, new: Any) -> Any:
+    """
+    计算从 old 到 new 的 JSON Merge Patch
+    -----------------------------------
+    - 只对字典逐键比较，其它类型的值发生变化时整体替换
+    - 被删除的键以 None 表示，因此值为 None 的键在应用补丁后会被删除，读取时视为 None 即可
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+    patch = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] != value:
+            patch[key] = merge_patch(old[key], value)
+    return patch
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断请求头 If-None-Match 是否与 etag 匹配（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().replace("W/", "", 1) == etag for tag in if_none_match.split(","))
+
+
+class SnapshotPublisher(object):
+    """
+    快照发布器
+    ---------
+    - 每次 publish 只序列化一次快照，并计算 ETag 以及与上一版本之间的差异，所有读取者和订阅者共享同一份结果
+    - 内容没有变化时不会产生新的版本
+    - 订阅者的回调在发布快照的线程中调用，只应做通知之类的轻量工作
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._latest: Optional[Snapshot] = None
+        self._latest_data: Any = None
+        self._subscribers: List[Callable[[Snapshot], None]] = []
+
+    @property
+    def latest(self) -> Optional[Snapshot]:
+        return self._latest
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, data: Any) -> Snapshot:
+        body = dumps(data)
+        with self._lock:
+            latest = self._latest
+            if latest is not None and latest.body == body:
+                return latest
+            if latest is None:
+                version, patch = 1, None
+            else:
+                version, patch = latest.version + 1, dumps(merge_patch(self._latest_data, data))
+            etag = '"%d-%s"' % (version, hashlib.blake2b(body, digest_size=8).hexdigest())
+            self._latest = snapshot = Snapshot(version, etag, body, patch)
+            self._latest_data = data
+            subscribers = self._subscribers.copy()
+        for callback in subscribers:
+            callback(snapshot)
+        return snapshot
+
+    def subscribe(self, callback: Callable[[Snapshot], None]):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Snapshot], None]):
+        with self._lock:
+            try:
+                self._subscribers.remove(callback)
+            except ValueError:
+                pass
+
+    def subscription(self) -> "SnapshotSubscription":
+        return SnapshotSubscription(self)
+
+
+class SnapshotSubscription(object):
+    """
+    在事件循环中订阅快照
+    -----------------
+    - 发布时只通知订阅者有新版本，不缓存消息，订阅者处理得慢也不会积压
+    - 订阅者落后不止一个版本时，补丁无法衔接，改为发送完整快照
+    """
+
+    def __init__(self, publisher: SnapshotPublisher):
+        self.publisher = publisher
+        self._loop = asyncio.get_event_loop()
+        self._event = asyncio.Event()
+        self._version = 0
+
+    def __enter__(self):
+        self.publisher.subscribe(self._notify)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.publisher.unsubscribe(self._notify)
+
+    def _notify(self, snapshot: Snapshot):
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            self.publisher.unsubscribe(self._notify)
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Tuple[str, Snapshot]]:
+        """
+        等待下一条消息
+        ------------
+        - 返回 ("snapshot", 快照) 或 ("patch", 快照)，前者应发送 body，后者应发送 patch
+        - 超时返回 None，便于调用者检查连接是否断开或发送心跳
+
+        :return: Optional[Tuple[str, Snapshot]]
+        """
+        while True:
+            # 先清除再检查，检查之后发布的新版本一定会再次唤醒
+            self._event.clear()
+            snapshot = self.publisher.latest
+            if snapshot is not None and snapshot.version != self._version:
+                kind = "patch" if snapshot.version == self._version + 1 and self._version else "snapshot"
+                self._version = snapshot.version
+                return kind, snapshot
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
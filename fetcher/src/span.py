@@ -7,6 +7,8 @@ from .util import repr_injector
 
 @repr_injector
 class Span(object):
+    __slots__ = ("begin", "end")
+
     def __init__(self, begin: int, end: Union[int, float]):
         # 如果 end 不是无穷大，则对其取整
         if math.fabs(end) != float("inf"):
@@ -18,7 +20,7 @@ class Span(object):
     def __eq__(self, other):
         if not isinstance(other, Span):
             return False
-        return self.__dict__ == other.__dict__
+        return self._key() == other._key()
 
     def __hash__(self):
         return hash(self.begin) ^ hash(self.end)
@@ -43,8 +45,13 @@ class Span(object):
     def contain(self, i):
         return self.min_val <= i <= self.max_val
 
+    def _key(self):
+        return self.begin, self.end
+
 
 class StepSpan(Span):
+    __slots__ = ("step",)
+
     def __init__(self, begin: int, end: Optional[Union[int, float]] = None, step: int = 1):
         if end is None:
             end = math.copysign(float("inf"), step)
@@ -59,7 +66,7 @@ class StepSpan(Span):
     def __eq__(self, other):
         if not isinstance(other, StepSpan):
             return False
-        return self.__dict__ == other.__dict__
+        return self._key() == other._key()
 
     def __hash__(self):
         return hash(self.begin) ^ hash(self.end) ^ hash(self.step)
@@ -70,11 +77,17 @@ class StepSpan(Span):
     def __str__(self):
         return f"begin={self.begin}, end={self.end}, step={self.step}"
 
+    def _key(self):
+        return self.begin, self.end, self.step
+
 
 class WorkSpan(StepSpan):
+    # 已处理的区间只以两个整数（最小值、最大值）记录，处理每个索引时原地更新，不会创建新的对象
+    __slots__ = ("_worked_min", "_worked_max", "_current")
 
     def __init__(self, begin: int, end: Optional[int] = None, step: int = 1):
-        self._worked_span: Optional[Span] = None
+        self._worked_min: Optional[int] = None
+        self._worked_max: Optional[int] = None
         self._current = None
 
         super().__init__(begin, end, step)
@@ -82,7 +95,7 @@ class WorkSpan(StepSpan):
     def __eq__(self, other):
         if not isinstance(other, WorkSpan):
             return False
-        return self.__dict__ == other.__dict__
+        return self._key() == other._key()
 
     def __hash__(self):
         return hash(self.begin) ^ hash(self.end) ^ hash(self.step) ^ hash(self.worked_span) ^ hash(self.current)
@@ -94,8 +107,13 @@ class WorkSpan(StepSpan):
         return f"begin={self.begin}, end={self.end}, step={self.step}, current={self.current}"
 
     @property
-    def worked_span(self):
-        return self._worked_span
+    def worked_span(self) -> Optional[Span]:
+        if self._worked_min is None:
+            return None
+        # 与自身方向保持一致
+        if self.step < 0:
+            return Span(self._worked_max, self._worked_min)
+        return Span(self._worked_min, self._worked_max)
 
     @property
     def current(self):
@@ -103,29 +121,30 @@ class WorkSpan(StepSpan):
 
     @property
     def processed(self) -> float:
-        if self.worked_span is None:
+        if self._worked_min is None:
             return 0
-        return len(self.worked_span) / len(self)
+        return (self._worked_max - self._worked_min + 1) / len(self)
+
+    def _key(self):
+        return self.begin, self.end, self.step, self._worked_min, self._worked_max, self._current
+
+    def _reset_worked_span(self):
+        self._worked_min = None
+        self._worked_max = None
 
     def _update_worked_span(self, i):
-        if i < self.min_val or self.max_val < i:
+        begin = self.begin
+        end = self.end
+        if begin <= end:
+            if i < begin or end < i:
+                raise IndexError(i)
+        elif i < end or begin < i:
             raise IndexError(i)
 
-        if self.worked_span is None:
-            self._worked_span = Span(i, i)
-            return
-
-        # 数轴方向（增大）->    新 worked span 的 begin 和 end（'-' 表示保持原样）
-        # ----------------------------------------------------------------
-        # begin i end                   -
-        # i begin end                   i end
-        # begin end i                   begin i
-        # end i begin                   -
-        # end begin i                   i end
-        # i end begin                   begin i
-        if self.worked_span.contain(i):
-            return
-        if i < self.worked_span.begin or i > self.worked_span.begin:
-            self._worked_span = Span(i, self.worked_span.end)
-        else:
-            self._worked_span = Span(self.worked_span.begin, i)
+        worked_min = self._worked_min
+        if worked_min is None:
+            self._worked_min = self._worked_max = i
+        elif i < worked_min:
+            self._worked_min = i
+        elif i > self._worked_max:
+            self._worked_max = i
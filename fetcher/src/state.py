@@ -0,0 +1,140 @@
+#!/usr/env python3
+import json
+import math
+import os
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from .fetcher import IndexFetcher
+from .flag import ThreadFlag
+from .registry import RangeRegistry
+from .span import StepSpan
+from .status import IStatus
+from .util import repr_injector
+
+_record_type = Dict[str, Any]
+
+
+def _end_to_json(end):
+    return None if math.isinf(end) else end
+
+
+def fetcher_record(fetcher: IndexFetcher, profile: Optional[Dict[str, Any]] = None) -> _record_type:
+    """将抓取器的定义（区间、步长、线程权重、处理器配置）及其生命周期状态、剩余区间转为可序列化的记录"""
+    if ThreadFlag.pending in fetcher.flag:
+        state = "pending"
+    elif ThreadFlag.running in fetcher.flag:
+        state = "running"
+    else:
+        state = "stopped"
+    return {
+        "name": fetcher.name,
+        "begin": fetcher.begin,
+        "end": _end_to_json(fetcher.end),
+        "step": fetcher.step,
+        "weights": fetcher.thread_weights,
+        "profile": profile or {},
+        "state": state,
+        "remaining": [[span.begin, _end_to_json(span.end)] for span in fetcher.remaining_spans()],
+        "pending_retries": fetcher.pending_retries(),
+        "failed_retries": fetcher.failed_retries(),
+    }
+
+
+def remaining_spans(record: _record_type) -> List[StepSpan]:
+    return [StepSpan(begin, end, record["step"]) for begin, end in record["remaining"]]
+
+
+def pending_retries(record: _record_type) -> List[int]:
+    # 较早的记录中没有该项
+    return record.get("pending_retries", [])
+
+
+def failed_retries(record: _record_type) -> List[int]:
+    return record.get("failed_retries", [])
+
+
+@repr_injector
+class FetcherStore(IStatus):
+    """
+    抓取器存储
+    ---------
+    - 以 JSON 文件保存所有抓取器的记录（见 fetcher_record），写入时先写临时文件再替换，不会留下不完整的文件
+    - 启动后每隔 interval 秒保存一次 snapshot 返回的记录，停止时再保存一次，重启后即可从最近的进度恢复
+    - 给定 registry 时，区间登记表随记录一同保存，通过 load_registry 恢复
+    """
+
+    def __init__(self, file_path: Union[str, Path], snapshot: Callable[[], List[_record_type]],
+                 interval: float = 10, registry: Optional[RangeRegistry] = None):
+        self.file_path = Path(file_path)
+        self.snapshot = snapshot
+        self.interval = interval
+        self.registry = registry
+
+        self._flag = ThreadFlag(ThreadFlag.pending)
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+        self._last_exception: Optional[Exception] = None
+
+    @property
+    def flag(self):
+        return self._flag
+
+    @property
+    def last_exception(self) -> Optional[Exception]:
+        return self._last_exception
+
+    def load(self) -> List[_record_type]:
+        if not self.file_path.exists():
+            return []
+        with open(self.file_path, encoding="utf-8") as fp:
+            return json.load(fp)["fetchers"]
+
+    def load_registry(self) -> RangeRegistry:
+        """读取保存的区间登记表，没有保存过时返回空的登记表"""
+        if not self.file_path.exists():
+            return RangeRegistry()
+        with open(self.file_path, encoding="utf-8") as fp:
+            data = json.load(fp).get("ranges")
+        return RangeRegistry() if data is None else RangeRegistry.from_json(data)
+
+    def save(self):
+        # 先取得记录再结算登记表，已完成的区间不会超前于记录中的进度
+        document = {"fetchers": self.snapshot()}
+        if self.registry is not None:
+            document["ranges"] = self.registry.to_json()
+        data = json.dumps(document, ensure_ascii=False, indent=2)
+        with self._lock:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+            with open(temp_path, "w", encoding="utf-8") as fp:
+                fp.write(data)
+            os.replace(temp_path, self.file_path)
+
+    def start(self):
+        if ThreadFlag.pending not in self._flag:
+            raise RuntimeError("Cannot start a store again!")
+        self._flag -= ThreadFlag.pending
+        self._flag += ThreadFlag.running
+        self._thread = Thread(name=f"{self.__class__.__name__}-thread", target=self._work, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        if ThreadFlag.running not in self._flag:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._flag -= ThreadFlag.running
+        self._flag += ThreadFlag.stopping
+        self.save()
+
+    def _work(self):
+        while not self._stop_event.wait(self.interval):
+            # noinspection PyBroadException
+            try:
+                self.save()
+                self._last_exception = None
+            except Exception as e:
+                self._last_exception = e
@@ -0,0 +1,144 @@
+#!/usr/env python3
+import random
+import threading
+import time
+from contextlib import contextmanager
+from logging import Formatter, Logger
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+
+from . import jsoncodec
+from .log import queued
+
+_local = threading.local()
+
+
+def current_span() -> Optional["TraceSpan"]:
+    """当前线程正在进行的追踪跨度，未被采样时为 None"""
+    return getattr(_local, "span", None)
+
+
+@contextmanager
+def activate(span: Optional["TraceSpan"]):
+    """在当前线程中将 span 设为当前跨度，用于跨线程传递追踪上下文"""
+    previous = current_span()
+    _local.span = span
+    try:
+        yield span
+    finally:
+        _local.span = previous
+
+
+@contextmanager
+def span(name: str, **tags) -> Iterator[Optional["TraceSpan"]]:
+    """
+    在当前跨度下创建子跨度
+    ---------------------
+    当前线程没有正在进行的（被采样的）追踪时什么也不做，因此可以放心地放在热路径上
+    """
+    parent = current_span()
+    if parent is None:
+        yield None
+        return
+    with parent.child(name, **tags) as child:
+        yield child
+
+
+class TraceSpan(object):
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "name", "tags", "timestamp", "duration", "_begin",
+                 "_previous")
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+                 tags: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.trace_id = trace_id or f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.tags = tags or {}
+        self.timestamp: Optional[int] = None
+        self.duration: Optional[int] = None
+        self._begin: Optional[float] = None
+        self._previous: Optional[TraceSpan] = None
+
+    def __enter__(self):
+        self.timestamp = time.time_ns() // 1000
+        self._begin = time.perf_counter()
+        self._previous = current_span()
+        _local.span = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = int((time.perf_counter() - self._begin) * 1e6)
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+        _local.span = self._previous
+        self.tracer.exporter.export(self)
+
+    def child(self, name: str, **tags) -> "TraceSpan":
+        return TraceSpan(self.tracer, name, self.trace_id, self.span_id, tags)
+
+    def to_zipkin(self) -> Dict[str, Any]:
+        """转换为 Zipkin v2 格式的跨度"""
+        result = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "duration": self.duration,
+            "localEndpoint": {"serviceName": self.tracer.service_name},
+            "tags": {key: str(value) for key, value in self.tags.items()},
+        }
+        if self.parent_id is not None:
+            result["parentId"] = self.parent_id
+        return result
+
+
+class ZipkinFileExporter(object):
+    """
+    将跨度以 Zipkin v2 JSON 的形式逐行写入本地按大小轮转的文件
+    写入（包括轮转）经由有界队列交给单独的写入线程，与其它日志文件相同，被采样的探测不会因磁盘 I/O 而阻塞，队列已满时丢弃跨度
+    """
+
+    def __init__(self, file_path: Union[str, Path], max_bytes: int = 64 * 1024 * 1024, backup_count: int = 5,
+                 encoding: str = "utf-8", queue_size: int = 10000):
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        self._logger = Logger(f"{self.__class__.__name__}-{file_path}")
+        self._handler = RotatingFileHandler(str(file_path), maxBytes=max_bytes, backupCount=backup_count,
+                                            encoding=encoding)
+        self._handler.setFormatter(Formatter("%(message)s"))
+        queue_handler, self._listener = queued(self._handler, maxsize=queue_size)
+        self._logger.addHandler(queue_handler)
+        self._listener.start()
+
+    def export(self, trace_span: TraceSpan):
+        self._logger.info(jsoncodec.dumps(trace_span.to_zipkin()).decode("utf-8"))
+
+    def close(self):
+        """停止写入线程并关闭文件，已入队的跨度会先被写入"""
+        self._listener.stop()
+        self._handler.close()
+
+
+class Tracer(object):
+    """
+    探测追踪器
+    ---------
+    按 sample_rate 对每次探测进行采样，被采样的探测在当前线程中建立根跨度，其下的 tracing.span 才会真正记录
+    """
+
+    def __init__(self, exporter, sample_rate: float = 0.01, service_name: str = "nmdm-fetcher"):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"The sample rate must be between 0 and 1: {sample_rate!r}")
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.service_name = service_name
+
+    @contextmanager
+    def trace(self, name: str, **tags) -> Iterator[Optional[TraceSpan]]:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            yield None
+            return
+        with TraceSpan(self, name, tags=tags) as root:
+            yield root
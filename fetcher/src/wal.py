@@ -0,0 +1,283 @@
+#!/usr/env python3
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from threading import Condition, Event, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from . import jsoncodec
+from .flag import ThreadFlag
+from .status import IStatus
+from .util import repr_injector
+
+# 每条记录的头部：负载长度（uint32）+ 负载的 crc32（uint32）
+_HEADER = struct.Struct("<II")
+_SEGMENT_SUFFIX = ".wal"
+_CHECKPOINT_FILE_NAME = "checkpoint"
+
+_record_type = Dict[str, Any]
+_sink_type = Callable[[List[_record_type]], None]
+
+
+def _segment_name(seq: int) -> str:
+    return f"{seq:020d}{_SEGMENT_SUFFIX}"
+
+
+@repr_injector
+class WriteAheadLog(object):
+    """
+    预写日志
+    --------
+    - 处理器只需将结果追加到本地分段文件中即可返回，不受数据库是否可用的影响
+    - 由 WalReplayer 在后台将记录批量写入数据库，确认写入后推进检查点并删除已完全确认的分段
+    - 未确认的数据量超过 max_pending_bytes 时，append 会阻塞，以此对生产者形成背压
+    """
+
+    def __init__(self, directory: Union[str, Path], segment_size: int = 64 * 1024 * 1024,
+                 max_pending_bytes: int = 1024 * 1024 * 1024, fsync: bool = False):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.max_pending_bytes = max_pending_bytes
+        self.fsync = fsync
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._cond = Condition()
+        self._closed = False
+        # 已确认写入数据库的位置（分段序号，分段内偏移）
+        self._checkpoint: Tuple[int, int] = self._load_checkpoint()
+        self._segment_sizes: Dict[int, int] = {
+            self._segment_seq(path): path.stat().st_size for path in self.directory.glob(f"*{_SEGMENT_SUFFIX}")
+        }
+        # 总是开启一个新的分段进行写入，之前遗留的分段（可能以不完整的记录结尾）只读
+        self._active_seq = max(self._segment_sizes, default=self._checkpoint[0]) + 1
+        self._segment_sizes[self._active_seq] = 0
+        self._active_fp = open(self.directory / _segment_name(self._active_seq), "ab")
+
+    @property
+    def pending_bytes(self) -> int:
+        """尚未确认写入数据库的字节数"""
+        with self._cond:
+            return self._pending_bytes()
+
+    @property
+    def segment_count(self) -> int:
+        with self._cond:
+            return len(self._segment_sizes)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def append(self, record: _record_type, timeout: Optional[float] = None):
+        self.append_raw(jsoncodec.dumps(record), timeout)
+
+    def append_raw(self, payload: bytes, timeout: Optional[float] = None):
+        """追加已编码的记录，payload 必须是一个 JSON 对象的 UTF-8 编码，用于将已有的 JSON 字节串直接嵌入记录，免去重新编码"""
+        data = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._cond:
+            if not self._cond.wait_for(
+                    lambda: self._closed or self._pending_bytes() + len(data) <= self.max_pending_bytes, timeout):
+                raise TimeoutError("Timed out waiting for the write-ahead log to be drained.")
+            if self._closed:
+                raise RuntimeError("Cannot append to a closed write-ahead log!")
+
+            if self._segment_sizes[self._active_seq] >= self.segment_size:
+                self._rotate()
+            self._active_fp.write(data)
+            self._active_fp.flush()
+            if self.fsync:
+                os.fsync(self._active_fp.fileno())
+            self._segment_sizes[self._active_seq] += len(data)
+            self._cond.notify_all()
+
+    def read(self, max_count: int) -> Tuple[List[_record_type], Tuple[int, int]]:
+        """
+        从检查点开始读取至多 max_count 条记录
+        ------------------------------------
+        - 返回读取到的记录以及读取完这些记录后的位置，该位置可传给 ack 以推进检查点
+        - 遗留分段末尾不完整或损坏的记录会被忽略
+        """
+        records = []
+        with self._cond:
+            seq, offset = self._checkpoint
+            seqs = sorted(s for s in self._segment_sizes if s >= seq)
+            sizes = {s: self._segment_sizes[s] for s in seqs}
+
+        for s in seqs:
+            if s != seq:
+                offset = 0
+            seq = s
+            size = sizes[s]
+            if offset >= size:
+                continue
+            with open(self.directory / _segment_name(s), "rb") as fp:
+                fp.seek(offset)
+                while len(records) < max_count and offset + _HEADER.size <= size:
+                    length, crc = _HEADER.unpack(fp.read(_HEADER.size))
+                    payload = fp.read(length)
+                    if len(payload) != length or zlib.crc32(payload) != crc:
+                        # 不完整或损坏的记录，跳过该分段的剩余部分
+                        offset = size
+                        break
+                    records.append(jsoncodec.loads(payload))
+                    offset += _HEADER.size + length
+            if len(records) >= max_count:
+                break
+
+        return records, (seq, offset)
+
+    def ack(self, position: Tuple[int, int]):
+        """推进检查点，并删除所有已完全确认且不再写入的分段"""
+        with self._cond:
+            self._checkpoint = position
+            seq, offset = position
+            for s in sorted(self._segment_sizes):
+                if s == self._active_seq:
+                    break
+                if s < seq or (s == seq and offset >= self._segment_sizes[s]):
+                    (self.directory / _segment_name(s)).unlink()
+                    del self._segment_sizes[s]
+            self._save_checkpoint()
+            self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待直到有新的记录可读，返回是否有可读的记录"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._closed or self._pending_bytes() > 0, timeout) \
+                   and self._pending_bytes() > 0
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._active_fp.close()
+            self._cond.notify_all()
+
+    def _pending_bytes(self):
+        seq, offset = self._checkpoint
+        return sum(size for s, size in self._segment_sizes.items() if s >= seq) - \
+               (offset if seq in self._segment_sizes else 0)
+
+    def _rotate(self):
+        self._active_fp.close()
+        self._active_seq += 1
+        self._segment_sizes[self._active_seq] = 0
+        self._active_fp = open(self.directory / _segment_name(self._active_seq), "ab")
+
+    def _load_checkpoint(self) -> Tuple[int, int]:
+        path = self.directory / _CHECKPOINT_FILE_NAME
+        try:
+            seq, offset = path.read_text().split()
+            return int(seq), int(offset)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _save_checkpoint(self):
+        path = self.directory / _CHECKPOINT_FILE_NAME
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(f"{self._checkpoint[0]} {self._checkpoint[1]}")
+        os.replace(str(tmp_path), str(path))
+
+    @staticmethod
+    def _segment_seq(path: Path) -> int:
+        return int(path.name[:-len(_SEGMENT_SUFFIX)])
+
+
+@repr_injector
+class WalReplayer(IStatus):
+    """
+    预写日志重放器
+    -------------
+    - 在后台线程中将预写日志的记录按批写入 sink，写入成功后确认
+    - 写入失败时（比如数据库正在重启）按指数退避重试同一批记录，期间 append 不受影响，直到触发背压
+    """
+
+    def __init__(self, wal: WriteAheadLog, sink: _sink_type, batch_size: int = 500, max_backoff: float = 30.0,
+                 name: Optional[str] = None):
+        self.wal = wal
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.name = name or self.__class__.__name__
+
+        self._flag = ThreadFlag(ThreadFlag.pending)
+        self._canceled = Event()
+        self._drain_deadline: Optional[float] = None
+        self._work_thread: Optional[Thread] = None
+        self._last_exception: Optional[Exception] = None
+
+    @property
+    def flag(self):
+        return self._flag
+
+    @property
+    def last_exception(self):
+        """最近一次写入 sink 时出现的异常，写入成功后清空"""
+        return self._last_exception
+
+    def start(self):
+        self._flag -= ThreadFlag.pending
+        self._flag += ThreadFlag.running
+        self._work_thread = Thread(name=f"{self.name.lower()}-thread", target=self._work, daemon=True)
+        self._work_thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止重放，在 timeout 时间内会尽量先将剩余的记录写完"""
+        if self._work_thread is None:
+            return
+        self._flag -= ThreadFlag.running
+        self._flag += ThreadFlag.canceling
+        self._drain_deadline = None if timeout is None else time.monotonic() + timeout
+        self._canceled.set()
+        self._work_thread.join(timeout)
+        self._flag -= ThreadFlag.canceling
+        self._flag += ThreadFlag.stopping_with_canceled
+
+    def replay_once(self) -> int:
+        """同步地重放一批记录，返回成功写入的记录数量"""
+        records, position = self.wal.read(self.batch_size)
+        if records:
+            self.sink(records)
+        self.wal.ack(position)
+        return len(records)
+
+    def _work(self):
+        backoff = 0.0
+        while True:
+            if self._canceled.is_set():
+                deadline = self._drain_deadline
+                if self.wal.pending_bytes == 0 or (deadline is not None and time.monotonic() >= deadline):
+                    break
+            elif not self.wal.wait(timeout=1):
+                continue
+            # noinspection PyBroadException
+            try:
+                self.replay_once()
+                self._last_exception = None
+                backoff = 0.0
+            except Exception as e:
+                self._last_exception = e
+                # 停止时无法写入的记录留在日志中，下次启动后继续重放
+                if self._canceled.is_set():
+                    break
+                backoff = min(self.max_backoff, backoff * 2 or 0.5)
+                self._canceled.wait(backoff)
+
+
+class MongoWalSink(object):
+    """将预写日志中的记录批量写入 MongoDB 的 sink，记录格式为 {"c": 集合名, "f": 过滤条件, "u": 更新内容}"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __call__(self, records: List[_record_type]):
+        from pymongo import UpdateOne
+
+        operations: Dict[str, list] = {}
+        for record in records:
+            operations.setdefault(record["c"], []).append(UpdateOne(record["f"], record["u"], upsert=True))
+        for collection, requests in operations.items():
+            self.db[collection].bulk_write(requests, ordered=True)
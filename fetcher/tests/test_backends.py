@@ -0,0 +1,46 @@
+#!/usr/env python3
+import pytest
+
+from src.backends import BackendPool
+
+
+def test_least_outstanding():
+    pool = BackendPool(["http://a/", "http://b/", "http://c/"])
+    acquired = [pool.acquire() for _ in range(6)]
+    assert [backend.url for backend in acquired] == ["http://a/", "http://b/", "http://c/"] * 2
+
+    # 进行中的请求数相同时选择延迟较低的后端
+    for backend, latency in zip(acquired, [0.3, 0.1, 0.2, 0.3, 0.1, 0.2]):
+        pool.release(backend, True, latency)
+    assert pool.acquire().url == "http://b/"
+
+
+def test_ejection_and_readmission():
+    healthy = {"http://a/": True, "http://b/": True}
+    pool = BackendPool(list(healthy), eject_after=2, health_check=lambda backend: healthy[backend.url])
+    a, b = pool.backends
+
+    for _ in range(2):
+        backend = pool.acquire()
+        assert backend is a
+        pool.release(backend, False)
+    # 连续失败后被摘除
+    assert not a.healthy and a.ejections == 1
+    assert all(pool.acquire() is b for _ in range(3))
+
+    # 主动检查：恢复的后端重新加入，失败的后端被摘除
+    healthy["http://b/"] = False
+    pool.check()
+    assert a.healthy and not b.healthy
+    assert pool.acquire() is a
+
+    # 所有后端都被摘除时仍然分配
+    healthy["http://a/"] = False
+    pool.check()
+    assert pool.acquire() in (a, b)
+    assert pool.stats()["http://a/"]["ejections"] == 2
+
+
+def test_requires_backends():
+    with pytest.raises(ValueError):
+        BackendPool([])
@@ -0,0 +1,153 @@
+#!/usr/env python3
+from threading import Lock
+
+import pytest
+
+from loadtest.mock_api import DensityMap, MockApiConfig, MockApiServer
+from src.breaker import CircuitBreaker
+from src.exceptions import ExplicitlyRetryHandlingError
+from src.fetcher import IndexFetcher
+from src.job import IndexJob
+from src.retry import RetryQueue
+from src.scraper import probe_user_detail
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_trip_and_recover():
+    upstream = {"up": False}
+    events = []
+    breaker = CircuitBreaker(lambda: upstream["up"], window=4, failure_rate=0.5, min_calls=4)
+    breaker.emitter.on("CircuitBreaker.opened", lambda _: events.append("opened"))
+    breaker.emitter.on("CircuitBreaker.closed", lambda _: events.append("closed"))
+
+    for ok in (True, False, True):
+        breaker.record(ok)
+    assert not breaker.is_open and breaker.wait_future().done()
+    # 第 4 次时失败比例达到 0.5
+    breaker.record(False)
+    assert breaker.is_open and breaker.trips == 1
+
+    waiting = breaker.wait_future()
+    canceled = breaker.wait_future()
+    assert canceled.cancel()
+    assert breaker.stats()["paused"] == 1
+    # 熔断期间的结果不计入
+    breaker.record(True)
+    assert not breaker.check() and not waiting.done()
+
+    upstream["up"] = True
+    assert breaker.check()
+    assert waiting.done() and not breaker.is_open
+    assert breaker.stats()["recentCalls"] == 0
+    assert events == ["opened", "closed"]
+
+    with pytest.raises(ValueError):
+        CircuitBreaker(lambda: True, failure_rate=0)
+
+
+def test_pause_jobs_during_outage():
+    lock = Lock()
+    upstream = {"down": False, "outages": 0}
+    handled = []
+
+    def handler(i):
+        with lock:
+            if i == 50 and not upstream["outages"]:
+                upstream["down"] = True
+                upstream["outages"] += 1
+            if upstream["down"]:
+                raise ExplicitlyRetryHandlingError(i)
+            handled.append(i)
+
+    def probe():
+        upstream["down"] = False
+        return True
+
+    breaker = CircuitBreaker(probe, window=20, failure_rate=0.5, min_calls=10, probe_interval=0.01)
+    breaker.start()
+    retry_queue = RetryQueue(workers=1, max_attempts=3, base_delay=0.001, max_delay=0.001)
+    fetcher = IndexFetcher(0, 199, 1, thread_weights=[1], retry_queue=retry_queue, breaker=breaker)
+    fetcher.handlers.add(handler)
+    fetcher.start()
+    fetcher.join()
+    fetcher.stop()
+    breaker.stop()
+
+    # 上游不可用期间没有索引被跳过，熔断前失败的索引经重试补上，熔断时失败的索引在恢复后重新处理
+    assert breaker.trips == 1
+    assert sorted(handled) == list(range(200))
+
+
+def test_record_unexpected_exceptions():
+    breaker = CircuitBreaker(lambda: True, window=100, failure_rate=1, min_calls=100)
+    unexpected = []
+
+    def handler(i):
+        if i % 2:
+            raise RuntimeError(i)
+
+    job = IndexJob(1, 10, 1, breaker=breaker)
+    job.emitter.on("IndexJob.unexpected_exception", lambda sender, err_info: unexpected.append(sender.current))
+    with job.list(handler):
+        pass
+
+    # 意外的异常与显式的重试一样计为上游失败
+    assert unexpected and breaker.stats()["recentFailures"] == len(unexpected)
+
+def test_retries_while_unsettled():
+    clock = _Clock()
+    breaker = CircuitBreaker(lambda: True, window=10, failure_rate=1, min_calls=10, settle_time=60, clock=clock)
+    assert breaker.settled
+    for _ in range(10):
+        breaker.record(False)
+    assert breaker.is_open and not breaker.settled
+    assert breaker.check() and not breaker.settled
+
+    def flaky(fail_times):
+        failures = {}
+
+        def handler(i):
+            if i == 3 and failures.get(i, 0) < fail_times:
+                failures[i] = failures.get(i, 0) + 1
+                raise ExplicitlyRetryHandlingError(i)
+
+        return handler
+
+    retry_queue = RetryQueue(max_attempts=2, base_delay=0.001, max_delay=0.001)
+    retry_queue.start()
+    try:
+        # 刚恢复时重试失败不计入次数，失败 5 次后仍能成功
+        job = IndexJob(1, 5, 1, retry_queue=retry_queue, breaker=breaker)
+        with job.list(flaky(5)) as result:
+            assert sorted(result) == [1, 2, 3, 4, 5]
+        assert job.failed_retries == []
+
+        # 稳定之后重试次数照常计算
+        clock.now += 60
+        assert breaker.settled
+        job = IndexJob(1, 5, 1, retry_queue=retry_queue, breaker=breaker)
+        with job.list(flaky(5)) as result:
+            assert result == [1, 2, 4, 5]
+        assert job.failed_retries == [3]
+    finally:
+        retry_queue.stop()
+
+
+def test_probe_user_detail():
+    config = MockApiConfig(density_map=DensityMap([(0, 9, 1.0)]), payload_size=10,
+                           proxy_throttle_rates={"http://throttled": 1.0})
+    server = MockApiServer(config).start()
+    try:
+        assert probe_user_detail(server.url, 5)
+        # 被限流或用户不存在时后端虽然可以连接，但不算恢复
+        assert not probe_user_detail(server.url, 5, proxy="http://throttled")
+        assert not probe_user_detail(server.url, 50)
+    finally:
+        server.stop()
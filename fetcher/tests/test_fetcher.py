@@ -1,8 +1,11 @@
 #!/usr/env python3
 import math
+import time
+from threading import Event, Lock, Semaphore
 
 import pytest
 from src.fetcher import IndexFetcher
+from src.span import StepSpan
 
 
 def _spilt(jobs_, i_):
@@ -91,3 +94,118 @@ def test_job_iter_sample():
     assert len(jobs) == 2
     assert _spilt(jobs, 0) == (99, 66, -1)
     assert _spilt(jobs, 1) == (65, 0, -1)
+
+
+def test_partition():
+    fetcher = IndexFetcher(0, 99, 1, thread_weights=[1, 1])
+    spans = [StepSpan(10, 19), StepSpan(20, 29), StepSpan(50, 59)]
+    # [10, 29] 与 [50, 59] 共 30 个索引，第一份的 15 个落在第一个区间内，第二份跨过空隙被拆成两个作业
+    assert list(fetcher._partition(spans)) == [(10, 24), (25, 29), (50, 59)]
+
+    fetcher = IndexFetcher(99, 0, -2, thread_weights=[1])
+    assert list(fetcher._partition([StepSpan(51, 40, -2), StepSpan(39, 30, -2)])) == [(51, 31)]
+
+
+@pytest.mark.parametrize("begin, end, step", [(0, 1999, 1), (1999, 0, -1), (0, 3998, 2)])
+def test_resize(begin, end, step):
+    handled = []
+    lock = Lock()
+    started = Event()
+    fetcher = IndexFetcher(begin, end, step, thread_weights=[1, 1])
+
+    @fetcher.handlers.add
+    def handler(i):
+        started.set()
+        time.sleep(0.0005)
+        with lock:
+            handled.append(i)
+
+    fetcher.start()
+    started.wait()
+    jobs = fetcher.resize([1, 2, 1])
+    assert jobs and fetcher.thread_weights == [0.25, 0.5, 0.25]
+    fetcher.join()
+    fetcher.stop()
+    # 调整前后没有遗漏，也没有重复
+    assert sorted(handled) == sorted(range(begin, int(end + math.copysign(1, step)), step))
+
+
+def test_resize_bounds_running_jobs():
+    release = Event()
+    entered = Semaphore(0)
+    running = []
+    peak = []
+    lock = Lock()
+    fetcher = IndexFetcher(0, 599, 1, thread_weights=[1, 1, 1])
+
+    def on_running(sender):
+        with lock:
+            running.append(sender)
+            peak.append(len(running))
+
+    def on_stopped(sender, err_info):
+        with lock:
+            running.remove(sender)
+
+    fetcher.emitter.on("IndexJob.running", on_running)
+    fetcher.emitter.on("IndexJob.stopped", on_stopped)
+
+    @fetcher.handlers.add
+    def handler(i):
+        # 原有的作业都阻塞在第一个索引上，调整大小之后仍在运行
+        if i in (0, 200, 400):
+            entered.release()
+            release.wait()
+
+    fetcher.start()
+    for _ in range(3):
+        entered.acquire()
+    try:
+        jobs = fetcher.resize([1, 1])
+        assert jobs and fetcher.pool.running == 3 and fetcher.idle_workers == 0
+    finally:
+        release.set()
+    fetcher.join()
+    fetcher.stop()
+    # 原有的作业计入新的线程数，新的作业等它们结束后才开始运行
+    assert max(peak) == 3
+    assert fetcher.remaining_spans() == []
+
+
+def test_resize_infinite_end():
+    fetcher = IndexFetcher(0, 99, 1, thread_weights=[1, 1])
+    fetcher.handlers.add(lambda i: time.sleep(0.001))
+    fetcher.start()
+    fetcher.end = float("inf")
+    try:
+        with pytest.raises(ValueError):
+            fetcher.resize([1, 1, 1])
+    finally:
+        fetcher.end = 99
+        fetcher.stop()
+
+def test_prune_finished_jobs():
+    release = Event()
+    fetcher = IndexFetcher(0, 999, 1, thread_weights=[1, 1])
+
+    @fetcher.handlers.add
+    def handler(i):
+        # 只有第一个作业在处理第一个索引时阻塞，其余作业很快结束
+        if i == 0:
+            release.wait()
+
+    fetcher.start()
+    first = fetcher.jobs[0]
+    try:
+        for _ in range(5):
+            new_job = fetcher.split(first)
+            assert new_job is not None
+            while new_job.remaining_span() is not None:
+                time.sleep(0.01)
+        # 正常结束的作业在拆分时被移除，jobs 不随拆分的次数增长
+        assert first in fetcher.jobs and len(fetcher.jobs) <= 2
+    finally:
+        release.set()
+    fetcher.join()
+    fetcher.stop()
+    assert fetcher.remaining_spans() == []
@@ -3,7 +3,9 @@ import math
 
 import pytest
 
-from src.job import IndexJob
+from src.exceptions import ExplicitlySkipHandlingError, ExplicitlyStopHandlingError
+from src.flag import JobStepFlag
+from src.job import Handlers, IndexJob
 
 
 def test_instantiate():
@@ -54,3 +56,98 @@ def test_jump_back(begin, end, step, mock_invalid_values, emitted_values):
 def test_repr():
     job = IndexJob(1, 100, 1)
     repr(job)
+
+
+def test_handler_kinds():
+    job = IndexJob(1, 10, 1)
+    invalid_values = {3, 4, 5, 6, 7}
+    batches = []
+
+    @job.handlers.add
+    async def check(i):
+        if i in invalid_values:
+            raise ValueError
+
+    @job.handlers.add(kind="batch", batch_size=2)
+    def collect(indexes, sender):
+        assert sender is job
+        batches.append(indexes)
+
+    job.run()
+    # 批量处理器只收到有效的索引，作业结束时剩余的索引也会被交付
+    assert sorted(i for batch in batches for i in batch) == [1, 2, 8, 9, 10]
+    assert all(len(batch) <= 2 for batch in batches)
+
+    with pytest.raises(ValueError):
+        job.handlers.add(lambda i: None, kind="unknown")
+
+
+def test_handlers_copy_on_write():
+    job = IndexJob(1, 10, 1)
+    job.handlers.add(lambda i: None)
+    handlers = Handlers(job.handlers)
+    handlers.add(lambda i: None)
+    assert len(job.handlers.items()) == 1 and len(handlers.items()) == 2
+
+
+@pytest.mark.parametrize("begin, end, step, mock_invalid_values, emitted_values", [
+    (1, 10, 1, [2, 3, 4], [1, 6, 5, 7, 8, 9, 10]),
+    (10, 1, -1, [6, 8, 9, 10], [4, 5, 3, 2, 1]),
+    (1, 20, 2, [3, 4, 5, 7, 9, 13], [1, 17, 16, 14, 12, 10, 8, 6, 19]),
+])
+@pytest.mark.parametrize("batch_size", [1, 3, 100])
+def test_probe_handler(begin, end, step, mock_invalid_values, emitted_values, batch_size):
+    job = IndexJob(begin, end, step)
+    blocks = []
+    handled = []
+    job.emitter.on("IndexJob.handling", lambda sender: handled.append(sender.current))
+
+    @job.handlers.add(kind="probe", batch_size=batch_size)
+    def probe(indexes):
+        assert len(indexes) <= batch_size and all(job.contain(i) for i in indexes)
+        blocks.append(indexes)
+        return [i not in mock_invalid_values for i in indexes]
+
+    # 探测处理器的结果与逐个索引处理的结果一致，且其它处理器只收到探测有效的索引
+    with job.list() as result:
+        assert result == emitted_values
+    assert len(blocks) < len(handled) or batch_size == 1
+
+
+def test_probe_handler_results():
+    def validity(i):
+        if i == 3:
+            raise ExplicitlySkipHandlingError(i)
+        if i == 5:
+            raise ExplicitlyStopHandlingError(i)
+
+    with IndexJob(1, 6, 1).list(validity) as expected:
+        pass
+
+    job = IndexJob(1, 6, 1)
+
+    @job.handlers.add(kind="probe", batch_size=10)
+    def probe(indexes):
+        # 缺少的索引视为无效，异常实例相当于处理该索引时抛出了该异常
+        return {i: ExplicitlyStopHandlingError(i) if i == 5 else True for i in indexes if i != 3}
+
+    with job.list() as result:
+        assert result == expected
+    assert JobStepFlag.stopping_with_exception in job.flag
+
+
+def test_probe_handler_block_exception():
+    job = IndexJob(1, 5, 1)
+    raised = ExplicitlySkipHandlingError("block")
+    skipped = []
+    job.emitter.on("IndexJob.handle_skipped", lambda sender, err_info: skipped.append(err_info[1]))
+
+    @job.handlers.add(kind="probe", batch_size=10)
+    def probe(indexes):
+        raise raised
+
+    # 整块探测失败时每个索引各自得到一个异常副本，原异常保留在 __cause__ 中
+    with job.list() as result:
+        assert result == []
+    assert len(skipped) == 4 and len({id(e) for e in skipped}) == 4
+    assert all(e.__cause__ is raised for e in skipped)
@@ -0,0 +1,54 @@
+#!/usr/env python3
+import pytest
+
+from src.journal import ProbeJournal, ProbeOutcome, iter_records, load_segment, read_journal, segment_paths
+
+
+def _write(directory, count, **kwargs):
+    journal = ProbeJournal(directory, flush_interval=0.05, **kwargs)
+    journal.start()
+    for i in range(count):
+        journal.append(i, ProbeOutcome.valid if i % 2 else ProbeOutcome.invalid, 200, 200, 0.01)
+    journal.stop()
+    return journal
+
+
+def test_rotation_and_compression(tmp_path):
+    # 每个分段最多 (1024 - 16) // 32 = 31 条记录
+    journal = _write(tmp_path, 100, segment_size=1024)
+    assert journal.written == 100 and journal.dropped == 0
+
+    paths = segment_paths(tmp_path)
+    assert len(paths) == 4
+    assert all(path.name.endswith(".pj.gz") for path in paths[:-1])
+    records = [record for path in paths for record in iter_records(path)]
+    assert [record[1] for record in records] == list(range(100))
+    assert records[1][2:] == (pytest.approx(0.01), 200, 200, int(ProbeOutcome.valid))
+
+
+def test_compress_leftovers(tmp_path):
+    _write(tmp_path, 100, segment_size=1024, compress=False)
+    assert all(path.name.endswith(".pj") for path in segment_paths(tmp_path))
+
+    # 上次运行留下的未压缩的分段在启动后由压缩线程压缩，新的分段接在其后
+    _write(tmp_path, 10, segment_size=1024)
+    paths = segment_paths(tmp_path)
+    assert len(paths) == 5
+    assert all(path.name.endswith(".pj.gz") for path in paths[:-1])
+    records = [record for path in paths for record in iter_records(path)]
+    assert [record[1] for record in records] == [*range(100), *range(10)]
+
+
+def test_max_segments(tmp_path):
+    _write(tmp_path, 100, segment_size=1024, max_segments=2)
+    assert len(segment_paths(tmp_path)) == 2
+
+
+def test_numpy_reader(tmp_path):
+    np = pytest.importorskip("numpy")
+    _write(tmp_path, 100, segment_size=1024)
+
+    assert isinstance(load_segment(segment_paths(tmp_path)[-1]), np.memmap)
+    records = read_journal(tmp_path)
+    assert records["uid"].tolist() == list(range(100))
+    assert (records["outcome"] == ProbeOutcome.valid).sum() == 50
@@ -0,0 +1,28 @@
+#!/usr/env python3
+import json
+from datetime import timedelta
+
+import pytest
+
+from src import jsoncodec
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(jsoncodec, "orjson", None)
+    return request.param
+
+
+def test_round_trip(backend):
+    data = {"code": 200, "profile": {"nickname": "云村", "level": 10}, 1: [1.5, None, True]}
+    encoded = jsoncodec.dumps(data)
+    # 紧凑、不转义非 ASCII 字符、整数键转为字符串，两种后端的输出一致
+    assert encoded == json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    assert jsoncodec.loads(encoded) == jsoncodec.loads(memoryview(encoded)) == json.loads(encoded)
+
+    assert jsoncodec.dumps({"t": timedelta(seconds=3)}, default=lambda o: o.total_seconds()) == b'{"t":3.0}'
+    with pytest.raises(ValueError):
+        jsoncodec.loads(b"{")
@@ -0,0 +1,40 @@
+#!/usr/env python3
+import requests
+
+from loadtest.mock_api import DensityMap, LatencyDistribution, MockApiConfig, MockApiServer
+from loadtest.run import MemoryStorage, run
+
+
+def test_mock_api():
+    config = MockApiConfig(density_map=DensityMap([(0, 99, 1.0), (100, 199, 0.0)]), payload_size=10)
+    server = MockApiServer(config).start()
+    try:
+        r = requests.get(server.url, params={"uid": 1})
+        assert r.status_code == 200 and r.json()["userPoint"]["userId"] == 1
+        r = requests.get(server.url, params={"uid": 150})
+        assert r.status_code == 404 and r.json()["code"] == 404
+    finally:
+        server.stop()
+    assert server.request_count == 2
+
+
+def test_density_map():
+    density_map = DensityMap.parse("0:999:0.5,1000:1999:0.05", seed=1)
+    # 同一种子下结果是确定的
+    assert [density_map.valid(i) for i in range(2000)] == [DensityMap(density_map.segments, 1).valid(i)
+                                                         for i in range(2000)]
+    assert 400 < density_map.count_valid(0, 999) < 600
+    assert density_map.count_valid(1000, 1999) < 100
+    assert LatencyDistribution.parse("uniform:1:2") == LatencyDistribution("uniform", 1, 2)
+
+
+def test_run():
+    storage = MemoryStorage()
+    config = MockApiConfig(density_map=DensityMap([(0, 299, 1.0)]), error_rate=0.05, payload_size=10)
+    report = run(config, 0, 299, [1, 1], storage)
+
+    # 全部有效时不会跳过任何索引，出错的索引也会经重试后补上
+    assert report["validUsers"] == report["expectedValidUsers"] == 300
+    assert sorted(storage.documents) == list(range(300))
+    assert report["probes"] == report["mockRequests"] >= 300
+    assert report["latency"]["p50"] <= report["latency"]["p99"]
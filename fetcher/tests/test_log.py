@@ -0,0 +1,102 @@
+#!/usr/env python3
+import sys
+from logging import Formatter, Handler, Logger
+from threading import Event
+
+from src.log import queued
+
+
+class BlockingHandler(Handler):
+    def __init__(self):
+        super().__init__()
+        self.unblocked = Event()
+        self.records = []
+
+    def emit(self, record):
+        self.unblocked.wait()
+        self.records.append(self.format(record))
+
+
+def test_drop_when_full():
+    handler = BlockingHandler()
+    handler.setFormatter(Formatter("%(levelname)s %(message)s"))
+    queue_handler, listener = queued(handler, maxsize=2)
+    logger = Logger("test")
+    logger.addHandler(queue_handler)
+    listener.start()
+
+    # 写入线程阻塞时，记录日志不会阻塞，超出队列容量的日志被丢弃
+    for i in range(10):
+        logger.info("message %d", i)
+    assert queue_handler.dropped >= 7
+
+    handler.unblocked.set()
+    listener.stop()
+    logger.info("after")
+    listener.start()
+    listener.stop()
+    assert handler.records[0] == "INFO message 0"
+    assert any("丢弃了" in record for record in handler.records)
+
+
+def test_deferred_traceback():
+    handler = BlockingHandler()
+    handler.unblocked.set()
+    queue_handler, listener = queued(handler)
+    logger = Logger("test")
+    logger.addHandler(queue_handler)
+    listener.start()
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.error("failed: %s", "job", exc_info=sys.exc_info())
+    listener.stop()
+    assert handler.records[0].startswith("failed: job\nTraceback") and "ValueError: boom" in handler.records[0]
+
+
+def test_snapshot_args():
+    handler = BlockingHandler()
+    queue_handler, listener = queued(handler)
+    logger = Logger("test")
+    logger.addHandler(queue_handler)
+
+    class Job(object):
+        def __init__(self):
+            self.current = 0
+
+        def __str__(self):
+            return f"Job(current={self.current})"
+
+        def __repr__(self):
+            return f"<Job {self.current}>"
+
+    listener.start()
+    job, items = Job(), [1]
+    logger.info("%s %r %s %d%%", job, job, items, 5)
+    logger.info("%(name)s %(job)r", {"name": "mapping", "job": job})
+    # 写入线程阻塞期间参数被修改，日志仍反映记录时的状态
+    job.current = 1
+    items.append(2)
+    handler.unblocked.set()
+    listener.stop()
+    assert handler.records == ["Job(current=0) <Job 0> [1] 5%", "mapping <Job 0>"]
+
+
+def test_traceback_without_frames():
+    handler = BlockingHandler()
+    queue_handler, listener = queued(handler)
+    logger = Logger("test")
+    logger.addHandler(queue_handler)
+    queued_records = []
+    logger.addFilter(lambda record: queued_records.append(record) or True)
+
+    listener.start()
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.error("failed", exc_info=True)
+    # 排队中的日志不再引用异常堆栈的帧
+    assert queued_records[0].exc_info is None
+    handler.unblocked.set()
+    listener.stop()
+    assert "ValueError: boom" in handler.records[0] and "Traceback" in handler.records[0]
@@ -1,9 +1,11 @@
 #!/usr/env python3
+import json
 import time
 from datetime import timedelta
+from threading import Event, Semaphore
 
 from src.fetcher import IndexFetcher
-from src.monitor import IndexFetcherMonitor
+from src.monitor import IndexFetcherMonitor, JobStatusData
 
 
 def test_sample():
@@ -25,3 +27,151 @@ def test_sample():
         fetcher.join()
     finally:
         monitor.stop()
+
+
+def test_split_stragglers():
+    fetcher = IndexFetcher(0, 399, 1, thread_weights=[1, 1])
+    monitor = IndexFetcherMonitor(fetcher, straggler_factor=2, straggler_min_remaining=timedelta(0))
+    handled = []
+    splits = []
+
+    @fetcher.handlers.add
+    def slow_first_half(i):
+        if i < 200:
+            time.sleep(0.002)
+        handled.append(i)
+
+    fetcher.emitter.on("IndexFetcher.split", lambda sender, job, new_job: splits.append(new_job))
+
+    fetcher.start()
+    while fetcher.idle_workers < 2:
+        monitor._tick()
+        time.sleep(0.02)
+    fetcher.join()
+
+    # 快的作业结束后，慢的作业的尾部被拆分出来由空闲线程运行
+    assert splits and all(new_job.begin < 200 for new_job in splits)
+    assert sorted(handled) == list(range(400))
+
+
+def test_snapshot():
+    fetcher = IndexFetcher(0, 9, 1)
+    monitor = IndexFetcherMonitor(fetcher)
+    monitor.add_section("extra", lambda: {"count": 1})
+    monitor.add_section("broken", lambda: 1 / 0)
+    release = Event()
+    fetcher.handlers.add(lambda i: release.wait())
+
+    fetcher.start()
+    monitor._tick()
+
+    snapshot = monitor.publisher.latest
+    data = json.loads(snapshot.body)
+    assert list(data) == ["monitor", "extra", "broken", "jobs", "fetchers"]
+    assert data["extra"] == {"count": 1} and "ZeroDivisionError" in data["broken"]["error"]
+    assert len(data["jobs"]) == 1
+    release.set()
+    fetcher.join()
+
+
+def test_snapshot_patch():
+    fetcher = IndexFetcher(0, 9, 1, name="a")
+    monitor = IndexFetcherMonitor(fetcher)
+    entered = Event()
+    release = Event()
+
+    def handler(i):
+        entered.set()
+        release.wait()
+
+    fetcher.handlers.add(handler)
+    fetcher.start()
+    entered.wait()
+    monitor._tick()
+    first = json.loads(monitor.publisher.latest.body)
+    key, = first["jobs"]
+    assert key == "a:0" and first["jobs"][key]["current"] == 0
+    assert first["jobs"][key]["job"] == str(fetcher.jobs[0])
+
+    # 作业停在同一索引上，两次快照之间作业的描述、当前索引与状态都没有变化，差异中不包含这些字段
+    monitor._tick()
+    patch = json.loads(monitor.publisher.latest.patch)
+    assert set(patch.get("jobs", {})) <= {key}
+    assert not {"job", "current", "flag"} & set(patch.get("jobs", {}).get(key, {}))
+    release.set()
+    fetcher.join()
+
+
+def test_sample_once_per_tick(monkeypatch):
+    fetcher = IndexFetcher(0, 399, 1, thread_weights=[1, 1, 1, 1])
+    monitor = IndexFetcherMonitor(fetcher, straggler_factor=2)
+    entered = Semaphore(0)
+    release = Event()
+    samples = []
+    sample = JobStatusData.sample
+    monkeypatch.setattr(JobStatusData, "sample", lambda self: samples.append(self.job) or sample(self))
+
+    def handler(i):
+        entered.release()
+        release.wait()
+
+    fetcher.handlers.add(handler)
+    fetcher.start()
+    for _ in range(4):
+        entered.acquire()
+    try:
+        # 构建快照、检查掉队作业与退役作业共用同一次计算的结果
+        for _ in range(3):
+            samples.clear()
+            monitor._tick()
+            assert sorted(map(id, samples)) == sorted(map(id, fetcher.jobs))
+    finally:
+        release.set()
+    fetcher.join()
+
+def test_retire_jobs():
+    fetchers = [IndexFetcher(0, 99, 1, name="a", thread_weights=[1, 1]), IndexFetcher(100, 149, 1, name="b")]
+    monitor = IndexFetcherMonitor(fetchers)
+    entered = Semaphore(0)
+    release = Event()
+
+    def handler(i):
+        entered.release()
+        release.wait()
+
+    for fetcher in fetchers:
+        fetcher.handlers.add(handler)
+        fetcher.start()
+    # 所有作业都已开始处理第一个索引后才开始监视，这些 handling 事件不计入
+    for _ in range(3):
+        entered.acquire()
+    monitor._tick()
+    assert len(monitor.monitored_jobs) == 3
+
+    release.set()
+    for fetcher in fetchers:
+        fetcher.join()
+    monitor._tick()
+
+    # 结束的作业退役，计数并入抓取器的累计值；监听器按抓取器注册，计数不会随作业数量翻倍
+    assert not monitor.monitored_jobs
+    data = json.loads(monitor.publisher.latest.body)
+    assert data["fetchers"]["a"] == {"retiredJobs": 2, "indexes": 98, "validIndexes": 100}
+    assert data["fetchers"]["b"] == {"retiredJobs": 1, "indexes": 49, "validIndexes": 50}
+    assert len(fetchers[0].emitter.listeners("IndexJob.handling")) == 1
+
+    # 被移除的抓取器的监听器与累计值也被移除
+    removed = fetchers.pop(0)
+    monitor._tick()
+    assert not removed.emitter.listeners("IndexJob.handling")
+    assert [fetcher.name for fetcher in monitor.fetcher_totals] == ["b"]
+
+
+def test_stop_immediately():
+    monitor = IndexFetcherMonitor(IndexFetcher(0, 9, 1), tick_interval=60)
+    monitor.start()
+    time.sleep(0.05)
+    begin = time.monotonic()
+    monitor.stop()
+    assert time.monotonic() - begin < 0.5
+    assert not monitor.work_thread.is_alive()
@@ -0,0 +1,126 @@
+#!/usr/env python3
+import time
+from concurrent.futures import CancelledError
+from threading import Event, Thread
+
+import pytest
+
+from src.exceptions import UserNotFoundError
+from src.flag import JobStepFlag
+from src.job import IndexJob
+from src.pipeline import Pipeline
+
+
+def test_outcome_before_store():
+    store_released = Event()
+    stored = []
+
+    def parse(i):
+        if i % 3 == 0:
+            raise UserNotFoundError(i)
+        return i
+
+    def store(i):
+        store_released.wait()
+        stored.append(i)
+
+    pipeline = Pipeline() \
+        .add_stage("fetch", lambda i: i, workers=2) \
+        .add_stage("parse", parse, outcome=True) \
+        .add_stage("store", store)
+    pipeline.start()
+    try:
+        job = IndexJob(1, 10, 1)
+        # 存储阶段被阻塞，但作业依然可以根据解析阶段的结果完成步进和跃进
+        with job.list(pipeline.as_handler()) as result:
+            assert set(result) == {i for i in range(1, 11) if i % 3 != 0}
+        assert not stored
+    finally:
+        store_released.set()
+        pipeline.stop()
+
+    assert sorted(stored) == sorted(result)
+    stats = pipeline.stats()
+    assert stats["store"]["processed"] == len(result)
+    assert stats["store"]["queueDepth"] == 0
+
+
+def test_stall_time():
+    pipeline = Pipeline() \
+        .add_stage("fetch", lambda i: i) \
+        .add_stage("store", lambda i: time.sleep(0.01), maxsize=1)
+    pipeline.start()
+    futures = [pipeline.submit(i) for i in range(20)]
+    for future in futures:
+        future.result()
+    pipeline.stop()
+
+    stats = pipeline.stats()
+    assert stats["store"]["stallTime"] > 0
+    assert stats["store"]["processed"] == 20
+
+
+def test_stage_error_after_outcome():
+    errors = []
+    pipeline = Pipeline() \
+        .add_stage("parse", lambda i: i, outcome=True) \
+        .add_stage("store", lambda i: 1 / 0)
+    pipeline.emitter.on("Pipeline.stage_error", lambda sender, name, err_info: errors.append(name))
+    pipeline.start()
+    assert pipeline.submit(1).result() == 1
+    pipeline.stop()
+    assert errors == ["store"]
+
+    with pytest.raises(RuntimeError):
+        pipeline.submit(2)
+
+
+def test_cancel_waiting_job():
+    released = Event()
+    fetched = []
+
+    def fetch(i):
+        fetched.append(i)
+        released.wait()
+        return i
+
+    pipeline = Pipeline().add_stage("fetch", fetch)
+    pipeline.start()
+    job = IndexJob(1, 10, 1)
+    job.handlers.add(pipeline.as_handler())
+    try:
+        thread = Thread(target=job.run)
+        thread.start()
+        while not fetched:
+            time.sleep(0.01)
+        # 作业线程不会被阻塞在流水线中的请求拖住
+        begin = time.monotonic()
+        job.cancel()
+        thread.join(1)
+        assert not thread.is_alive() and time.monotonic() - begin < 0.5
+        assert JobStepFlag.stopping_with_canceled in job.flag
+    finally:
+        released.set()
+        pipeline.stop()
+    assert fetched == [1]
+
+
+def test_stop_timeout():
+    released = Event()
+
+    def fetch(i):
+        released.wait()
+        return i
+
+    pipeline = Pipeline().add_stage("fetch", fetch).add_stage("parse", lambda i: i)
+    pipeline.start()
+    running = pipeline.submit(1)
+    queued = pipeline.submit(2)
+    while not running.running():
+        time.sleep(0.01)
+    # 获取阶段未能在超时时间内退出，尚未完成的 Future 都以取消结束，不会再有数据流入已停止的下游
+    pipeline.stop(timeout=0.05)
+    assert queued.cancelled()
+    with pytest.raises(CancelledError):
+        running.result(timeout=1)
+    released.set()
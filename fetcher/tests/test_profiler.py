@@ -0,0 +1,105 @@
+#!/usr/env python3
+import time
+from threading import Event, Thread
+
+import pytest
+
+from src.exceptions import ProfilerBusyError
+from src.fetcher import IndexFetcher
+from src.job import IndexJob
+from src.pipeline import Pipeline
+from src.profiler import DeterministicProfiler, SamplingProfiler, job_threads
+
+
+def _busy_handler(i):
+    deadline = time.perf_counter() + 0.002
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.fixture()
+def running_fetcher():
+    fetcher = IndexFetcher(0, 399, 1, thread_weights=[1, 1])
+    fetcher.handlers.add(_busy_handler)
+    fetcher.start()
+    time.sleep(0.05)
+    yield fetcher
+    fetcher.stop()
+
+
+def test_sampling(running_fetcher):
+    profiler = SamplingProfiler(lambda: job_threads(running_fetcher.jobs), interval=0.002).run(0.2)
+
+    per_thread = profiler.per_thread()
+    assert len(per_thread) == 2
+    assert all(name.startswith(running_fetcher.name) for name in per_thread)
+    assert "_busy_handler" in profiler.collapsed()
+
+
+def test_deterministic(running_fetcher):
+    profiler = DeterministicProfiler().run(0.2)
+
+    assert not profiler.unfinished
+    assert IndexJob.probe_hook is None
+    text = profiler.stats(limit=10)
+    assert "_busy_handler" in text
+    assert text.count(f"===== {running_fetcher.name}") == 2
+
+
+def test_deterministic_pipeline():
+    pipeline = Pipeline("P").add_stage("busy", _busy_handler)
+    pipeline.start()
+    done = Event()
+
+    def feed():
+        while not done.is_set():
+            pipeline.submit(0).result()
+
+    feeder = Thread(target=feed)
+    feeder.start()
+    try:
+        profiler = DeterministicProfiler().run(0.2)
+    finally:
+        done.set()
+        feeder.join()
+        pipeline.stop()
+
+    assert not profiler.unfinished
+    assert Pipeline.item_hook is None
+    text = profiler.stats(limit=10)
+    assert "_busy_handler" in text and "===== P-busy-0 =====" in text
+
+
+def test_deterministic_unfinished():
+    release = Event()
+    fetcher = IndexFetcher(0, 9, 1)
+
+    @fetcher.handlers.add
+    def stuck(i):
+        # 剖析开始后的下一次探测开启剖析，随后一直卡住
+        while i == 0 and IndexJob.probe_hook is None:
+            time.sleep(0.001)
+        if i == 1:
+            release.wait()
+
+    fetcher.start()
+    try:
+        profiler = DeterministicProfiler().run(0.05, grace=0.05)
+    finally:
+        release.set()
+        fetcher.join()
+        fetcher.stop()
+
+    # 卡住的线程没有提交结果，钩子仍然被卸载
+    assert profiler.unfinished == [fetcher.jobs[0].thread.name]
+    assert IndexJob.probe_hook is None and Pipeline.item_hook is None
+
+def test_busy():
+    thread = Thread(target=SamplingProfiler(dict).run, args=(0.2,))
+    thread.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(ProfilerBusyError):
+            DeterministicProfiler().run(0.1)
+    finally:
+        thread.join()
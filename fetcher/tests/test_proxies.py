@@ -0,0 +1,102 @@
+#!/usr/env python3
+import pytest
+
+from loadtest.mock_api import DensityMap, MockApiConfig, MockApiServer
+from src.exceptions import ExplicitlyRetryHandlingError, UserNotFoundError
+from src.proxies import ProxyOutcome, ProxyPool
+from src.scraper import UserInfoScraper
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_prefer_fast_and_successful():
+    pool = ProxyPool(["http://a", "http://b", "http://c"], seed=0)
+    a, b, c = pool.proxies
+    for proxy, latency in ((a, 0.1), (b, 0.5), (c, 0.5)):
+        pool.report(proxy, ProxyOutcome.success, latency)
+    for _ in range(5):
+        pool.report(c, ProxyOutcome.failure, 0.5)
+
+    chosen = [pool.choose() for _ in range(300)]
+    # 随机取两个比较：最好的代理只要被取到就会被选中，最差的代理只会在与自己比较时被选中（不会出现）
+    assert chosen.count(a) > chosen.count(b) > chosen.count(c) == 0
+
+
+def test_cooldown():
+    clock = _Clock()
+    pool = ProxyPool(["http://a", "http://b"], cooldown=10, max_cooldown=25, clock=clock)
+    a, b = pool.proxies
+
+    pool.report(a, ProxyOutcome.throttled)
+    assert all(pool.choose() is b for _ in range(10))
+    # 冷却期间返回的限流不再延长冷却
+    pool.report(a, ProxyOutcome.throttled)
+    assert pool.stats()["http://a"]["cooldown"] == 10 and a.cooldowns == 1
+
+    # 连续被限流时冷却时间加倍，不超过 max_cooldown
+    clock.now += 10
+    pool.report(a, ProxyOutcome.throttled)
+    assert pool.stats()["http://a"]["cooldown"] == 25
+
+    # 所有代理都在冷却中时选择最早结束冷却的一个
+    pool.report(b, ProxyOutcome.throttled)
+    assert pool.choose() is b
+
+    # 成功一次即恢复
+    clock.now += 25
+    pool.report(a, ProxyOutcome.success, 0.1)
+    assert a.consecutive_throttles == 0
+
+
+def test_throughput():
+    clock = _Clock()
+    pool = ProxyPool(["http://a"], throughput_window=10, clock=clock)
+    a = pool.proxies[0]
+    for _ in range(20):
+        pool.report(a, ProxyOutcome.success)
+        clock.now += 0.5
+    # 只统计最近 10 秒（第 1001 至 1010 秒）内的成功次数
+    assert pool.stats()["http://a"]["throughput"] == pytest.approx(1.8)
+    clock.now += 5
+    assert pool.stats()["http://a"]["throughput"] == pytest.approx(0.8)
+    clock.now += 10
+    stats = pool.stats()["http://a"]
+    assert stats["throughput"] == 0 and stats["successes"] == 20
+
+
+def test_no_proxies():
+    with pytest.raises(ValueError):
+        ProxyPool([])
+
+
+def test_scraper_with_stand_in_proxies():
+    # 替身 API 按 proxy 参数模拟被上游限流的代理
+    config = MockApiConfig(density_map=DensityMap([(0, 99, 1.0)]), payload_size=10,
+                           proxy_throttle_rates={"http://throttled": 1.0})
+    server = MockApiServer(config).start()
+    pool = ProxyPool(["http://throttled", "http://good"], cooldown=60, seed=0)
+    scraper = UserInfoScraper(server.url, lambda i, data: None, proxies=pool)
+    try:
+        outcomes = []
+        for i in range(20):
+            try:
+                scraper.parse(scraper.fetch(i))
+                outcomes.append("valid")
+            except (ExplicitlyRetryHandlingError, UserNotFoundError):
+                outcomes.append("retry")
+    finally:
+        scraper.close()
+        server.stop()
+
+    # 被限流的代理进入冷却后，之后的请求都经由另一个代理
+    assert outcomes.count("retry") == 1
+    assert server.proxy_counts == {"http://throttled": 1, "http://good": 19}
+    stats = pool.stats()
+    assert stats["http://throttled"]["throttles"] == 1 and stats["http://throttled"]["cooldown"] > 0
+    assert stats["http://good"]["successes"] == 19
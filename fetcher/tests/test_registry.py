@@ -0,0 +1,71 @@
+#!/usr/env python3
+import math
+
+import pytest
+
+from src.registry import IntervalSet, RangeRegistry
+
+
+@pytest.mark.parametrize("intervals, expected", [
+    ([(1, 5), (10, 20)], [(1, 5), (10, 20)]),
+    ([(1, 5), (6, 9)], [(1, 9)]),
+    ([(10, 20), (1, 5), (4, 12)], [(1, 20)]),
+    ([(10, math.inf), (1, 5), (30, 40)], [(1, 5), (10, math.inf)]),
+])
+def test_interval_set_add(intervals, expected):
+    assert list(IntervalSet(intervals)) == expected
+
+
+def test_interval_set_remove_and_gaps():
+    intervals = IntervalSet([(1, 100)])
+    intervals.remove(10, 19)
+    intervals.remove(50, math.inf)
+    assert list(intervals) == [(1, 9), (20, 49)]
+    assert intervals.overlapping(5, 25) == [(5, 9), (20, 25)]
+    assert intervals.gaps(0, 60) == [(0, 0), (10, 19), (50, 60)]
+    assert IntervalSet([(5, math.inf)]).gaps(0, math.inf) == [(0, 4)]
+    assert IntervalSet().gaps(3, math.inf) == [(3, math.inf)]
+
+
+def test_range_registry():
+    registry = RangeRegistry()
+    assert registry.claim("a", 0, 99) == [(0, 99)]
+    # 与已认领的区间重叠的部分被裁剪
+    assert registry.claim("b", 50, 199) == [(100, 199)]
+    assert registry.claim("c", 20, 80) == []
+
+    # a 处理到 59 时被删除，未处理的部分重新变为可认领
+    registry.release("a", [(60, 99)])
+    assert registry.claim("c", 0, 120) == [(60, 99)]
+    registry.settle("b", [(150, 199)])
+
+    result = registry.query(0, 300)
+    assert result["claimed"] == {"b": [[100, 199]], "c": [[60, 99]]}
+    assert result["completed"] == [[0, 59], [100, 149]]
+    assert result["uncovered"] == [[200, 300]]
+    assert registry.query()["uncovered"] == [[200, None]]
+
+    registry.discard("c")
+    restored = RangeRegistry.from_json(registry.to_json())
+    assert restored.to_json() == registry.to_json()
+    assert restored.claim("d", 0, math.inf) == [(60, 99), (200, math.inf)]
+
+
+def test_range_registry_retries():
+    registry = RangeRegistry()
+    registry.claim("a", 0, 99)
+    # 10 仍在等待重试，20 的重试次数耗尽
+    registry.settle("a", [(10, 10), (90, 99)], [(20, 20)])
+    result = registry.query(0, 99)
+    assert result["completed"] == [[0, 9], [11, 19], [21, 89]]
+    assert result["failed"] == [[20, 20]]
+
+    # 之后的结算不会把失败的索引计入已完成
+    registry.settle("a", [])
+    assert registry.query(0, 99)["completed"] == [[0, 19], [21, 99]]
+
+    # 释放后失败的索引重新变为可认领
+    registry.release("a", [])
+    restored = RangeRegistry.from_json(registry.to_json())
+    assert restored.claim("b", 0, 99) == [(20, 20)]
+    assert restored.query(0, 99)["failed"] == []
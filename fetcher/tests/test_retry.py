@@ -0,0 +1,88 @@
+#!/usr/env python3
+import pytest
+
+from src.exceptions import ExplicitlyRetryHandlingError
+from src.fetcher import IndexFetcher
+from src.job import IndexJob
+from src.retry import RetryQueue
+
+
+def _flaky(invalid_values, flaky_values, fail_times=1):
+    failures = {}
+
+    def handler(i):
+        if i in flaky_values and failures.get(i, 0) < fail_times:
+            failures[i] = failures.get(i, 0) + 1
+            raise ExplicitlyRetryHandlingError(i)
+        if i in invalid_values:
+            raise ValueError
+
+    return handler
+
+
+@pytest.mark.parametrize("begin, end, step, invalid_values, flaky_values", [
+    (1, 10, 1, [], [3]),
+    (1, 10, 1, [2, 3], [4]),
+    (1, 10, 1, [2, 3], [4, 6]),
+    (10, 1, -1, [8, 9], [7, 5]),
+])
+def test_retry_merge(begin, end, step, invalid_values, flaky_values):
+    retry_queue = RetryQueue(base_delay=0.01, max_delay=0.05)
+    job = IndexJob(begin, end, step, retry_queue=retry_queue)
+    retried = []
+    job.emitter.on("IndexJob.retried", lambda sender, i: retried.append(i))
+
+    retry_queue.start()
+    try:
+        with job.list(_flaky(invalid_values, flaky_values)) as result:
+            expected = set(range(begin, end + step, step)) - set(invalid_values)
+            assert set(result) == expected
+    finally:
+        retry_queue.stop()
+
+    assert set(retried) <= set(flaky_values)
+
+
+def test_retry_exhausted():
+    retry_queue = RetryQueue(max_attempts=2, base_delay=0.01, max_delay=0.05)
+    job = IndexJob(1, 5, 1, retry_queue=retry_queue)
+    exhausted = []
+    job.emitter.on("IndexJob.retry_exhausted", lambda sender, i, err_info: exhausted.append(i))
+
+    retry_queue.start()
+    try:
+        with job.list(_flaky([], [3], fail_times=10)) as result:
+            assert result == [1, 2, 4, 5]
+    finally:
+        retry_queue.stop()
+
+    assert exhausted == [3]
+    assert job.failed_retries == [3] and job.pending_retries == []
+
+
+def test_retry_without_queue():
+    job = IndexJob(1, 5, 1)
+    with job.list(_flaky([], [2], fail_times=10)) as result:
+        # 没有重试队列时，暂时性错误等同于跳过
+        assert set(result) == {1, 3, 4, 5}
+
+
+def test_fetcher_retry_queue():
+    fetcher = IndexFetcher(0, 99, 1, thread_weights=[1, 1],
+                           retry_queue=RetryQueue(base_delay=0.01, max_delay=0.05))
+    handled = []
+    fetcher.handlers.add(_flaky([], [10, 60]))
+    fetcher.handlers.add(lambda i: handled.append(i))
+
+    fetcher.start()
+    fetcher.join()
+    fetcher.stop()
+
+    assert sorted(handled) == list(range(100))
+
+
+def test_delay():
+    retry_queue = RetryQueue(base_delay=1, max_delay=8, jitter=0)
+    assert [retry_queue.delay(attempt) for attempt in range(5)] == [1, 2, 4, 8, 8]
+    with pytest.raises(ValueError):
+        RetryQueue(workers=0)
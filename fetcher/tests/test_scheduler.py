@@ -0,0 +1,153 @@
+#!/usr/env python3
+import time
+from threading import Event, Lock
+
+import pytest
+
+from src.fetcher import IndexFetcher
+from src.scheduler import FairScheduler, JobPool
+
+
+def test_weighted_fair_queuing():
+    scheduler = FairScheduler(1)
+    holder = scheduler.register("holder")
+    urgent = scheduler.register("urgent", 3)
+    background = scheduler.register("background", 1)
+
+    assert holder.acquire().done()
+    grants = []
+    for share in (urgent, background) * 8:
+        future = share.acquire()
+        future.add_done_callback(lambda _, name=share.name: grants.append(name))
+    assert not grants and scheduler.stats()["shares"]["urgent"]["waiting"] == 8
+
+    holder.release()
+    for _ in range(7):
+        (urgent if grants[-1] == "urgent" else background).release()
+    # 按权重 3:1 分配，权重低的也不会被饿死
+    assert grants.count("urgent") == 6 and grants.count("background") == 2
+    assert scheduler.in_flight == 1
+
+
+def test_canceled_waiter():
+    scheduler = FairScheduler(1)
+    share = scheduler.register("share")
+    assert share.acquire().done()
+    canceled = share.acquire()
+    waiting = share.acquire()
+    assert canceled.cancel()
+
+    share.release()
+    assert waiting.done() and scheduler.in_flight == 1
+    share.release()
+    assert scheduler.in_flight == 0
+
+    with pytest.raises(ValueError):
+        scheduler.register("invalid", 0)
+
+
+def test_shared_budget():
+    scheduler = FairScheduler(2)
+    lock = Lock()
+    in_flight = [0, 0]
+    handled = []
+
+    def handler(i):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(0.002)
+        with lock:
+            in_flight[0] -= 1
+            handled.append(i)
+
+    fetchers = [IndexFetcher(0, 49, 1, name="scan", thread_weights=[1, 1], scheduler=scheduler),
+                IndexFetcher(100, 149, 1, name="refresh", thread_weights=[1, 1, 1], scheduler=scheduler, priority=2)]
+    for fetcher in fetchers:
+        fetcher.handlers.add(handler)
+        fetcher.start()
+    fetchers[0].priority = 3
+    shares = scheduler.stats()["shares"]
+    assert shares["scan"]["weight"] == 3 and shares["refresh"]["weight"] == 2
+    for fetcher in fetchers:
+        fetcher.join()
+        fetcher.stop()
+
+    assert in_flight[1] <= 2
+    assert sorted(handled) == [*range(50), *range(100, 150)]
+    assert scheduler.in_flight == 0 and not scheduler.stats()["shares"]
+
+
+def test_job_pool_limit():
+    pool = JobPool()
+    lane = pool.register("lane", 2)
+    release = Event()
+    futures = [lane.submit(release.wait) for _ in range(4)]
+    # 超出 limit 的作业排队，排队中的作业可以取消
+    assert pool.running == 2 and lane.queued == 2 and lane.idle == 0
+    assert futures[3].cancel()
+
+    # 调低 limit 后运行中的作业照常运行，结束前不会开始新的作业
+    lane.limit = 1
+    release.set()
+    for future in futures[:3]:
+        assert future.result(timeout=1) is True
+    assert futures[3].cancelled()
+    assert pool.running == 0 and lane.queued == 0 and lane.idle == 1
+
+    with pytest.raises(ValueError):
+        lane.limit = 0
+    lane.close()
+    assert not pool.stats()["lanes"]
+
+
+def test_shared_job_pool():
+    pool = JobPool(2)
+    lock = Lock()
+    running = []
+    peak = []
+    handled = {"a": [], "b": []}
+    b_done = Event()
+
+    def on_running(sender):
+        with lock:
+            running.append(sender)
+            peak.append(len(running))
+
+    def on_stopped(sender, err_info):
+        with lock:
+            running.remove(sender)
+
+    def handler(name):
+        def handle(i):
+            if name == "a" and not b_done.is_set():
+                time.sleep(0.001)
+            with lock:
+                handled[name].append(i)
+
+        return handle
+
+    a = IndexFetcher(0, 9999, 1, name="a", thread_weights=[1, 1], pool=pool)
+    b = IndexFetcher(20000, 20099, 1, name="b", thread_weights=[1, 1], pool=pool)
+    for fetcher in (a, b):
+        fetcher.emitter.on("IndexJob.running", on_running)
+        fetcher.emitter.on("IndexJob.stopped", on_stopped)
+        fetcher.handlers.add(handler(fetcher.name))
+    a.start()
+    while not handled["a"]:
+        time.sleep(0.001)
+
+    # a 的作业占满了两个线程，b 启动后 a 让出一个线程，b 不必等 a 的作业全部结束
+    b.start()
+    b.join(timeout=5)
+    b_done.set()
+    assert sorted(handled["b"]) == list(range(20000, 20100))
+    assert len(handled["a"]) < 10000 and pool.stats()["lanes"]["a"]["preempted"] >= 1
+    a.join()
+    for fetcher in (a, b):
+        fetcher.stop()
+
+    # 线程总数始终不超过作业池的上限，让出线程的作业被截下的区间没有遗漏，也没有重复
+    assert max(peak) <= 2
+    assert sorted(handled["a"]) == list(range(10000))
+    assert pool.running == 0 and not pool.stats()["lanes"]
@@ -0,0 +1,154 @@
+#!/usr/env python3
+import json
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src.backends import BackendPool
+from src.exceptions import ExplicitlyRetryHandlingError
+from src.latency import LatencyWindow
+from src.scraper import UserInfoScraper
+
+
+def test_cancel():
+    # 只接受连接、从不响应的服务器
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    connections = []
+    Thread(target=lambda: connections.append(server.accept()), daemon=True).start()
+    url = "http://127.0.0.1:%d/user/detail" % server.getsockname()[1]
+
+    scraper = UserInfoScraper(url, lambda i, data: None, timeout=None)
+    errors = []
+
+    def fetch():
+        with pytest.raises(ExplicitlyRetryHandlingError) as e:
+            scraper.fetch(1)
+        errors.append(e.value)
+
+    thread = Thread(target=fetch)
+    thread.start()
+    try:
+        while not connections:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        begin = time.monotonic()
+        scraper.cancel()
+        thread.join(1)
+        assert not thread.is_alive() and time.monotonic() - begin < 0.5
+        assert errors
+    finally:
+        server.close()
+
+
+class _SlowFirstHandler(BaseHTTPRequestHandler):
+    # 每个用户 ID 的第一个请求延迟 slow 秒，之后的请求立即返回
+    seen = set()
+    slow = 2.0
+
+    def do_GET(self):
+        uid = parse_qs(urlparse(self.path).query)["uid"][0]
+        if uid not in self.seen:
+            self.seen.add(uid)
+            time.sleep(self.slow)
+        body = json.dumps({"code": 200, "uid": uid}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端超时断开后，写回响应时的 BrokenPipeError 是预期的
+        pass
+
+
+@pytest.fixture
+def slow_first_server():
+    _SlowFirstHandler.seen = set()
+    _SlowFirstHandler.slow = 2.0
+    server = _QuietServer(("127.0.0.1", 0), _SlowFirstHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:%d/user/detail" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_adaptive_timeout(slow_first_server):
+    scraper = UserInfoScraper(slow_first_server, lambda i, data: None, timeout=(1, 30), timeout_multiplier=3,
+                              min_timeout=0.1, min_samples=10)
+    # 样本不足时使用固定的超时
+    assert scraper.current_timeout() == (1, 30)
+    for _ in range(20):
+        scraper.latency.add(0.01)
+    assert scraper.current_timeout() == (1, 0.1)
+
+    begin = time.monotonic()
+    with pytest.raises(ExplicitlyRetryHandlingError):
+        scraper.fetch(1)
+    assert time.monotonic() - begin < 1
+    # 超时的请求以超时时间计入样本
+    assert len(scraper.latency) == 21 and scraper.latency.quantile(1) == 0.1
+
+
+def test_hedged_request(slow_first_server):
+    scraper = UserInfoScraper(slow_first_server, lambda i, data: None, hedge_quantile=0.95, min_samples=10)
+    for _ in range(20):
+        scraper.latency.add(0.05)
+    try:
+        begin = time.monotonic()
+        i, r = scraper.fetch(7)
+        # 第一个请求被拖住，对冲请求先返回
+        assert time.monotonic() - begin < 1
+        assert i == 7 and r.json()["uid"] == "7"
+        assert scraper.stats()["hedged"] == scraper.stats()["hedgeWins"] == 1
+    finally:
+        scraper.close()
+
+
+def test_latency_window():
+    window = LatencyWindow(size=100, refresh=10)
+    assert window.quantile(0.5) is None
+    for latency in range(1, 201):
+        window.add(latency / 1000)
+    assert len(window) == 100
+    assert window.quantile(0) == 0.101 and window.quantile(0.99) == 0.2
+
+
+def test_backend_pool(slow_first_server):
+    # 没有监听的端口
+    dead = socket.socket()
+    dead.bind(("127.0.0.1", 0))
+    dead_url = "http://127.0.0.1:%d/user/detail" % dead.getsockname()[1]
+    dead.close()
+
+    pool = BackendPool([dead_url, slow_first_server], eject_after=1)
+    _SlowFirstHandler.slow = 0
+    scraper = UserInfoScraper("", lambda i, data: None, backends=pool)
+    with pytest.raises(ExplicitlyRetryHandlingError):
+        scraper.fetch(1)
+    # 失败的后端被摘除，之后的请求都发往健康的后端
+    for i in range(2, 5):
+        assert scraper.fetch(i)[1].status_code == 200
+    stats = pool.stats()
+    assert not stats[dead_url]["healthy"] and stats[slow_first_server]["requests"] == 3
+
+
+def test_raw_body(slow_first_server):
+    _SlowFirstHandler.slow = 0
+    stored = []
+    scraper = UserInfoScraper(slow_first_server, lambda i, data: stored.append((i, data)), raw=True)
+    scraper.save(scraper.parse(scraper.fetch(3)))
+    # 校验过的响应体原样交给存储
+    assert stored == [(3, b'{"code": 200, "uid": "3"}')]
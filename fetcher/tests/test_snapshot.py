@@ -0,0 +1,73 @@
+#!/usr/env python3
+import asyncio
+import json
+from datetime import timedelta
+from threading import Thread
+
+import pytest
+
+from src.snapshot import SnapshotPublisher, etag_matches, merge_patch
+
+
+@pytest.mark.parametrize("old, new, patch", [
+    ({"a": 1, "b": 2}, {"a": 1, "b": 3}, {"b": 3}),
+    ({"a": 1, "b": 2}, {"a": 1}, {"b": None}),
+    ({"a": {"x": 1, "y": 2}}, {"a": {"x": 1, "y": 3}, "c": [1]}, {"a": {"y": 3}, "c": [1]}),
+    ({"a": [1, 2]}, {"a": [1, 3]}, {"a": [1, 3]}),
+    ({"a": 1}, {"a": 1}, {}),
+])
+def test_merge_patch(old, new, patch):
+    assert merge_patch(old, new) == patch
+
+
+def test_etag_matches():
+    assert etag_matches('"1-ab"', '"1-ab"')
+    assert etag_matches('W/"1-ab"', '"1-ab"')
+    assert etag_matches('"0-cd", "1-ab"', '"1-ab"')
+    assert etag_matches("*", '"1-ab"')
+    assert not etag_matches(None, '"1-ab"')
+    assert not etag_matches('"2-ab"', '"1-ab"')
+
+
+def test_publish():
+    publisher = SnapshotPublisher()
+    published = []
+    publisher.subscribe(published.append)
+
+    first = publisher.publish({"age": timedelta(seconds=1), "jobs": {"a": 0.1}})
+    assert first.version == 1 and first.patch is None
+    assert json.loads(first.body) == {"age": 1.0, "jobs": {"a": 0.1}}
+
+    # 内容未变化时不产生新的版本
+    assert publisher.publish({"age": timedelta(seconds=1), "jobs": {"a": 0.1}}) is first
+
+    second = publisher.publish({"age": timedelta(seconds=2), "jobs": {"a": 0.1}})
+    assert second.version == 2 and second.etag != first.etag
+    assert json.loads(second.patch) == {"age": 2.0}
+    assert published == [first, second]
+
+
+def test_subscription():
+    publisher = SnapshotPublisher()
+    publisher.publish({"v": 0})
+
+    async def receive():
+        messages = []
+        with publisher.subscription() as subscription:
+            # 订阅后先收到完整快照
+            messages.append(await subscription.next(timeout=1))
+            Thread(target=lambda: publisher.publish({"v": 1})).start()
+            messages.append(await subscription.next(timeout=1))
+            # 落后不止一个版本时收到完整快照
+            publisher.publish({"v": 2})
+            publisher.publish({"v": 3})
+            messages.append(await subscription.next(timeout=1))
+            messages.append(await subscription.next(timeout=0.05))
+        assert publisher.subscriber_count == 0
+        return messages
+
+    messages = asyncio.run(receive())
+    assert [(kind, snapshot.version) for kind, snapshot in messages[:3]] == [("snapshot", 1), ("patch", 2),
+                                                                            ("snapshot", 4)]
+    assert json.loads(messages[1][1].patch) == {"v": 1}
+    assert messages[3] is None
@@ -0,0 +1,39 @@
+#!/usr/env python3
+from copy import copy
+
+import pytest
+
+from src.span import Span, StepSpan, WorkSpan
+
+
+def test_slots():
+    for span in (Span(1, 2), StepSpan(1, 2, 1), WorkSpan(1, 2, 1)):
+        assert not hasattr(span, "__dict__")
+
+
+def test_equality():
+    assert Span(1, 2) == Span(1, 2)
+    assert Span(1, 2) != StepSpan(1, 2, 1)
+    assert StepSpan(1, 2, 1) == copy(StepSpan(1, 2, 1))
+    assert WorkSpan(1, 10, 1) == WorkSpan(1, 10, 1)
+
+    span = WorkSpan(1, 10, 1)
+    span._update_worked_span(3)
+    assert span != WorkSpan(1, 10, 1)
+
+
+@pytest.mark.parametrize("begin, end, step, indexes, worked_span", [
+    (1, 10, 1, [1, 2, 3], Span(1, 3)),
+    (1, 10, 1, [1, 5, 3, 2], Span(1, 5)),
+    (10, 1, -1, [10, 9, 6, 7], Span(10, 6)),
+])
+def test_worked_span(begin, end, step, indexes, worked_span):
+    span = WorkSpan(begin, end, step)
+    assert span.worked_span is None and span.processed == 0
+    for i in indexes:
+        span._update_worked_span(i)
+    assert span.worked_span == worked_span
+    assert span.processed == len(worked_span) / len(span)
+
+    with pytest.raises(IndexError):
+        span._update_worked_span(end + step)
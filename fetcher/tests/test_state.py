@@ -0,0 +1,137 @@
+#!/usr/env python3
+import time
+from threading import Event, Lock
+
+from src.exceptions import ExplicitlyRetryHandlingError, ExplicitlySkipHandlingError
+from src.fetcher import IndexFetcher
+from src.registry import RangeRegistry
+from src.retry import RetryQueue
+from src.state import FetcherStore, fetcher_record, pending_retries, remaining_spans
+
+
+def test_resume(tmp_path):
+    handled = []
+    lock = Lock()
+    halfway = Event()
+    fetcher = IndexFetcher(0, 999, 1, name="Fetcher-0", thread_weights=[1, 1])
+
+    @fetcher.handlers.add
+    def handler(i):
+        with lock:
+            handled.append(i)
+            if len(handled) >= 300:
+                halfway.set()
+        time.sleep(0.0005)
+
+    store = FetcherStore(tmp_path / "fetchers.json", lambda: [fetcher_record(fetcher, {"queue_size": 10})])
+    fetcher.start()
+    halfway.wait()
+    fetcher.stop()
+    store.save()
+
+    record, = store.load()
+    assert record["state"] == "stopped" and record["profile"] == {"queue_size": 10}
+    assert record["name"] == "Fetcher-0" and record["weights"] == [0.5, 0.5]
+
+    # 从保存的进度恢复，不会遗漏任何索引，重复处理的只有停止时各作业正在处理的索引
+    resumed = IndexFetcher(record["begin"], record["end"], record["step"], thread_weights=record["weights"])
+    resumed.handlers = fetcher.handlers
+    resumed.restore(remaining_spans(record))
+    resumed.start()
+    resumed.join()
+    assert set(handled) == set(range(1000))
+    assert len(handled) - 1000 <= 2
+    assert resumed.remaining_spans() == []
+
+
+def test_resume_pending_retry(tmp_path):
+    handled = []
+    scanned = Event()
+    restored = Event()
+
+    def handler(i):
+        if i == 5 and not restored.is_set():
+            raise ExplicitlyRetryHandlingError(i)
+        handled.append(i)
+        if i == 99:
+            scanned.set()
+
+    # 重试前的等待远长于测试时间，停止时索引 5 仍在重试队列中
+    fetcher = IndexFetcher(0, 99, 1, retry_queue=RetryQueue(base_delay=60, max_delay=60, jitter=0))
+    fetcher.handlers.add(handler)
+    store = FetcherStore(tmp_path / "fetchers.json", lambda: [fetcher_record(fetcher)])
+    fetcher.start()
+    scanned.wait()
+    fetcher.stop()
+    fetcher.retry_queue.stop()
+    store.save()
+
+    record, = store.load()
+    assert 5 not in handled
+    assert pending_retries(record) == [5]
+
+    restored.set()
+    resumed = IndexFetcher(record["begin"], record["end"], record["step"])
+    resumed.handlers.add(handler)
+    resumed.restore(remaining_spans(record), pending_retries(record))
+    assert resumed.pending_retries() == [5]
+    resumed.start()
+    resumed.join()
+    assert 5 in handled
+    assert resumed.remaining_spans() == [] and resumed.pending_retries() == []
+
+
+def test_resume_leap_deferred_retry(tmp_path):
+    valid = {*range(0, 10), *range(22, 31), *range(50, 61)}
+    handled = []
+    scanned = Event()
+    restored = Event()
+
+    def handler(i):
+        if i == 24 and not restored.is_set():
+            raise ExplicitlyRetryHandlingError(i)
+        if i not in valid:
+            raise ExplicitlySkipHandlingError(i)
+        handled.append(i)
+        if i == 60:
+            scanned.set()
+
+    # 从 10 开始的跃进依次经过 11、12、14、16、20、24，24 被推迟重试，暂视为无效，其两侧的有效区域被跳过
+    fetcher = IndexFetcher(0, 99, 1, retry_queue=RetryQueue(base_delay=60, max_delay=60, jitter=0))
+    fetcher.handlers.add(handler)
+    store = FetcherStore(tmp_path / "fetchers.json", lambda: [fetcher_record(fetcher)])
+    fetcher.start()
+    scanned.wait()
+    fetcher.stop()
+    fetcher.retry_queue.stop()
+    store.save()
+
+    record, = store.load()
+    assert not {22, 23, 24} & set(handled)
+    # 恢复点退回到该跃进的起点
+    assert remaining_spans(record)[0].begin == 10
+
+    restored.set()
+    handled.clear()
+    resumed = IndexFetcher(record["begin"], record["end"], record["step"])
+    resumed.handlers.add(handler)
+    resumed.restore(remaining_spans(record), pending_retries(record))
+    resumed.start()
+    resumed.join()
+    assert set(range(22, 31)) <= set(handled)
+
+def test_infinite_end():
+    record = {"step": 1, "remaining": [[5, None]]}
+    assert remaining_spans(record)[0].end == float("inf")
+
+
+def test_registry(tmp_path):
+    registry = RangeRegistry()
+    registry.claim("Fetcher-0", 0, 99)
+    registry.settle("Fetcher-0", [(50, 99)])
+    store = FetcherStore(tmp_path / "fetchers.json", lambda: [], registry=registry)
+    assert store.load_registry().to_json() == RangeRegistry().to_json()
+
+    store.save()
+    assert store.load() == []
+    assert store.load_registry().to_json() == registry.to_json()
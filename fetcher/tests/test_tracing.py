@@ -0,0 +1,73 @@
+#!/usr/env python3
+import json
+
+import pytest
+
+from src.job import IndexJob
+from src.pipeline import Pipeline
+from src.tracing import Tracer, ZipkinFileExporter, span
+
+
+class ListExporter(object):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, trace_span):
+        self.spans.append(trace_span.to_zipkin())
+
+
+def test_probe_spans():
+    exporter = ListExporter()
+
+    def fetch(i):
+        with span("http.request"):
+            return i
+
+    pipeline = Pipeline().add_stage("fetch", fetch).add_stage("parse", lambda i: i, outcome=True)
+    pipeline.start()
+    try:
+        job = IndexJob(1, 3, 1, tracer=Tracer(exporter, sample_rate=1))
+        job.handlers.add(pipeline.as_handler())
+        job.run()
+    finally:
+        pipeline.stop()
+
+    roots = [s for s in exporter.spans if s["name"] == "IndexJob.handle"]
+    assert sorted(int(s["tags"]["uid"]) for s in roots) == [1, 2, 3]
+    by_id = {s["id"]: s for s in exporter.spans}
+    for s in exporter.spans:
+        if s["name"] == "http.request":
+            # http.request -> pipeline:fetch -> handler:pipeline_handler -> IndexJob.handle
+            parent = by_id[s["parentId"]]
+            assert parent["name"] == "pipeline:fetch"
+            handler = by_id[parent["parentId"]]
+            assert handler["name"] == "handler:pipeline_handler"
+            assert by_id[handler["parentId"]]["name"] == "IndexJob.handle"
+            assert s["traceId"] == handler["traceId"]
+    assert len([s for s in exporter.spans if s["name"] == "http.request"]) == 3
+
+
+def test_sample_rate():
+    exporter = ListExporter()
+    job = IndexJob(1, 100, 1, tracer=Tracer(exporter, sample_rate=0))
+    job.handlers.add(lambda i: None)
+    job.run()
+    assert exporter.spans == []
+
+    with pytest.raises(ValueError):
+        Tracer(exporter, sample_rate=2)
+
+
+def test_zipkin_file_exporter(tmp_path):
+    path = tmp_path / "traces" / "traces.jsonl"
+    exporter = ZipkinFileExporter(path, max_bytes=1024, backup_count=2)
+    tracer = Tracer(exporter, sample_rate=1)
+    for i in range(20):
+        with tracer.trace("probe", uid=i):
+            with span("child"):
+                pass
+    exporter.close()
+
+    lines = path.read_text().splitlines()
+    assert lines and all(json.loads(line)["localEndpoint"]["serviceName"] == "nmdm-fetcher" for line in lines)
+    assert len(list(path.parent.iterdir())) == 3
@@ -0,0 +1,90 @@
+#!/usr/env python3
+import time
+
+import pytest
+
+from src.wal import WalReplayer, WriteAheadLog
+
+
+def _record(i):
+    return {"c": "user_info", "f": {"userPoint.userId": i}, "u": {"$set": {"code": 200, "uid": i}}}
+
+
+def test_replay_and_truncate(tmp_path):
+    wal = WriteAheadLog(tmp_path, segment_size=256)
+    for i in range(100):
+        wal.append(_record(i))
+    assert wal.segment_count > 1
+
+    written = []
+    replayer = WalReplayer(wal, written.extend, batch_size=7)
+    while replayer.replay_once():
+        pass
+
+    assert [record["f"]["userPoint.userId"] for record in written] == list(range(100))
+    assert wal.pending_bytes == 0
+    # 只保留正在写入的分段
+    assert wal.segment_count == 1
+    wal.close()
+
+
+def test_append_raw(tmp_path):
+    wal = WriteAheadLog(tmp_path)
+    body = '{"code": 200, "nickname": "云村"}'.encode("utf-8")
+    wal.append_raw(b'{"c":"user_info","f":{"userPoint.userId":%d},"u":{"$set":%s}}' % (1, body))
+    wal.append(_record(2))
+    records, _ = wal.read(10)
+    assert records[0]["u"]["$set"] == {"code": 200, "nickname": "云村"}
+    assert records[1] == _record(2)
+    wal.close()
+
+
+def test_resume_from_checkpoint(tmp_path):
+    wal = WriteAheadLog(tmp_path, segment_size=256)
+    for i in range(10):
+        wal.append(_record(i))
+    records, position = wal.read(4)
+    wal.ack(position)
+    wal.close()
+
+    # 模拟在遗留分段末尾写入了不完整的记录
+    last_segment = sorted(tmp_path.glob("*.wal"))[-1]
+    with open(last_segment, "ab") as fp:
+        fp.write(b"\x10\x00")
+
+    wal = WriteAheadLog(tmp_path, segment_size=256)
+    wal.append(_record(10))
+    records, position = wal.read(100)
+    assert [record["f"]["userPoint.userId"] for record in records] == list(range(4, 11))
+    wal.close()
+
+
+def test_outage_and_backpressure(tmp_path):
+    wal = WriteAheadLog(tmp_path, max_pending_bytes=1024)
+    available = False
+    written = []
+
+    def sink(records):
+        if not available:
+            raise ConnectionError("database is restarting")
+        written.extend(records)
+
+    replayer = WalReplayer(wal, sink, batch_size=5, max_backoff=0.05)
+    replayer.start()
+    try:
+        count = 0
+        with pytest.raises(TimeoutError):
+            while True:
+                wal.append(_record(count), timeout=0.2)
+                count += 1
+        assert count > 0 and not written
+        assert isinstance(replayer.last_exception, ConnectionError)
+
+        available = True
+        deadline = time.monotonic() + 5
+        while wal.pending_bytes and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [record["f"]["userPoint.userId"] for record in written] == list(range(count))
+    finally:
+        replayer.stop(timeout=1)
+        wal.close()